@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.db import models
+from django.db.models.expressions import RawSQL
 from .models import Author, Category, Content, Type, Tag
 from django.utils.html import format_html
 from .models import UploadedImage
+from .utils.search import get_match_query, get_matching_ids_sql
 from django import forms
 
 
@@ -24,7 +26,7 @@ class CategoryAdmin(admin.ModelAdmin):
 class ContentAdmin(admin.ModelAdmin):
     list_display = ('title', 'type', 'get_categories', 'get_tags', 'published_at', 'updated_at', 'publish')  # Show these fields in the list view
     list_filter = ('categories', 'published_at', 'publish')  # Add filters for category and date
-    search_fields = ('title', 'body')  # Enable search functionality
+    search_fields = ('title',)  # Searches go through the full-text index, see get_search_results()
     ordering = ('-published_at',)  # Show newest first
     # Allow multiple tag selections without overwriting
     filter_horizontal = ('tags', 'categories',)  # Makes tag selection easier in admin panel
@@ -42,6 +44,17 @@ class ContentAdmin(admin.ModelAdmin):
     get_categories.short_description = "Categories"
     get_tags.short_description = 'Tags'  # Custom column name
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Matches the search against the full-text index (horizon.utils.search), published or not,
+        instead of scanning every body.
+        """
+        if not search_term.strip():
+            return queryset, False
+        if not get_match_query(search_term):
+            return queryset.none(), False
+        return queryset.filter(pk__in=RawSQL(*get_matching_ids_sql(search_term))), False
+
     formfield_overrides = {
         models.TextField: {'widget': admin.widgets.AdminTextareaWidget(attrs={'rows': 50, 'style': 'width: 100%;'})},
         models.JSONField: {'widget': forms.Textarea(attrs={'rows': 5, 'cols': 120, 'style': 'width: 100%;'})},
@@ -52,6 +65,7 @@ class AuthorAdmin(admin.ModelAdmin):
     list_display = ("full_name", "title", "profile_image_preview")
     search_fields = ("first_name", "middle_name", "last_name", "title")
     list_filter = ("title",)
+    readonly_fields = ("html_description",)
     
     def full_name(self, obj):
         """Display full name in the admin panel"""
@@ -70,8 +84,21 @@ class AuthorAdmin(admin.ModelAdmin):
 
 
 class UploadedImageAdmin(admin.ModelAdmin):
-    list_display = ('title', 'available_resized_images')
-    readonly_fields = ('available_resized_images',)
+    list_display = ('title', 'derivatives_status', 'derivatives_attempts', 'derivatives_summary')
+    list_filter = ('derivatives_status',)
+    readonly_fields = ('derivatives_status', 'derivatives_attempts', 'derivatives_error', 'available_resized_images')
+    actions = ('requeue_derivatives',)
+
+    @admin.action(description="Requeue resized versions")
+    def requeue_derivatives(self, request, queryset):
+        """Queue the selected images again for the process_image_jobs worker"""
+        updated = queryset.update(
+            derivatives_status=UploadedImage.DerivativesStatus.PENDING,
+            derivatives_error="",
+            derivatives_attempts=0,
+            derivatives_retry_at=None,
+        )
+        self.message_user(request, f"{updated} image(s) queued.")
 
 
 # Register models
@@ -6,4 +6,5 @@ class HorizonConfig(AppConfig):
     name = 'horizon'
 
     def ready(self):
+        import horizon.checks
         import horizon.signals
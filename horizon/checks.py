@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .utils.page_cache import is_page_cache_enabled
+
+
+# Cache backends whose entries live in one process
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register()
+def check_page_cache_backend(app_configs, **kwargs):
+    """
+    The page cache keeps the dependency versions in the default cache, and the processes that
+    invalidate them (every gunicorn worker, process_image_jobs, the admin) aren't the ones that
+    serve the pages. A process-local cache would keep serving pages another process invalidated.
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if is_page_cache_enabled() and backend in PROCESS_LOCAL_CACHE_BACKENDS:
+        return [Error(
+            f"PAGE_CACHE_ENABLED needs a default cache shared by the processes, not {backend}.",
+            hint="Use Redis, Memcached or DatabaseCache for CACHES['default'], see DEPLOY_DJANGO.txt.",
+            id="horizon.E001",
+        )]
+    return []
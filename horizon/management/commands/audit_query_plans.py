@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from horizon.utils.query_plans import audit_view, get_audited_pages
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN QUERY PLAN on the queries of every public view and flags full scans and "
+        "temp B-tree sorts. Use -v 2 to print every plan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--strict", action="store_true", help="Exit with an error when a plan has problems.")
+
+    def handle(self, *args, **options):
+        problems = 0
+        for view, path, view_kwargs in get_audited_pages():
+            self.stdout.write(self.style.MIGRATE_HEADING(path))
+            for sql, _, steps, query_problems in audit_view(view, path, **view_kwargs):
+                problems += len(query_problems)
+                status = self.style.ERROR("PROBLEM") if query_problems else self.style.SUCCESS("OK     ")
+                self.stdout.write(f"  {status} {sql[:110]}{'...' if len(sql) > 110 else ''}")
+                for step in steps if options["verbosity"] > 1 else query_problems:
+                    self.stdout.write(f"            {step}")
+
+        summary = f"{problems} plan problems"
+        if problems and options["strict"]:
+            raise CommandError(summary)
+        self.stdout.write(self.style.WARNING(summary) if problems else self.style.SUCCESS(summary))
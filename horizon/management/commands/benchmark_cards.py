@@ -0,0 +1,122 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.urls import reverse
+
+from horizon.management.commands.benchmark_html_converter import build_body
+from horizon.models import Author, Content, ContentCard, Type
+from horizon.utils.cards import refresh_cards
+from horizon.utils.pagination import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the listings read from ContentCard against Content rows, whole and narrowed with only(): "
+        "latency and peak Python memory, including what the templates read from each card. "
+        "The articles are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=50_000, help="Published articles.")
+        parser.add_argument("--body-size", type=int, default=8000, help="Characters of body (and html_body) per article.")
+        parser.add_argument("--per-page", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per measure; the best run is reported.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            news = self._create_items(options["items"], options["body_size"])
+            self.stdout.write(f"Created {options['items']} articles in {time.perf_counter() - started:.1f}s")
+
+            started = time.perf_counter()
+            refresh_cards(Content.objects.filter(type=news))
+            self.stdout.write(f"Built their cards in {time.perf_counter() - started:.1f}s\n")
+
+            sources = {
+                "content rows": (Content.objects.select_related("type", "author"), self._read_content),
+                "content only()": (
+                    Content.objects.select_related("type", "author").only(
+                        "title", "slug", "description", "published_at", "image_featured", "image_featured_srcset",
+                        "image_featured_sources", "image_caption", "type__name", "author__first_name", "author__last_name",
+                    ),
+                    self._read_content,
+                ),
+                "cards": (ContentCard.objects.all(), self._read_card),
+            }
+            per_page = options["per_page"]
+            for name, (queryset, read) in sources.items():
+                listing = queryset.filter(type=news, publish=True)
+                paginator = CursorPaginator(listing, per_page)
+                cursor = paginator.get_cursors()[options["items"] // per_page // 2 - 1]
+                self.stdout.write(f"{name}:")
+                for label, func in (
+                    ("first page", lambda: read(paginator.get_page())),
+                    ("middle page", lambda: read(paginator.get_page(cursor))),
+                    ("every article", lambda: read(listing.order_by("-published_at", "-pk"))),
+                ):
+                    elapsed, peak = self._measure(func, options["repeat"])
+                    self.stdout.write(f"  {label:<14} {elapsed * 1000:9.2f} ms  peak {peak / 1024:10.1f} KiB")
+            transaction.set_rollback(True)
+
+    def _create_items(self, count, body_size):
+        author = Author.objects.create(first_name="Bench", last_name="Mark", title="Editor", description="")
+        news = Type.objects.create(name="benchmark-news")
+        body = build_body(body_size)
+        srcset = {f"https://example.com/media/r/{width}x0/image.jpg": f"{width}w" for width in (320, 480, 640, 960, 1280)}
+        sources = {
+            mime_type: {url.replace(".jpg", f".{extension}"): width for url, width in srcset.items()}
+            for mime_type, extension in (("image/webp", "webp"), ("image/avif", "avif"))
+        }
+        for start in range(0, count, 2000):
+            Content.objects.bulk_create(
+                Content(
+                    title=f"Article {i}", slug=f"benchmark-{i}", type=news, author=author, body=body, html_body=body,
+                    description=f"Description of article {i}", publish=True, image_featured="https://example.com/image.jpg",
+                    image_featured_srcset=srcset, image_featured_sources=sources,
+                )
+                for i in range(start, min(start + 2000, count))
+            )
+        # One article a minute, so the listing isn't ordered by id alone
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE horizon_content SET published_at = datetime('2020-01-01', '+' || ((id * 7919) %% %s) || ' minutes') "
+                "WHERE type_id = %s",
+                [count, news.pk],
+            )
+        return news
+
+    # What the card templates read, see horizon/templates/horizon/news.html
+
+    def _read_content(self, contents):
+        for content in contents:
+            (
+                reverse("content_detail_path_name", args=[content.type.name, content.slug]), content.title,
+                content.get_srcset(), content.get_srcset(), content.get_picture_sources(), content.image_featured,
+                content.image_caption, content.author.first_name, content.author.last_name, content.published_at,
+            )
+
+    def _read_card(self, cards):
+        for card in cards:
+            (
+                card.url_path, card.title, card.srcset, card.srcset, card.get_picture_sources(), card.image_featured,
+                card.image_caption, card.author_name, card.published_at,
+            )
+
+    def _measure(self, func, repeat):
+        """
+        Returns the best time of `repeat` runs, and the peak memory allocated by one more run.
+        """
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        tracemalloc.start()
+        try:
+            func()
+            return best, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
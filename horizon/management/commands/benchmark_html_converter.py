@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from horizon.utils.utils import HTMLConverter
+
+
+# One section of a typical review/guide, repeated until the body reaches the target size.
+SAMPLE_SECTION = '''{h2 Section heading h2}
+{p The quick brown fox jumps over the lazy dog. {b Bold claim b} and a {a store link href="https://example.com/item" target="_blank" a} in the middle. p}
+{figure_img_src_set}
+    src="https://example.com/image.jpg"
+    figcaption="A caption for the image"
+    alt="Alt text"
+    srcset="https://example.com/image_400.jpg 400w"
+    srcset="https://example.com/image_800.jpg 800w"
+{figure_img_src_set}
+{ul
+    {li First point with {b emphasis b} li}
+    {li Second point li}
+    {li Third point li}
+ul}
+{h3 Sub heading h3}
+{p Another paragraph of text that goes on for a while to pad the body out to a realistic length. p}
+{hr hr}
+'''
+
+
+def build_body(size):
+    """
+    Returns a body of at least `size` characters, made of distinct sections.
+    """
+    sections = []
+    length = 0
+    index = 0
+    while length < size:
+        section = SAMPLE_SECTION.replace("Section heading", f"Section heading {index}")
+        sections.append(section)
+        length += len(section)
+        index += 1
+    return "".join(sections)
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the single-pass HTMLConverter against the multi-pass implementation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000],
+                            help="Body sizes in characters.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the best run is reported.")
+
+    def handle(self, *args, **options):
+        converter = HTMLConverter()
+
+        for size in options["sizes"]:
+            body = build_body(size)
+            single_pass = self._best_time(converter.get_html, body, options["repeat"])
+            multipass = self._best_time(converter.get_html_multipass, body, options["repeat"])
+
+            if converter.get_html(body) != converter.get_html_multipass(body):
+                self.stderr.write(self.style.ERROR(f"{size} chars: outputs differ"))
+                continue
+
+            self.stdout.write(
+                f"{len(body):>9} chars  single-pass {single_pass * 1000:10.2f} ms  "
+                f"multi-pass {multipass * 1000:10.2f} ms  speedup {multipass / single_pass:7.1f}x"
+            )
+
+    def _best_time(self, func, body, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(body)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
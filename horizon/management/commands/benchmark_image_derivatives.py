@@ -0,0 +1,107 @@
+import os
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageFilter
+
+from horizon.utils import images
+from horizon.utils.images import create_derivatives, get_derivative_path, get_derivative_quality, get_derivative_sizes
+
+
+def create_derivatives_legacy(orig_path):
+    """
+    The previous engine: opens, decodes and resizes the full original once per width.
+    """
+    with Image.open(orig_path) as img:
+        orig_size = img.size
+    for size in get_derivative_sizes(orig_size):
+        with Image.open(orig_path) as img:
+            resized_img = img.resize(size, Image.Resampling.LANCZOS)
+            resized_img.save(get_derivative_path(orig_path, size), quality=get_derivative_quality(size[0]))
+
+
+def create_jpeg_derivatives(orig_path):
+    """
+    The current engine limited to JPEG outputs, to compare like for like with the legacy one.
+    Only called in the benchmark's worker processes, so changing the module setting is safe.
+    """
+    images.DERIVATIVE_FORMATS = {"jpeg": images.DERIVATIVE_FORMATS["jpeg"]}
+    return create_derivatives(orig_path)
+
+
+ENGINES = {"legacy": create_derivatives_legacy, "decode-once": create_jpeg_derivatives, "all-formats": create_derivatives}
+
+
+def build_photo(path, size):
+    """
+    Writes a photo-like JPEG: gradients, shapes and noise, so it doesn't compress unrealistically well.
+    """
+    width, height = size
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for i in range(40):
+        x, y = (i * 7919) % width, (i * 104729) % height
+        draw.ellipse((x, y, x + width // 6, y + height // 6), fill=((i * 50) % 256, (i * 90) % 256, (i * 130) % 256))
+    img = img.filter(ImageFilter.GaussianBlur(3))
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    Image.blend(img, noise, 0.15).save(path, quality=90)
+
+
+def _measure(engine, orig_path):
+    """
+    Runs one engine in a fresh worker process. Returns (cpu seconds, peak RSS growth in KiB).
+    """
+    output_dir = tempfile.mkdtemp()
+    try:
+        path = shutil.copy(orig_path, output_dir)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        cpu_before = time.process_time()
+        ENGINES[engine](path)
+        cpu = time.process_time() - cpu_before
+        return cpu, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    finally:
+        shutil.rmtree(output_dir)
+
+
+class Command(BaseCommand):
+    help = "Benchmarks per-upload CPU time and peak RSS of the derivative engine against the previous one."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", default=["1600x1067", "2400x1600", "4000x2667"],
+                            help="Original image sizes, as <width>x<height>.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the best run is reported.")
+
+    def handle(self, *args, **options):
+        work_dir = tempfile.mkdtemp()
+        try:
+            for size in options["sizes"]:
+                width, height = (int(value) for value in size.split("x"))
+                orig_path = os.path.join(work_dir, f"photo_{size}.jpg")
+                build_photo(orig_path, (width, height))
+
+                results = {engine: self._best(engine, orig_path, options["repeat"]) for engine in ENGINES}
+                (legacy_cpu, legacy_rss), (cpu, rss) = results["legacy"], results["decode-once"]
+                all_cpu, all_rss = results["all-formats"]
+                self.stdout.write(
+                    f"{size:>10} ({os.path.getsize(orig_path) // 1024:>5} KiB)  "
+                    f"legacy {legacy_cpu * 1000:8.1f} ms {legacy_rss / 1024:7.1f} MiB  "
+                    f"decode-once {cpu * 1000:8.1f} ms {rss / 1024:7.1f} MiB  "
+                    f"speedup {legacy_cpu / cpu:5.1f}x  "
+                    f"with {'/'.join(images.DERIVATIVE_FORMATS)} {all_cpu * 1000:8.1f} ms {all_rss / 1024:7.1f} MiB"
+                )
+        finally:
+            shutil.rmtree(work_dir)
+
+    def _best(self, engine, orig_path, repeat):
+        best_cpu = best_rss = None
+        for _ in range(repeat):
+            # A new process per run, so the peak RSS of one run doesn't hide the next one's
+            with ProcessPoolExecutor(1) as pool:
+                cpu, rss = pool.submit(_measure, engine, orig_path).result()
+            best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+            best_rss = rss if best_rss is None else min(best_rss, rss)
+        return best_cpu, best_rss
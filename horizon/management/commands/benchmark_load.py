@@ -0,0 +1,385 @@
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from html import unescape
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.db import connection, connections, transaction
+from django.test.testcases import QuietWSGIRequestHandler
+from django.test.utils import override_settings
+from django.urls import path
+
+from horizon.management.commands.benchmark_html_converter import build_body
+from horizon.models import Author, Category, Content, ContentCard, Tag, Type
+from horizon.utils.cards import refresh_cards
+from horizon.utils.query_budget import record_queries
+from horizon.utils.related_content import rebuild_related_content
+from horizon.utils.structured_data import refresh_structured_data
+from horizon.utils.utils import HTMLConverter
+from horizon.views import products_category_page
+from horizon_core.urls import urlpatterns as site_urlpatterns
+
+
+# The site's URLs, plus the products page, which isn't routed yet. The benchmark server uses them as ROOT_URLCONF.
+urlpatterns = [
+    *site_urlpatterns,
+    path("products/", products_category_page, name="products_category_page_path_name"),
+]
+
+TYPES = {"news": 5, "reviews": 2, "guides": 2, "codes": 1}  # Name: weight
+PRODUCT_CATEGORIES = ["hardware", "devices", "wearables", "assistants"]
+CATEGORIES = ["products", *PRODUCT_CATEGORIES, "pc", "playstation", "xbox", "nintendo", "mobile"]
+TAGS = ["rpg", "shooter", "strategy", "indie", "esports", "multiplayer", "open world", "deals", "hands-on", "patch notes"]
+# Curated tags the pages list: name, share of the candidate articles that have it
+CURATED_TAGS = {"Home Main": 0.005, "Home Featured": 0.02, "Top News": 0.03, "Category Main": 0.05, "Category Featured": 0.1}
+WORDS = (
+    "horizon update season launch review guide console patch boss raid quest arena legend pixel shadow "
+    "frontier echo storm forge drift nova titan rogue saga realm"
+).split()
+
+NEXT_PAGE = re.compile(r'<a href="(\?after=[^"]+)"\s+class="[^"]*">\s*Next')
+
+CREATE_BATCH_SIZE = 1000
+
+
+class QueryCountingApplication:
+    """
+    The WSGI application, with the number of queries of each request in its X-DB-Query-Count header,
+    as QueryBudgetMiddleware emits it in debug mode.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        with record_queries() as recorder:
+            def start_query_counted_response(status, headers, exc_info=None):
+                return start_response(status, [*headers, ("X-DB-Query-Count", str(recorder.count))], exc_info)
+
+            return self.application(environ, start_query_counted_response)
+
+
+def serve(pipe, overrides):
+    """
+    Runs the benchmark server until the parent asks it to stop, then sends it the peak RSS of the process.
+    Runs in a child process, one per view, so the peak is the view's.
+    """
+    with override_settings(**overrides):
+        server = ThreadedWSGIServer(("127.0.0.1", 0), QuietWSGIRequestHandler, allow_reuse_address=False)
+        server.set_app(QueryCountingApplication(WSGIHandler()))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        pipe.send((server.server_address[1], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+        pipe.recv()
+        server.shutdown()
+        server.server_close()
+    pipe.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def percentile(ordered, fraction):
+    """
+    Returns the nearest-rank percentile of a sorted list.
+    """
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the public views through a local WSGI server with concurrent clients, on a seeded database: "
+        "throughput, p50/p95/p99 latency, queries per request and peak RSS of the server, per view. "
+        "Writes the results to JSON so runs can be compared across commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", help="SQLite file of the benchmark database, seeded if it doesn't exist and reused "
+                                               "otherwise. Defaults to a temporary file.")
+        parser.add_argument("--articles", type=int, default=2000, help="Articles to seed.")
+        parser.add_argument("--authors", type=int, default=20, help="Authors to seed.")
+        parser.add_argument("--body-size", type=int, default=8000, help="Median characters of body per article.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the generated dataset and of the URLs requested.")
+        parser.add_argument("--requests", type=int, default=500, help="Requests per view.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients.")
+        parser.add_argument("--pages", type=int, default=5, help="Pages of the news and products listings to request.")
+        parser.add_argument("--details", type=int, default=50, help="Detail pages to request.")
+        parser.add_argument("--page-cache", action="store_true", help="Enables the page cache.")
+        parser.add_argument("--fragment-cache", action="store_true", help="Enables the fragment cache.")
+        parser.add_argument("--output", default="benchmark_load.json", help="JSON file of the results.")
+
+    def handle(self, *args, **options):
+        temporary = options["database"] is None
+        database = options["database"] or os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+        reuse = not temporary and os.path.exists(database)
+        old_name = connection.settings_dict["NAME"]
+        connection.settings_dict["TEST"]["NAME"] = database
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=reuse)
+        try:
+            if not reuse:
+                started = time.perf_counter()
+                self._run_in_child(self._seed, options)
+                self.stdout.write(f"Seeded {options['articles']} articles in {time.perf_counter() - started:.1f}s")
+            dataset = {
+                "articles": Content.objects.count(),
+                "authors": Author.objects.count(),
+                "types": Type.objects.count(),
+                "categories": Category.objects.count(),
+                "tags": Tag.objects.count(),
+            }
+            self.stdout.write(f"Database {database}: {', '.join(f'{count} {name}' for name, count in dataset.items())}\n")
+
+            overrides = {
+                "DEBUG": False,
+                "ALLOWED_HOSTS": ["127.0.0.1"],
+                "ROOT_URLCONF": __name__,
+                "PAGE_CACHE_ENABLED": options["page_cache"] or getattr(settings, "PAGE_CACHE_ENABLED", False),
+                "FRAGMENT_CACHE_ENABLED": options["fragment_cache"] or getattr(settings, "FRAGMENT_CACHE_ENABLED", False),
+            }
+            results = {}
+            for view, (urls, pages) in self._get_scenarios(options).items():
+                results[view] = self._benchmark(urls, pages, overrides, options)
+                self._write_result(view, results[view])
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=not temporary)
+            if temporary:
+                os.rmdir(os.path.dirname(database))
+
+        with open(options["output"], "w") as output:
+            json.dump({
+                "environment": self._get_environment(),
+                "options": {name: options[name] for name in (
+                    "articles", "authors", "body_size", "seed", "requests", "concurrency", "pages", "details",
+                )},
+                "settings": {name: overrides[name] for name in ("PAGE_CACHE_ENABLED", "FRAGMENT_CACHE_ENABLED")},
+                "dataset": dataset,
+                "views": results,
+            }, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"\nWrote {options['output']}"))
+
+    def _run_in_child(self, func, *args):
+        """
+        Runs `func` in a forked process, so the memory it uses doesn't count in the servers forked later.
+        """
+        connections.close_all()
+        process = multiprocessing.get_context("fork").Process(target=func, args=args)
+        process.start()
+        process.join()
+        if process.exitcode:
+            raise RuntimeError(f"{func.__name__} failed with exit code {process.exitcode}")
+
+    # Dataset
+
+    def _seed(self, options):
+        rng = random.Random(options["seed"])
+        converter = HTMLConverter()
+        with transaction.atomic():
+            authors = Author.objects.bulk_create(
+                Author(first_name=rng.choice(WORDS).title(), last_name=f"{rng.choice(WORDS).title()}{i}", title="Editor",
+                       description=f"Writes about {rng.choice(WORDS)} and {rng.choice(WORDS)}.")
+                for i in range(options["authors"])
+            )
+            types = {t.name: t for t in Type.objects.bulk_create(Type(name=name) for name in TYPES)}
+            categories = {c.name: c for c in Category.objects.bulk_create(Category(name=name) for name in CATEGORIES)}
+            tags = {t.name: t for t in Tag.objects.bulk_create(Tag(name=name) for name in [*TAGS, *CURATED_TAGS])}
+
+            srcset = {f"https://example.com/media/r/{width}x0/image.jpg": f"{width}w" for width in (320, 480, 640, 960, 1280)}
+            sources = {
+                mime_type: {url.replace(".jpg", f".{extension}"): width for url, width in srcset.items()}
+                for mime_type, extension in (("image/webp", "webp"), ("image/avif", "avif"))
+            }
+            terms = []  # (category names, tag names) of each article
+            for start in range(0, options["articles"], CREATE_BATCH_SIZE):
+                contents = []
+                for i in range(start, min(start + CREATE_BATCH_SIZE, options["articles"])):
+                    type_name = rng.choices(list(TYPES), weights=list(TYPES.values()))[0]
+                    article_categories, article_tags = self._pick_terms(rng, type_name)
+                    terms.append((article_categories, article_tags))
+                    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 9))).capitalize()
+                    body = build_body(int(rng.lognormvariate(math.log(options["body_size"]), 0.5)))
+                    contents.append(Content(
+                        title=title, slug=f"{'-'.join(title.lower().split()[:4])}-{i}", type=types[type_name],
+                        author=rng.choice(authors), meta_title=title, meta_description=f"{title}, in depth.",
+                        description=f"{title}: everything about {rng.choice(WORDS)} and {rng.choice(WORDS)}.",
+                        body=body, html_body=converter.get_html(body), html_body_hash=HTMLConverter.get_render_hash(body),
+                        read_time=max(1, len(body) // 1500), publish=rng.random() < 0.95,
+                        image_featured="https://example.com/image.jpg", image_featured_srcset=srcset,
+                        image_featured_sources=sources, image_caption=title, image_by="Benchmark",
+                    ))
+                Content.objects.bulk_create(contents)
+
+            ids = list(Content.objects.order_by("pk").values_list("pk", flat=True))
+            Content.categories.through.objects.bulk_create(
+                (Content.categories.through(content_id=pk, category_id=categories[name].pk)
+                 for pk, (names, _) in zip(ids, terms) for name in names),
+                batch_size=CREATE_BATCH_SIZE,
+            )
+            Content.tags.through.objects.bulk_create(
+                (Content.tags.through(content_id=pk, tag_id=tags[name].pk) for pk, (_, names) in zip(ids, terms) for name in names),
+                batch_size=CREATE_BATCH_SIZE,
+            )
+            # One article every 37 minutes, in an order unrelated to the ids, so listings aren't ordered by id alone
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE horizon_content SET published_at = datetime('2020-01-01', '+' || (((id * 7919) %% %s) * 37) || ' minutes')",
+                    [len(ids)],
+                )
+            # bulk_create() skips save() and the signals: build what they maintain
+            refresh_cards(Content.objects.all())
+            refresh_structured_data(Content.objects.all())
+        rebuild_related_content()
+        connections.close_all()
+
+    def _pick_terms(self, rng, type_name):
+        """
+        Returns the category and tag names of an article of type `type_name`.
+        """
+        if type_name != "news" and rng.random() < 0.3:
+            categories = ["products", rng.choice(PRODUCT_CATEGORIES)]
+            curated = ["Category Main", "Category Featured"]
+        else:
+            categories = rng.sample(CATEGORIES[len(PRODUCT_CATEGORIES) + 1:], rng.randint(1, 2))
+            curated = ["Home Main", "Home Featured", *(["Top News"] if type_name == "news" else [])]
+        tags = rng.sample(TAGS, rng.randint(0, 3))
+        tags += [name for name in curated if rng.random() < CURATED_TAGS[name]]
+        return categories, tags
+
+    # Load test
+
+    def _get_scenarios(self, options):
+        """
+        Returns {view name: ([URL], pages)}. Listings list their first page; the next ones are
+        reached by following their "Next" links, up to `pages` pages.
+        """
+        rng = random.Random(options["seed"])
+        detail_paths = list(
+            ContentCard.objects.filter(publish=True).order_by("pk").values_list("url_path", flat=True)
+        )
+        return {
+            "home": (["/"], 1),
+            "news_type_page": (["/news/"], options["pages"]),
+            "content_detail": (rng.sample(detail_paths, min(options["details"], len(detail_paths))), 1),
+            "products_category_page": (["/products/"], options["pages"]),
+        }
+
+    def _benchmark(self, urls, pages, overrides, options):
+        connections.close_all()
+        parent_pipe, child_pipe = multiprocessing.Pipe()
+        server = multiprocessing.get_context("fork").Process(target=serve, args=(child_pipe, overrides))
+        server.start()
+        try:
+            port, start_rss = parent_pipe.recv()
+            urls = self._warm_up(port, urls, pages)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options["concurrency"]) as executor:
+                samples = list(executor.map(  # (latency, status, queries)
+                    lambda i: self._request(port, urls[i % len(urls)]), range(options["requests"])
+                ))
+            elapsed = time.perf_counter() - started
+
+            parent_pipe.send("stop")
+            peak_rss = parent_pipe.recv()
+        finally:
+            server.join(timeout=10)
+            if server.is_alive():
+                server.kill()
+
+        latencies = sorted(latency for latency, _, _ in samples)
+        queries = [count for _, _, count in samples if count is not None]
+        return {
+            "urls": len(urls),
+            "requests": len(samples),
+            "errors": sum(status != 200 for _, status, _ in samples),
+            "throughput_rps": round(len(samples) / elapsed, 1),
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+                **{f"p{p}": round(percentile(latencies, p / 100) * 1000, 2) for p in (50, 95, 99)},
+                "max": round(latencies[-1] * 1000, 2),
+            },
+            "queries": {
+                "min": min(queries, default=None),
+                "mean": round(sum(queries) / len(queries), 2) if queries else None,
+                "max": max(queries, default=None),
+            },
+            "rss_kib": {"start": start_rss, "peak": peak_rss},
+        }
+
+    def _warm_up(self, port, urls, pages):
+        """
+        Requests every URL once, following the "Next" links of listings for up to `pages` pages.
+        Returns the URLs to load-test.
+        """
+        warmed = []
+        for url in urls:
+            for _ in range(pages):
+                status, body = self._get(port, url)
+                if status != 200:
+                    raise RuntimeError(f"GET {url} returned {status}")
+                warmed.append(url)
+                match = NEXT_PAGE.search(body)
+                if match is None:
+                    break
+                url = url.split("?")[0] + unescape(match.group(1))
+        return warmed
+
+    def _get(self, port, url):
+        client = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        try:
+            client.request("GET", url, headers={"Connection": "close"})
+            response = client.getresponse()
+            return response.status, response.read().decode()
+        finally:
+            client.close()
+
+    def _request(self, port, url):
+        client = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        try:
+            start = time.perf_counter()
+            client.request("GET", url, headers={"Connection": "close"})
+            response = client.getresponse()
+            response.read()
+            latency = time.perf_counter() - start
+            queries = response.getheader("X-DB-Query-Count")
+            return latency, response.status, int(queries) if queries is not None else None
+        finally:
+            client.close()
+
+    def _write_result(self, view, result):
+        latency = result["latency_ms"]
+        self.stdout.write(
+            f"{view:<24} {result['throughput_rps']:8.1f} req/s  p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms  "
+            f"p99 {latency['p99']:8.2f} ms  queries {result['queries']['max']}  peak RSS {result['rss_kib']['peak'] / 1024:6.1f} MiB"
+            + (self.style.ERROR(f"  {result['errors']} errors") if result["errors"] else "")
+        )
+
+    def _get_environment(self):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "cpus": os.cpu_count(),
+        }
@@ -0,0 +1,88 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+
+from horizon.models import Author, Category, Content, Type
+from horizon.utils.cards import refresh_cards
+from horizon.utils.pagination import CursorPaginator
+from horizon.utils.query_budget import record_queries
+from horizon.views import _get_cards, _get_filtered_content
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks Paginator (COUNT + OFFSET) against CursorPaginator on the news and products listings. "
+        "The items are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=100_000, help="Published items per listing.")
+        parser.add_argument("--per-page", type=int, default=4)
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per page; the best run is reported.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            self._create_items(options["items"])
+            self.stdout.write(f"Created {options['items']} items per listing in {time.perf_counter() - started:.1f}s")
+
+            listings = {
+                "news": _get_cards().filter(type__name="benchmark-news", publish=True),
+                "products": _get_filtered_content(include_categories=["benchmark-products"]),
+            }
+            for name, queryset in listings.items():
+                self._benchmark(name, queryset, options["per_page"], options["repeat"])
+            transaction.set_rollback(True)
+
+    def _create_items(self, count):
+        author = Author.objects.create(first_name="Bench", last_name="Mark", title="Editor", description="")
+        news = Type.objects.create(name="benchmark-news")
+        products = Category.objects.create(name="benchmark-products")
+        for start in range(0, count, 5000):
+            Content.objects.bulk_create(
+                Content(
+                    title=f"Item {i}", slug=f"benchmark-{i}", type=news, author=author, body="", html_body="",
+                    description=f"Description of item {i}", publish=True,
+                )
+                for i in range(start, min(start + 5000, count))
+            )
+        contents = Content.objects.filter(author=author)
+        Content.categories.through.objects.bulk_create(
+            (Content.categories.through(content_id=pk, category_id=products.pk) for pk in contents.values_list("pk", flat=True).iterator()),
+            batch_size=5000,
+        )
+        # One item a minute, so the listings aren't ordered by id alone
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE horizon_content SET published_at = datetime('2020-01-01', '+' || ((id * 7919) %% %s) || ' minutes') "
+                "WHERE author_id = %s",
+                [count, author.pk],
+            )
+        refresh_cards(contents)
+
+    def _benchmark(self, name, queryset, per_page, repeat):
+        paginator = CursorPaginator(queryset, per_page)
+        ordered = queryset.order_by("-published_at", "-pk")
+        cursors = [None, *paginator.get_cursors()]
+        numbers = sorted({1, 10, 100, 1000, len(cursors) // 2, len(cursors)} & set(range(1, len(cursors) + 1)))
+
+        self.stdout.write(f"\n{name}: {len(cursors)} pages")
+        for number in numbers:
+            offset, offset_queries = self._best_time(lambda: list(Paginator(ordered, per_page).page(number)), repeat)
+            cursor, cursor_queries = self._best_time(lambda: list(paginator.get_page(cursors[number - 1])), repeat)
+            self.stdout.write(
+                f"  page {number:>6}  offset {offset * 1000:8.2f} ms ({offset_queries} queries)  "
+                f"cursor {cursor * 1000:8.2f} ms ({cursor_queries} queries)  speedup {offset / cursor:6.1f}x"
+            )
+
+    def _best_time(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            with record_queries() as recorder:
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, recorder.count
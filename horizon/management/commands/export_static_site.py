@@ -0,0 +1,91 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from horizon.utils import compression, static_export
+
+
+MANIFEST_NAME = ".export-manifest.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports home, every news page and every published content page to static files with "
+        ".gz/.br siblings. Later runs only re-render pages whose inputs changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=os.path.join(settings.BASE_DIR, "static_export"),
+                            help="Output directory.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (1 renders inline).")
+        parser.add_argument("--batch-size", type=int, default=50, help="Pages per worker task.")
+        parser.add_argument("--host", default=(settings.ALLOWED_HOSTS or ["localhost"])[0],
+                            help="Host name the pages are rendered for.")
+        parser.add_argument("--full", action="store_true", help="Re-render every page.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        output_dir = options["output"]
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        manifest = {}
+        if os.path.exists(manifest_path) and not options["full"]:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+
+        # Tokens are taken before rendering, so changes made during the export are picked up next time.
+        tokens = static_export.get_dependency_tokens()
+        paths = static_export.get_export_paths()
+
+        stale = [path for path in paths if self._is_stale(path, manifest.get(path), tokens, output_dir)]
+        removed = set(manifest) - set(paths)
+
+        dependencies = self._render(stale, output_dir, options)
+
+        for path in removed:
+            static_export.remove_page(static_export.get_output_path(output_dir, path))
+
+        new_manifest = {path: manifest[path] for path in paths if path in manifest}
+        for path, page_dependencies in dependencies.items():
+            new_manifest[path] = {"dependencies": {dependency: tokens.get(dependency) for dependency in page_dependencies}}
+
+        os.makedirs(output_dir, exist_ok=True)
+        with open(f"{manifest_path}.tmp", "w") as f:
+            json.dump(new_manifest, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(stale)} rendered, {len(paths) - len(stale)} unchanged, {len(removed)} removed "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
+        if not compression.brotli:
+            self.stdout.write(self.style.WARNING("brotli is not installed, only .gz files were written."))
+
+    def _is_stale(self, path, entry, tokens, output_dir):
+        if entry is None or not os.path.exists(static_export.get_output_path(output_dir, path)):
+            return True
+        return any(tokens.get(dependency) != token for dependency, token in entry["dependencies"].items())
+
+    def _render(self, paths, output_dir, options):
+        if options["workers"] <= 1 or len(paths) <= options["batch_size"]:
+            return static_export.render_pages(paths, output_dir, options["host"])
+
+        batches = [paths[i:i + options["batch_size"]] for i in range(0, len(paths), options["batch_size"])]
+        dependencies = {}
+        # Forked workers must open their own database connections.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            options["workers"],
+            initializer=static_export.init_worker,
+            initargs=(os.environ["DJANGO_SETTINGS_MODULE"],),
+        ) as pool:
+            futures = [pool.submit(static_export.render_pages, batch, output_dir, options["host"]) for batch in batches]
+            for done, future in enumerate(futures, 1):
+                dependencies.update(future.result())
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{min(done * options['batch_size'], len(paths))}/{len(paths)} pages rendered")
+        return dependencies
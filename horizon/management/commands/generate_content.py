@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from horizon.utils.synthetic_content import BATCH_SIZE, generate_content
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic authors, types, categories, tags and articles, deterministic from a seed, "
+        "for benchmarks and scaling tests. Articles are bulk-inserted and their bodies rendered in a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--articles", type=int, default=10_000)
+        parser.add_argument("--authors", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0, help="A seed can only be generated once per database.")
+        parser.add_argument("--body-size", type=int, default=8000, help="Median characters of body per article.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Articles per bulk_create.")
+        parser.add_argument("--workers", type=int, help="Processes rendering the bodies. Defaults to the number of CPUs.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        ids = generate_content(
+            options["articles"], options["authors"], options["seed"], options["body_size"], options["batch_size"],
+            options["workers"], stdout=self.stdout if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Generated {len(ids)} articles in {time.perf_counter() - started:.1f}s"))
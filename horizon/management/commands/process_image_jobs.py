@@ -0,0 +1,61 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from horizon.utils import image_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the resized versions of uploaded images queued by UploadedImage.save(). "
+        "Failed jobs are retried with a backoff, up to a maximum number of attempts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (1 runs jobs inline).")
+        parser.add_argument("--batch-size", type=int, default=20, help="Jobs claimed at a time.")
+        parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit when no job is due instead of polling.")
+
+    def handle(self, *args, **options):
+        pool = None
+        if options["workers"] > 1:
+            # Workers only resize files, the database is used from this process only.
+            connections.close_all()
+            pool = ProcessPoolExecutor(options["workers"])
+
+        done = failed = 0
+        try:
+            while True:
+                jobs = image_jobs.claim_image_jobs(options["batch_size"])
+                if not jobs:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                if pool:
+                    results = pool.map(image_jobs.run_image_job, [path for _, path, _ in jobs])
+                else:
+                    results = map(image_jobs.run_image_job, [path for _, path, _ in jobs])
+
+                for (pk, path, claim), (outputs, error) in zip(jobs, results):
+                    if not image_jobs.record_image_job_result(pk, outputs, error, claim):
+                        self.stderr.write(f"Image {pk} ({path}): deleted, replaced or claimed again meanwhile, result dropped")
+                    elif error:
+                        failed += 1
+                        self.stderr.write(f"Image {pk} ({path}): {error}")
+                    else:
+                        done += 1
+                        if options["verbosity"] > 1:
+                            self.stdout.write(f"Image {pk} done")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"{done} done, {failed} failed"))
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from horizon.utils.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of every content, e.g. after bulk updates that skip signals."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} contents for search in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from horizon.models import Content
+from horizon.utils.structured_data import refresh_structured_data
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the stored JSON-LD of every content, e.g. after changing the structured data template."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = refresh_structured_data(Content.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the structured data of {count} contents in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from horizon.utils.image_jobs import reconcile_image_derivatives
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the derivatives manifest of every uploaded image from the files on disk, "
+        "e.g. after restoring or syncing the media volume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Images per bulk_update.")
+        parser.add_argument("--verify", action="store_true", help="Recompute every checksum, not only those of changed files.")
+        parser.add_argument("--requeue", action="store_true", help="Queue images missing a width or format again.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stats = reconcile_image_derivatives(
+            options["batch_size"], options["verify"], options["requeue"],
+            stdout=self.stdout if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['images']} images, {stats['updated']} manifests updated, {stats['requeued']} requeued "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
+        if stats["missing"]:
+            self.stdout.write(self.style.WARNING(f"{stats['missing']} images have no original file on disk."))
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from horizon.models import Author, Content
+from horizon.utils.bulk_updates import bulk_save
+from horizon.utils.utils import HTMLConverter, convert_documents
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-renders Content.html_body and Author.html_description with the current HTMLConverter. "
+        "Rows whose render hash is unchanged are skipped. Progress is checkpointed after every chunk, "
+        "so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", help="Only re-render content of this type name.")
+        parser.add_argument("--tag", help="Only re-render content with this tag name.")
+        parser.add_argument("--category", help="Only re-render content in this category name.")
+        parser.add_argument("--published-only", action="store_true", help="Only re-render published content.")
+        parser.add_argument("--skip-authors", action="store_true", help="Don't re-render author descriptions.")
+        parser.add_argument("--force", action="store_true", help="Re-render rows even if their hash is unchanged.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (1 renders inline).")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Rows per bulk_update.")
+        parser.add_argument("--checkpoint", default=os.path.join(settings.BASE_DIR, "rerender_html.checkpoint.json"),
+                            help="Checkpoint file used to resume an interrupted run.")
+        parser.add_argument("--reset", action="store_true", help="Ignore an existing checkpoint and start over.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.chunk_size = options["chunk_size"]
+        self.force = options["force"]
+        self.checkpoint_path = options["checkpoint"]
+        self.workers = options["workers"]
+
+        filters = {key: options[key] for key in ("type", "tag", "category", "published_only", "skip_authors")}
+        self.checkpoint = self._load_checkpoint(filters, options["reset"])
+
+        contents = Content.objects.all()
+        if options["type"]:
+            contents = contents.filter(type__name=options["type"])
+        if options["tag"]:
+            contents = contents.filter(tags__name=options["tag"])
+        if options["category"]:
+            contents = contents.filter(categories__name=options["category"])
+        if options["published_only"]:
+            contents = contents.filter(publish=True)
+
+        jobs = [(Content, contents.distinct(), "body", "html_body", "html_body_hash")]
+        if not options["skip_authors"]:
+            jobs.append((Author, Author.objects.all(), "description", "html_description", "html_description_hash"))
+
+        # Workers never touch the database; close connections so forked processes don't share them.
+        connections.close_all()
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            for job in jobs:
+                self._rerender(pool, *job)
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _rerender(self, pool, model, queryset, source_field, html_field, hash_field):
+        label = model.__name__
+        last_id = self.checkpoint["last_ids"].get(label, 0)
+        total = queryset.count()
+        done = queryset.filter(pk__lte=last_id).count()
+        rendered = skipped = 0
+        started = time.perf_counter()
+
+        if done:
+            self.stdout.write(f"{label}: resuming after id {last_id} ({done}/{total} already processed)")
+
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", source_field, hash_field)[:self.chunk_size]
+            )
+            if not rows:
+                break
+
+            stale = []
+            for pk, source, stored_hash in rows:
+                render_hash = HTMLConverter.get_render_hash(source) if source else stored_hash
+                if source and (self.force or render_hash != stored_hash):
+                    stale.append((pk, source, render_hash))
+
+            if stale:
+                sources = [source for _, source, _ in stale]
+                html = pool.map(convert_documents, self._batches(sources)) if pool else [convert_documents(sources)]
+                html = [item for batch in html for item in batch]
+                objects = [
+                    model(pk=pk, **{html_field: item, hash_field: render_hash})
+                    for (pk, _, render_hash), item in zip(stale, html)
+                ]
+                # Sets updated_at, reindexes the contents and invalidates their cached pages
+                bulk_save(objects, [html_field, hash_field])
+
+            last_id = rows[-1][0]
+            done += len(rows)
+            rendered += len(stale)
+            skipped += len(rows) - len(stale)
+            self._save_checkpoint(label, last_id)
+
+            if self.verbosity:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{label}: {done}/{total} processed, {rendered} rendered, {skipped} unchanged "
+                    f"({(rendered + skipped) / elapsed:.0f} rows/s)"
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"{label}: {rendered} rendered, {skipped} unchanged"))
+
+    def _batches(self, sources):
+        """
+        Splits the chunk into one batch per worker to keep pickling overhead low.
+        """
+        size = max(1, -(-len(sources) // self.workers))
+        return [sources[i:i + size] for i in range(0, len(sources), size)]
+
+    def _load_checkpoint(self, filters, reset):
+        if reset or not os.path.exists(self.checkpoint_path):
+            return {"filters": filters, "last_ids": {}}
+
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+
+        if checkpoint.get("filters") != filters:
+            raise CommandError(
+                f"{self.checkpoint_path} was written with different filters {checkpoint.get('filters')}. "
+                "Re-run with the same filters or pass --reset."
+            )
+        return checkpoint
+
+    def _save_checkpoint(self, label, last_id):
+        self.checkpoint["last_ids"][label] = last_id
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,40 @@
+import logging
+
+from django.conf import settings
+
+from horizon.utils.query_budget import record_queries
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    In debug mode, records the queries of every request and emits them as X-DB-* response headers.
+    Logs a warning when a view declared with @query_budget goes over its budget.
+    Does nothing when DEBUG is off.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        for header, value in recorder.get_headers().items():
+            response[header] = value
+
+        budget = getattr(request, "query_budget", None)
+        if budget is not None:
+            response["X-DB-Query-Budget"] = str(budget)
+            if recorder.count > budget:
+                logger.warning("%s ran %d queries, over its budget of %d", request.path, recorder.count, budget)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, "query_budget", None)
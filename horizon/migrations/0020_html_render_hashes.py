@@ -0,0 +1,28 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0019_remove_content_category_content_categories'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='html_description',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='html_description_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='html_body_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0020_html_render_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_content', to='horizon.content')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_to', to='horizon.content')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['content', '-score'], name='related_content_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedcontent',
+            constraint=models.UniqueConstraint(fields=('content', 'related'), name='unique_related_content'),
+        ),
+    ]
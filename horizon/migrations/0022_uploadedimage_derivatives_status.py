@@ -0,0 +1,40 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:17
+
+from django.db import migrations, models
+
+
+def mark_existing_done(apps, schema_editor):
+    # Existing images had their resized versions generated inside save()
+    UploadedImage = apps.get_model("horizon", "UploadedImage")
+    UploadedImage.objects.update(derivatives_status="done")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0021_relatedcontent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='derivatives_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='derivatives_error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='derivatives_retry_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='derivatives_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', editable=False, max_length=20),
+        ),
+        migrations.RunPython(mark_existing_done, migrations.RunPython.noop),
+    ]
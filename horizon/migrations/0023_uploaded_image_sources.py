@@ -0,0 +1,46 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def queue_existing_images(apps, schema_editor):
+    # Existing images need their WebP/AVIF versions and their outputs recorded
+    UploadedImage = apps.get_model("horizon", "UploadedImage")
+    UploadedImage.objects.update(derivatives_status="pending", derivatives_attempts=0, derivatives_retry_at=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0022_uploadedimage_derivatives_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='profile_image_sources',
+            field=models.JSONField(blank=True, default=dict, null=True),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='profile_image_upload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profile_of', to='horizon.uploadedimage'),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='image_featured_sources',
+            field=models.JSONField(blank=True, default=dict, null=True),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='image_featured_upload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='featured_in', to='horizon.uploadedimage'),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
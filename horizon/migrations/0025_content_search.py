@@ -0,0 +1,54 @@
+import html
+from collections import defaultdict
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+
+SEARCH_TABLE = "horizon_content_search"
+BATCH_SIZE = 500
+
+
+def get_body_text(html_body):
+    return " ".join(html.unescape(strip_tags((html_body or "").replace("<", " <"))).split())
+
+
+def index_existing_contents(apps, schema_editor):
+    # The search rows of the existing contents, built as horizon/utils/search.py did when this migration was written.
+    # A frozen copy, so later changes to the live code and models can't break it.
+    Content = apps.get_model("horizon", "Content")
+    content_ids = list(Content.objects.order_by("pk").values_list("pk", flat=True))
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(0, len(content_ids), BATCH_SIZE):
+            ids = content_ids[start:start + BATCH_SIZE]
+            terms = defaultdict(list)
+            for through, field in ((Content.tags.through, "tag__name"), (Content.categories.through, "category__name")):
+                for content_id, name in through.objects.filter(content_id__in=ids).values_list("content_id", field):
+                    terms[content_id].append(name)
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, body, terms) VALUES (%s, %s, %s, %s, %s)",
+                [
+                    (pk, title, description, get_body_text(html_body or body), " ".join(terms[pk]))
+                    for pk, title, description, html_body, body in Content.objects.filter(pk__in=ids).values_list(
+                        "pk", "title", "description", "html_body", "body"
+                    )
+                ],
+            )
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0024_author_updated_at'),
+    ]
+
+    operations = [
+        # Full-text index over contents, kept in sync by signals (see horizon/utils/search.py)
+        migrations.RunSQL(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "title, description, body, terms, tokenize = 'porter unicode61 remove_diacritics 2')",
+            f"DROP TABLE {SEARCH_TABLE}",
+        ),
+        migrations.RunPython(index_existing_contents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0025_content_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(condition=models.Q(('publish', True)), fields=['type', 'published_at'], name='content_type_listing_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0026_content_type_listing_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(condition=models.Q(('publish', True)), fields=['published_at'], name='content_published_idx'),
+        ),
+        # The tag listings start from the tag and read its contents. Django's tag_id index on the
+        # auto-created through tables leaves out content_id, so every row was read from the table.
+        migrations.RunSQL(
+            "CREATE INDEX horizon_content_tags_tag_content_idx ON horizon_content_tags (tag_id, content_id)",
+            "DROP INDEX horizon_content_tags_tag_content_idx",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX horizon_content_categories_category_content_idx ON horizon_content_categories (category_id, content_id)",
+            "DROP INDEX horizon_content_categories_category_content_idx",
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:49
+
+import json
+
+from django.db import migrations, models
+from django.utils.html import escape
+from django.utils.timezone import localtime
+
+
+SITE_URL = "https://thegamehorizon.com"
+PUBLISHER = {
+    "@type": "Organization",
+    "name": "The Game Horizon",
+    "logo": {
+        "@type": "ImageObject",
+        "url": f"{SITE_URL}/static/publisher_256x256.png",
+        "width": 256,
+        "height": 256,
+    },
+}
+ARTICLE_TYPES = {"news": "NewsArticle"}
+BATCH_SIZE = 500
+
+
+def get_article_structured_data(content):
+    if not content.type:
+        return ""
+    return json.dumps({
+        "@context": "https://schema.org",
+        "@type": ARTICLE_TYPES.get(content.type.name.lower(), "Article"),
+        "headline": escape(content.title),
+        "description": escape(content.meta_description),
+        "mainEntityOfPage": {
+            "@type": "WebPage",
+            "@id": f"{SITE_URL}/{content.type.name}/{content.slug}",
+        },
+        "author": {
+            "@type": "Person",
+            "name": f"{content.author.first_name} {content.author.last_name}",
+        },
+        "publisher": PUBLISHER,
+        "datePublished": localtime(content.published_at).isoformat(),
+        "dateModified": localtime(content.updated_at).isoformat(),
+        "image": content.image_featured or "",
+    }, separators=(",", ":"))
+
+
+def build_structured_data(apps, schema_editor):
+    # The JSON-LD of the existing contents, built as horizon/utils/structured_data.py did when this migration was written.
+    # A frozen copy, so later changes to the live code and models can't break it.
+    Content = apps.get_model("horizon", "Content")
+    batch = []
+    for content in Content.objects.select_related("type", "author").iterator(chunk_size=BATCH_SIZE):
+        content.structured_data = get_article_structured_data(content)
+        batch.append(content)
+        if len(batch) == BATCH_SIZE:
+            Content.objects.bulk_update(batch, ["structured_data"])
+            batch = []
+    Content.objects.bulk_update(batch, ["structured_data"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0027_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='structured_data',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(build_structured_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.19 on 2026-10-18 02:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 500
+
+
+def format_srcset(srcset):
+    return ", ".join(f"{url} {width}" for url, width in (srcset or {}).items())
+
+
+def build_cards(apps, schema_editor):
+    # The cards of the existing contents, built as horizon/utils/cards.py did when this migration was written.
+    # A frozen copy, so later changes to the live code and models can't break it.
+    Content = apps.get_model("horizon", "Content")
+    ContentCard = apps.get_model("horizon", "ContentCard")
+    contents = Content.objects.select_related("type", "author").only(
+        "title", "slug", "description", "image_featured", "image_caption", "published_at", "publish",
+        "image_featured_srcset", "image_featured_sources", "type__name", "author__first_name", "author__last_name",
+    )
+    batch = []
+    for content in contents.iterator(chunk_size=BATCH_SIZE):
+        type_name = content.type.name if content.type else ""
+        sources = content.image_featured_sources or {}
+        batch.append(ContentCard(
+            content_id=content.pk,
+            title=content.title,
+            slug=content.slug,
+            description=content.description,
+            image_featured=content.image_featured,
+            image_caption=content.image_caption,
+            published_at=content.published_at,
+            publish=content.publish,
+            type_id=content.type_id,
+            author_id=content.author_id,
+            type_name=type_name,
+            author_name=f"{content.author.first_name} {content.author.last_name}",
+            url_path=f"/{type_name}/{content.slug}/" if type_name else "",
+            srcset=format_srcset(content.image_featured_srcset),
+            avif_srcset=format_srcset(sources.get("image/avif")),
+            webp_srcset=format_srcset(sources.get("image/webp")),
+        ))
+        if len(batch) == BATCH_SIZE:
+            ContentCard.objects.bulk_create(batch)
+            batch = []
+    ContentCard.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0028_content_structured_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentCard',
+            fields=[
+                ('content', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='horizon.content')),
+                ('title', models.CharField(max_length=255)),
+                ('slug', models.SlugField(db_index=False)),
+                ('description', models.CharField(max_length=255)),
+                ('published_at', models.DateTimeField()),
+                ('publish', models.BooleanField()),
+                ('image_featured', models.URLField(blank=True, null=True)),
+                ('image_caption', models.CharField(max_length=255)),
+                ('type_name', models.CharField(max_length=50)),
+                ('author_name', models.CharField(max_length=201)),
+                ('url_path', models.CharField(max_length=255)),
+                ('srcset', models.TextField()),
+                ('avif_srcset', models.TextField()),
+                ('webp_srcset', models.TextField()),
+                ('author', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='horizon.author')),
+                ('type', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='horizon.type')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('publish', True)), fields=['type', 'published_at', 'content'], name='card_type_listing_idx'), models.Index(condition=models.Q(('publish', True)), fields=['published_at', 'content'], name='card_published_idx')],
+            },
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
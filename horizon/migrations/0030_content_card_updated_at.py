@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0029_content_card'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentcard',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horizon', '0030_content_card_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='related_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
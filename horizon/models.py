@@ -1,13 +1,50 @@
 from django.db import models
+from horizon.utils.cards import SOURCE_FIELDS as CARD_SOURCE_FIELDS, get_card_fields, save_cards
+from horizon.utils.structured_data import get_article_structured_data, get_author_name
+from horizon.utils.taxonomy import TYPE, get_taxonomy
 from horizon.utils.utils import HTMLConverter
 # horizon/models.py
 import os
-from PIL import Image
 from django.db import models
 from django.conf import settings
 from django.core.exceptions import ValidationError
+import json
 import uuid
 import re
+from django.utils import timezone
+
+
+# Derivative formats and the type of their <picture> <source>
+IMAGE_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+# <source> order: browsers use the first type they support
+PICTURE_SOURCE_TYPES = ["image/avif", "image/webp"]
+
+
+def get_picture_sources(sources):
+    """
+    Returns [(type, srcset)] for the `<source>` elements of a `<picture>`, from a dictionary like
+    { "image/webp": { "https://example.com/small.webp": "480w", ... }, ... }
+    """
+    return [
+        (mime_type, ", ".join(f"{url} {width}" for url, width in sources[mime_type].items()))
+        for mime_type in PICTURE_SOURCE_TYPES
+        if sources and sources.get(mime_type)
+    ]
+
+
+def apply_uploaded_image(instance, image, url_field, srcset_field, sources_field, update_fields=None):
+    """
+    Fills the image fields of `instance` from an UploadedImage: the original as the URL, the JPEG
+    derivatives as the srcset and the other formats as <picture> sources.
+    Returns `update_fields` with the image fields added (None stays None).
+    """
+    srcsets = image.get_srcsets()
+    setattr(instance, url_field, image.get_url())
+    setattr(instance, srcset_field, srcsets.pop("image/jpeg", {}))
+    setattr(instance, sources_field, srcsets)
+    if update_fields is None:
+        return None
+    return {*update_fields, url_field, srcset_field, sources_field}
 
 
 class Type(models.Model):
@@ -39,7 +76,18 @@ class Author(models.Model):
     title = models.CharField(max_length=255)
     profile_image = models.URLField(blank=True, null=True)  # Stores image URL
     profile_image_srcset = models.JSONField(blank=True, null=True, default=dict)  # Dynamic srcset field
+    profile_image_sources = models.JSONField(blank=True, null=True, default=dict)  # WebP/AVIF srcsets by type
+    # When set, the profile image fields above are filled from its derivatives on save
+    profile_image_upload = models.ForeignKey(
+        "UploadedImage", on_delete=models.SET_NULL, null=True, blank=True, related_name="profile_of"
+    )
     description = models.TextField()
+    html_description = models.TextField(blank=True, null=True) # Precomputed for Performance
+    html_description_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
+    updated_at = models.DateTimeField(auto_now=True)  # Part of the conditional GET validators of its pages
+
+    # `description` as loaded from the database, see from_db()
+    _loaded_description = None
 
     def __str__(self):
         return f"{self.first_name} {self.middle_name + ' ' if self.middle_name else ''}{self.last_name}"
@@ -59,10 +107,66 @@ class Author(models.Model):
 
         return ", ".join([f"{url} {width}" for url, width in self.profile_image_srcset.items()])
     
+    def get_profile_picture_sources(self):
+        return get_picture_sources(self.profile_image_sources)
+
     def get_html_description(self):
         converter = HTMLConverter()
         return converter.get_html(self.description)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Snapshot the loaded `description` so save() can tell whether it changed.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_description = instance.__dict__.get("description")
+        return instance
+
+    def description_needs_render(self):
+        """
+        Returns True if `html_description` is out of date for the current `description`.
+        A deferred `description` was never loaded or assigned, so it can't have changed.
+        """
+        if "description" not in self.__dict__ or not self.description:
+            return False
+        if self.description == self._loaded_description and self.html_description_hash:
+            return False
+        return HTMLConverter.get_render_hash(self.description) != self.html_description_hash
+
+    def save(self, *args, **kwargs):
+        """
+        Override the save method to update `html_description` only when `description` is changed,
+        and fill the profile image fields from `profile_image_upload`.
+        Partial saves with `update_fields` only touch `html_description` if they include `description`.
+        """
+        if self.profile_image_upload_id:
+            kwargs["update_fields"] = apply_uploaded_image(
+                self, self.profile_image_upload, "profile_image", "profile_image_srcset", "profile_image_sources",
+                kwargs.get("update_fields"),
+            )
+
+        update_fields = kwargs.get("update_fields")
+        if (update_fields is None or "description" in update_fields) and self.description_needs_render():
+            self.html_description = self.get_html_description()
+            self.html_description_hash = HTMLConverter.get_render_hash(self.description)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "html_description", "html_description_hash"}
+
+        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "description" in update_fields:
+            self._loaded_description = self.__dict__.get("description")
+
+
+
+# The fields ContentCard is built from, as update_fields names
+CARD_UPDATE_FIELDS = {field.removesuffix("_id") for field in CARD_SOURCE_FIELDS}
+# The fields copied into the search index (see horizon/utils/search.py)
+SEARCH_FIELDS = ("title", "description", "html_body")
+# The fields Content.structured_data is built from
+STRUCTURED_DATA_FIELDS = {"title", "meta_description", "slug", "type", "author", "published_at", "updated_at", "image_featured"}
 
 
 class Content(models.Model):    
@@ -104,16 +208,37 @@ class Content(models.Model):
     read_time = models.IntegerField(default=1, null=False, blank=False)
     body = models.TextField()
     html_body = models.TextField(blank=True, null=True) # Precomputed for Performance
+    html_body_hash = models.CharField(max_length=64, blank=True, default="", editable=False) # Render hash of `body`
 
     # featured image
     image_featured = models.URLField(blank=True, null=True)  # Stores image URL
     image_featured_srcset = models.JSONField(blank=True, null=True, default=dict)  # Dynamic srcset field
+    image_featured_sources = models.JSONField(blank=True, null=True, default=dict)  # WebP/AVIF srcsets by type
+    # When set, the featured image fields above are filled from its derivatives on save
+    image_featured_upload = models.ForeignKey(
+        "UploadedImage", on_delete=models.SET_NULL, null=True, blank=True, related_name="featured_in"
+    )
     image_caption = models.CharField(max_length=255, null=False, blank=False, default="")
     image_by = models.CharField(max_length=255, null=False, blank=False, default="")
 
     # Publish status
     publish = models.BooleanField(default=False)
 
+    # NewsArticle/Article JSON-LD of the detail page, built on save (see horizon/utils/structured_data.py)
+    structured_data = models.TextField(blank=True, default="", editable=False)
+
+    # Set whenever its related posts are rewritten (see horizon/utils/related_content.py), part of
+    # the conditional GET validators of its page
+    related_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # `body` as loaded from the database, see from_db()
+    _loaded_body = None
+    # The fields copied into the search index as loaded from the database, and whether the last save changed them
+    _loaded_search_fields = None
+    search_fields_changed = True
+    # The fields copied into the card as loaded from the database, see horizon/utils/cards.py
+    _loaded_card_fields = None
+
     # image_featured_srcset
     # {
     #     "https://example.com/small.jpg": "480w",
@@ -121,6 +246,15 @@ class Content(models.Model):
     #     "https://example.com/large.jpg": "1200w",
     # }
 
+    class Meta:
+        indexes = [
+            # The news listing, walked backwards from a cursor (see utils/pagination.py) with ties broken by the implicit id.
+            # Partial, because SQLite can't match `WHERE publish` (how Django filters booleans) to a `publish` column.
+            models.Index(fields=["type", "published_at"], condition=models.Q(publish=True), name="content_type_listing_idx"),
+            # The other listings, walked newest first while probing their categories (views.py)
+            models.Index(fields=["published_at"], condition=models.Q(publish=True), name="content_published_idx"),
+        ]
+
 
     def __str__(self):
         return f"{self.title}"
@@ -140,21 +274,183 @@ class Content(models.Model):
             return ""
 
         return ", ".join([f"{url} {width}" for url, width in self.image_featured_srcset.items()])
+
+    def get_picture_sources(self):
+        return get_picture_sources(self.image_featured_sources)
     
     def get_url_path(self):
         return f"{self.type.name}/{self.slug}"
 
     
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Snapshot the loaded `body` and search fields so save() can tell whether they changed.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_body = instance.__dict__.get("body")
+        instance._loaded_search_fields = instance.get_search_fields()
+        instance._loaded_card_fields = instance.get_card_source_fields()
+        return instance
+
+    def get_card_source_fields(self):
+        # Deferred fields that weren't loaded or assigned are None
+        return tuple(self.__dict__.get(name) for name in CARD_SOURCE_FIELDS)
+
+    def get_search_fields(self):
+        # Deferred fields that weren't loaded or assigned are None
+        return tuple(self.__dict__.get(name) for name in SEARCH_FIELDS)
+
+    def get_author_name(self):
+        # The structured data and the card show the name of the related Author
+        return get_author_name(self.author)
+
+    def get_update_field_names(self, update_fields):
+        """
+        Returns `update_fields` as field names, so `author_id` counts as `author`. None stays None.
+        """
+        if update_fields is None:
+            return None
+        return {self._meta.get_field(name).name for name in update_fields}
+
+    def get_type_name(self):
+        if not self.type_id:
+            return None
+        return (get_taxonomy().get_by_id(TYPE, self.type_id) or self.type).name
+
+    def get_structured_data(self, published_at, modified_at):
+        type_name = self.get_type_name()
+        author_name = self.get_author_name() if type_name else None
+        return get_article_structured_data(self, type_name, author_name, published_at, modified_at)
+
+    def body_needs_render(self):
+        """
+        Returns True if `html_body` is out of date for the current `body`.
+        A deferred `body` was never loaded or assigned, so it can't have changed.
+        """
+        if "body" not in self.__dict__ or not self.body:
+            return False
+        if self.body == self._loaded_body and self.html_body_hash:
+            return False
+        return HTMLConverter.get_render_hash(self.body) != self.html_body_hash
+
     def save(self, *args, **kwargs):
         """
         Override the save method to update `html_body` only when `body` is changed.
+        Partial saves with `update_fields` only touch `html_body` if they include `body`.
         """
-        if self.body:  # Ensure body is not empty
+        if self.image_featured_upload_id:
+            kwargs["update_fields"] = apply_uploaded_image(
+                self, self.image_featured_upload, "image_featured", "image_featured_srcset", "image_featured_sources",
+                kwargs.get("update_fields"),
+            )
+
+        update_fields = self.get_update_field_names(kwargs.get("update_fields"))
+        if (update_fields is None or "body" in update_fields) and self.body_needs_render():
             self.html_body = self.get_html_content()  # Precompute HTML version
-        
+            self.html_body_hash = HTMLConverter.get_render_hash(self.body)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "html_body", "html_body_hash"}
+
+        update_fields = self.get_update_field_names(kwargs.get("update_fields"))
+        if update_fields is None or STRUCTURED_DATA_FIELDS & update_fields:
+            # auto_now(_add) sets the timestamps again in super().save(), microseconds later
+            now = timezone.now()
+            self.structured_data = self.get_structured_data(
+                now if self._state.adding else self.published_at,
+                now if update_fields is None or "updated_at" in update_fields else self.updated_at,
+            )
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "structured_data"}
+
+        search_fields = self.get_search_fields()
+        self.search_fields_changed = self._state.adding or search_fields != self._loaded_search_fields
+        update_card = self.get_card_source_fields() != self._loaded_card_fields and (
+            update_fields is None or CARD_UPDATE_FIELDS & update_fields
+        )
+
         super().save(*args, **kwargs)  # Call Django's default save method
 
+        if update_card:
+            # After super().save(), which sets `published_at` on new contents
+            save_cards([ContentCard(content_id=self.pk, **get_card_fields(self, self.get_type_name(), self.get_author_name()))])
+            self._loaded_card_fields = self.get_card_source_fields()
+
+        # The snapshots follow the database: fields left out of `update_fields` keep their loaded value
+        written = self.get_update_field_names(kwargs.get("update_fields"))
+        if written is None or "body" in written:
+            self._loaded_body = self.__dict__.get("body")
+        self._loaded_search_fields = tuple(
+            new if written is None or name in written else old
+            for name, new, old in zip(SEARCH_FIELDS, search_fields, self._loaded_search_fields or (None,) * len(SEARCH_FIELDS))
+        )
+
+
+class ContentCard(models.Model):
+    """
+    What an article card shows, denormalized from a Content, its type and its author, so listings
+    read one narrow row per card. Kept in sync by Content.save() and the signals, see horizon/utils/cards.py.
+    """
+    content = models.OneToOneField(Content, on_delete=models.CASCADE, primary_key=True, related_name="card")
+    # Not indexed: the listings go through the partial indexes below
+    type = models.ForeignKey(Type, on_delete=models.DO_NOTHING, null=True, db_constraint=False, db_index=False, related_name="+")
+    author = models.ForeignKey(Author, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name="+")
+    title = models.CharField(max_length=255)
+    slug = models.SlugField(max_length=50, db_index=False)
+    description = models.CharField(max_length=255)
+    published_at = models.DateTimeField()
+    publish = models.BooleanField()
+    image_featured = models.URLField(blank=True, null=True)
+    image_caption = models.CharField(max_length=255)
+    type_name = models.CharField(max_length=50)
+    author_name = models.CharField(max_length=201)
+    url_path = models.CharField(max_length=255)  # As reversed by `content_detail_path_name`, "" without a type
+    srcset = models.TextField()  # JPEG derivatives, the `srcset` attribute of the <img>
+    avif_srcset = models.TextField()
+    webp_srcset = models.TextField()
+    # Set whenever the card is written, the version of its cached fragments (see horizon/utils/fragment_cache.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The listing indexes of Content.Meta. The primary key is a BIGINT, not an alias of the rowid
+            # SQLite appends to index entries, so it is listed to break published_at ties in index order.
+            models.Index(fields=["type", "published_at", "content"], condition=models.Q(publish=True), name="card_type_listing_idx"),
+            models.Index(fields=["published_at", "content"], condition=models.Q(publish=True), name="card_published_idx"),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def get_picture_sources(self):
+        """
+        Returns [(type, srcset)] for the `<source>` elements of the card's `<picture>`.
+        """
+        srcsets = {"image/avif": self.avif_srcset, "image/webp": self.webp_srcset}
+        return [(mime_type, srcsets[mime_type]) for mime_type in PICTURE_SOURCE_TYPES if srcsets[mime_type]]
+
+
+class RelatedContent(models.Model):
+    """
+    Precomputed related posts for a content, ranked by `score`.
+    Maintained by horizon.utils.related_content (signals and the rebuild_related_content command).
+    """
+    content = models.ForeignKey(Content, on_delete=models.CASCADE, related_name="related_content")
+    related = models.ForeignKey(Content, on_delete=models.CASCADE, related_name="related_to")
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["content", "related"], name="unique_related_content"),
+        ]
+        indexes = [
+            models.Index(fields=["content", "-score"], name="related_content_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.content_id} -> {self.related_id} ({self.score:.2f})"
+
 
 def validate_jpg_and_size(file):
     # Check file extension (only allow .jpg)
@@ -178,6 +474,12 @@ def image_upload_to(instance, filename):
 
 
 class UploadedImage(models.Model):
+    class DerivativesStatus(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
     title = models.CharField(max_length=200, blank=True)
     # uploaded_to = models.CharField(max_length=500, editable=False, blank=True) # Auto populates in "image_upload_to" method
     image = models.ImageField(
@@ -185,81 +487,92 @@ class UploadedImage(models.Model):
         validators=[validate_jpg_and_size]
     )
 
+    # Resized versions are generated by the process_image_jobs worker (see horizon/utils/image_jobs.py)
+    derivatives_status = models.CharField(
+        max_length=20, choices=DerivativesStatus.choices, default=DerivativesStatus.PENDING, editable=False, db_index=True
+    )
+    derivatives_error = models.TextField(blank=True, editable=False)
+    derivatives_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    # When a pending job may be retried, or when a claimed job is considered abandoned
+    derivatives_retry_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Manifest of the resized versions: [{"width", "height", "format", "name", "bytes", "checksum"}], written by
+    # the worker and reconcile_image_derivatives. `name` is relative to the storage like `image`
+    derivatives = models.JSONField(default=list, blank=True, editable=False)
+
+    # `image` name as loaded from the database, see from_db()
+    _loaded_image = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = instance.__dict__.get("image")
+        return instance
+
     def save(self, *args, **kwargs):
-        # Save the original image first.
+        # A new or replaced image queues a derivatives job instead of resizing inside the request.
+        image_changed = self._state.adding or self.image.name != self._loaded_image
+        if image_changed:
+            self.derivatives_status = self.DerivativesStatus.PENDING
+            self.derivatives_error = ""
+            self.derivatives_attempts = 0
+            self.derivatives_retry_at = None
+            self.derivatives = []
+
         super().save(*args, **kwargs)
-        
-        # Define the target widths.
-        widths = [100, 400, 800, 1200, 1600]
-        
-        # Open the image to determine its original dimensions.
-        with Image.open(self.image.path) as img:
-            orig_width, orig_height = img.size
-        
-        # Generate resized versions for each target width.
-        for width in widths:
-            # Calculate the new height preserving the aspect ratio.
-            new_height = int(orig_height * width / orig_width)
-            new_size = (width, new_height)
-            self._create_resized_image(new_size)
-
-
-    def _create_resized_image(self, size):
+        self._loaded_image = self.image.name
+
+        if image_changed and getattr(settings, "IMAGE_DERIVATIVES_INLINE", False):
+            from horizon.utils.image_jobs import process_image_job
+            process_image_job(self.pk)
+            self.refresh_from_db(fields=[
+                "derivatives_status", "derivatives_error", "derivatives_attempts", "derivatives_retry_at", "derivatives",
+            ])
+
+    def get_url(self, name=None):
         """
-        Creates a resized version of the original image.
-        The resized image is stored in the same folder as the original image,
-        with a filename suffix indicating its dimensions.
+        Returns the absolute URL of the original image, or of one of its derivatives.
         """
-        # Full path to the original image.
-        orig_path = self.image.path
-        # Get the folder where the image is stored.
-        folder = os.path.dirname(orig_path)
-        # Get the base filename (without extension) and the extension.
-        base, ext = os.path.splitext(os.path.basename(orig_path))
-        # Construct the filename for the resized image.
-        resized_filename = f"{base}_{size[0]}x{size[1]}{ext}"
-        resized_path = os.path.join(folder, resized_filename)
-
-        quality = 50
-        if size[0] == 100:
-            quality = 100
-        
-        if size[0] == 400:
-            quality = 80
-        
-        # If the resized file doesn't already exist, create it.
-        if not os.path.exists(resized_path):
-            try:
-                with Image.open(orig_path) as img:
-                    # Resize using a high-quality downsampling filter.
-                    resized_img = img.resize(size, Image.Resampling.LANCZOS)
-                    resized_img.save(resized_path, quality=quality)
-            except Exception as e:
-                # Optionally log the error here.
-                print(f"[IMAGE][_create_resized_image] exception={str(e)}")
-                pass
+        return settings.SITE_URL + self.image.storage.url(name or self.image.name)
 
+    def get_srcsets(self):
+        """
+        Returns the srcset of every derivative format, e.g.
+        { "image/webp": { "https://example.com/media/.../photo_400x266.webp": "400w", ... }, ... }
+        """
+        srcsets = {}
+        for derivative in sorted(self.derivatives, key=lambda derivative: derivative["width"]):
+            mime_type = IMAGE_MIME_TYPES[derivative["format"]]
+            srcsets.setdefault(mime_type, {})[self.get_url(derivative["name"])] = f"{derivative['width']}w"
+        return srcsets
+
+    def update_attached(self):
+        """
+        Refreshes the image fields of the contents and authors using this image.
+        save() is used so the page cache and the static export see the change.
+        """
+        for content in self.featured_in.all():
+            content.save(update_fields=["updated_at"])
+        for author in self.profile_of.all():
+            author.save(update_fields=["updated_at"])
 
     def available_resized_images(self):
         """
-        Scans the folder where the original image is stored and returns a comma-separated list
-        of all file names that match the resized image pattern. Here, it simply lists all files
-        in the same folder that start with the original base filename followed by an underscore.
+        Lists the resized versions recorded in the derivatives manifest, one per line.
         """
-        try:
-            # Get the folder where the image is stored.
-            image_folder = os.path.dirname(self.image.path)
-            # Get the base filename (without extension) of the original image.
-            base_filename, _ = os.path.splitext(os.path.basename(self.image.path))
-            # List all files in the folder that start with the base filename plus an underscore.
-            all_files = os.listdir(image_folder)
-            resized_files = [filename for filename in all_files if filename.startswith(f"{base_filename}_")]
-            return '\n'.join(resized_files)
-        except Exception as e:
-            # Optionally log the error.
-            return f"[IMAGE] ERROR: {str(e)}"
+        return "\n".join(
+            f"{os.path.basename(entry['name'])} ({entry['width']}x{entry['height']} {entry['format']}, "
+            f"{entry['bytes'] / 1024:.1f} KB, sha256 {entry['checksum'][:12]})"
+            for entry in self.derivatives
+        )
     available_resized_images.short_description = "Available Sizes"
 
+    def derivatives_summary(self):
+        if not self.derivatives:
+            return "-"
+        total = sum(entry["bytes"] for entry in self.derivatives)
+        return f"{len(self.derivatives)} files, {total / 1024:.1f} KB"
+    derivatives_summary.short_description = "Resized Versions"
+
     # # USED IN ADMIN
     # def get_uploaded_folder(self):
     #     return self.uploaded_to
@@ -1,8 +1,16 @@
 import os
 import shutil
-from django.db.models.signals import post_delete
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import UploadedImage
+from .models import Author, Category, Content, Tag, Type, UploadedImage
+from .utils.conditional import invalidate_listings
+from .utils.page_cache import invalidate_page_dependencies, is_page_cache_enabled
+from .utils.related_content import recompute_related_content, update_related_content
+from .utils.search import index_contents, remove_contents
+from .utils.cards import refresh_cards
+from .utils.structured_data import refresh_structured_data
+from .utils.taxonomy import invalidate_taxonomy
 
 # Register this in apps.py
 @receiver(post_delete, sender=UploadedImage)
@@ -14,3 +22,276 @@ def delete_uploaded_folder(sender, instance, **kwargs):
     image_folder = os.path.dirname(instance.image.path)
     if os.path.exists(image_folder):
         shutil.rmtree(image_folder)
+
+
+# Fields that change which contents are related to a content
+RELATED_CONTENT_FIELDS = {"type", "publish", "published_at"}
+
+
+def _schedule_related_content_update(content_ids):
+    for content_id in content_ids:
+        transaction.on_commit(lambda content_id=content_id: update_related_content(content_id))
+
+
+@receiver(post_save, sender=Content)
+def update_related_content_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Updates the related content index after a content is saved.
+    """
+    if raw or (update_fields is not None and not RELATED_CONTENT_FIELDS & set(update_fields)):
+        return
+    _schedule_related_content_update([instance.pk])
+
+
+@receiver(m2m_changed, sender=Content.categories.through)
+@receiver(m2m_changed, sender=Content.tags.through)
+def update_related_content_on_terms_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Updates the related content index after the categories or tags of a content change,
+    from either side of the relation.
+    """
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        _schedule_related_content_update([instance.pk])
+    elif reverse and action in ("post_add", "post_remove"):
+        _schedule_related_content_update(pk_set)
+    elif reverse and action == "pre_clear":
+        _schedule_related_content_update(list(instance.contents.values_list("pk", flat=True)))
+
+
+@receiver(pre_delete, sender=Content)
+def update_related_content_on_delete(sender, instance, **kwargs):
+    """
+    Recomputes the related lists that include a content once it is deleted.
+    """
+    listing_ids = list(instance.related_to.values_list("content_id", flat=True))
+    transaction.on_commit(lambda: recompute_related_content(listing_ids))
+
+
+@receiver(post_save, sender=Type)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Type)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Category)
+def invalidate_taxonomy_on_change(sender, instance, **kwargs):
+    """
+    Reloads the taxonomy registry of every worker, see horizon.utils.taxonomy.
+    """
+    invalidate_taxonomy()
+
+
+# Structured data and cards. Content.save() rebuilds them; renaming an author or a type changes them
+# for all their contents.
+
+@receiver(pre_save, sender=Author)
+@receiver(pre_save, sender=Type)
+def snapshot_name_for_denormalized_fields(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    fields = ("first_name", "last_name") if sender is Author else ("name",)
+    instance._denormalized_old_name = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Type)
+def refresh_denormalized_fields_on_rename(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    fields = ("first_name", "last_name") if sender is Author else ("name",)
+    if getattr(instance, "_denormalized_old_name", None) != tuple(getattr(instance, field) for field in fields):
+        refresh_structured_data(instance.contents.all())
+        refresh_cards(instance.contents.all())
+
+
+# Search index. Rows are updated in the same transaction as the change.
+
+@receiver(post_save, sender=Content)
+def update_search_index_on_save(sender, instance, raw=False, **kwargs):
+    if raw or not instance.search_fields_changed:
+        return
+    index_contents([instance.pk])
+
+
+@receiver(m2m_changed, sender=Content.categories.through)
+@receiver(m2m_changed, sender=Content.tags.through)
+def update_search_index_on_terms_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Reindexes the contents whose categories or tags changed, from either side of the relation.
+    """
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        index_contents([instance.pk])
+    elif reverse and action in ("post_add", "post_remove"):
+        index_contents(pk_set)
+    elif reverse and action == "pre_clear":
+        instance._search_content_ids = list(instance.contents.values_list("pk", flat=True))
+    elif reverse and action == "post_clear":
+        index_contents(getattr(instance, "_search_content_ids", []))
+
+
+@receiver(post_delete, sender=Content)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    remove_contents([instance.pk])
+
+
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Category)
+def snapshot_term_name_for_search(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._search_old_name = sender.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+def update_search_index_on_term_renamed(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created or getattr(instance, "_search_old_name", instance.name) == instance.name:
+        return
+    index_contents(instance.contents.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Category)
+def snapshot_term_contents_for_search(sender, instance, **kwargs):
+    instance._search_content_ids = list(instance.contents.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Category)
+def update_search_index_on_term_deleted(sender, instance, **kwargs):
+    index_contents(instance._search_content_ids)
+
+
+# Listing validators (see horizon.utils.conditional): any change a listing can show bumps them.
+
+@receiver(post_save, sender=Content)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Type)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Content)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Type)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Category)
+def invalidate_listings_on_change(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_listings()
+
+
+@receiver(m2m_changed, sender=Content.categories.through)
+@receiver(m2m_changed, sender=Content.tags.through)
+def invalidate_listings_on_terms_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_listings()
+
+
+# Page cache invalidation. These receivers are connected after the related content ones,
+# so their on_commit callbacks run once the related content index is up to date.
+
+def _schedule_page_invalidation(dependencies):
+    dependencies = set(dependencies)
+    if dependencies and is_page_cache_enabled():
+        transaction.on_commit(lambda: invalidate_page_dependencies(dependencies))
+
+
+def _get_listing_dependencies(content):
+    """
+    Returns the dependencies of every listing a published content can appear in.
+    """
+    dependencies = {"content-list"}
+    if content.type_id:
+        dependencies.add(f"type:{Type.objects.get(pk=content.type_id).name}")
+    dependencies.update(f"tag:{name}" for name in content.tags.values_list("name", flat=True))
+    dependencies.update(f"category:{name}" for name in content.categories.values_list("name", flat=True))
+    return dependencies
+
+
+@receiver(pre_save, sender=Content)
+def snapshot_content_for_page_cache(sender, instance, raw=False, **kwargs):
+    if raw or not is_page_cache_enabled():
+        return
+    instance._page_cache_snapshot = Content.objects.filter(pk=instance.pk).values("publish", "type_id", "published_at").first()
+
+
+@receiver(post_save, sender=Content)
+def invalidate_pages_on_content_save(sender, instance, raw=False, **kwargs):
+    """
+    Invalidates the pages showing a content. Listings are invalidated too when the content
+    enters, leaves or moves within them.
+    """
+    if raw or not is_page_cache_enabled():
+        return
+    dependencies = {f"content:{instance.pk}"}
+    old = getattr(instance, "_page_cache_snapshot", None)
+
+    if (old and old["publish"]) or instance.publish:
+        new = {"publish": instance.publish, "type_id": instance.type_id, "published_at": instance.published_at}
+        if old != new:
+            dependencies |= _get_listing_dependencies(instance)
+            if old and old["type_id"] != instance.type_id and old["type_id"]:
+                dependencies.add(f"type:{Type.objects.get(pk=old['type_id']).name}")
+
+    _schedule_page_invalidation(dependencies)
+
+
+@receiver(m2m_changed, sender=Content.categories.through)
+@receiver(m2m_changed, sender=Content.tags.through)
+def invalidate_pages_on_terms_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Invalidates the listings of the categories/tags a content was added to or removed from.
+    """
+    if not is_page_cache_enabled():
+        return
+    prefix = "category" if sender is Content.categories.through else "tag"
+
+    if reverse and action in ("post_add", "post_remove", "pre_clear"):
+        _schedule_page_invalidation([f"{prefix}:{instance.name}"])
+    elif not reverse and action in ("post_add", "post_remove"):
+        _schedule_page_invalidation(f"{prefix}:{name}" for name in model.objects.filter(pk__in=pk_set).values_list("name", flat=True))
+    elif not reverse and action == "pre_clear":
+        terms = instance.categories if prefix == "category" else instance.tags
+        _schedule_page_invalidation(f"{prefix}:{name}" for name in terms.values_list("name", flat=True))
+
+
+@receiver(pre_delete, sender=Content)
+def invalidate_pages_on_content_delete(sender, instance, **kwargs):
+    if not is_page_cache_enabled():
+        return
+    dependencies = {f"content:{instance.pk}"}
+    if instance.publish:
+        dependencies |= _get_listing_dependencies(instance)
+    _schedule_page_invalidation(dependencies)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_pages_on_author_change(sender, instance, **kwargs):
+    _schedule_page_invalidation([f"author:{instance.pk}"])
+
+
+@receiver(pre_save, sender=Type)
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Category)
+def snapshot_term_name_for_page_cache(sender, instance, raw=False, **kwargs):
+    if raw or not is_page_cache_enabled():
+        return
+    instance._page_cache_old_name = sender.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+
+
+@receiver(post_save, sender=Type)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Type)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Category)
+def invalidate_pages_on_term_change(sender, instance, **kwargs):
+    """
+    Invalidates the pages filtered by a type, tag or category, under its old and new name.
+    Renaming a type also changes the URL of its contents, so their detail pages are invalidated.
+    """
+    prefix = sender.__name__.lower()
+    old_name = getattr(instance, "_page_cache_old_name", None)
+    names = {instance.name, old_name} - {None}
+    _schedule_page_invalidation(f"{prefix}:{name}" for name in names)
+
+    if sender is Type and old_name and old_name != instance.name:
+        _schedule_page_invalidation(f"content:{pk}" for pk in instance.contents.values_list("pk", flat=True))
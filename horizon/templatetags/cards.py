@@ -0,0 +1,14 @@
+from django import template
+
+from horizon.utils.fragment_cache import render_cards as render_card_fragments
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def render_cards(cards, template_name, with_age=False):
+    """
+    Renders a listing of cards from their cached fragments: {% render_cards cards "horizon/cards/related.html" %}
+    """
+    return render_card_fragments(template_name, cards, with_age)
@@ -1,3 +1,1400 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+import brotli
+from PIL import Image
+
+from horizon.checks import check_page_cache_backend
+from horizon.management.commands.benchmark_html_converter import build_body
+from horizon.models import Author, Category, Content, ContentCard, Tag, Type, UploadedImage
+from horizon.utils import fragment_cache, image_jobs, image_resize, images, search, sitemaps, taxonomy
+from horizon.utils.compression import choose_encoding
+from horizon.utils.page_cache import get_page_cache_stats
+from horizon.utils.pagination import CursorPaginator, encode_cursor
+from horizon.utils.query_budget import record_queries
+from horizon.utils.query_plans import audit_view, get_audited_pages
+from horizon.utils.related_content import rebuild_related_content
+from horizon.utils.sections import Section, compose_sections
+from horizon.utils.structured_data import WEBSITE_STRUCTURED_DATA
+from horizon.utils.taxonomy import CATEGORY, TAG, TYPE, get_taxonomy
+from horizon.utils.utils import HTMLConverter
+from horizon.views import content_detail, home, news_type_page, products_category_page
+
+
+class VersionFilesMixin:
+    """
+    Points the taxonomy and listings version files at a temporary directory for the test class,
+    instead of their folders under BASE_DIR.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.version_dir = tempfile.mkdtemp()
+        cls.version_files = override_settings(
+            TAXONOMY_VERSION_FILE=os.path.join(cls.version_dir, "taxonomy"),
+            LISTINGS_VERSION_FILE=os.path.join(cls.version_dir, "listings"),
+        )
+        cls.version_files.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.version_files.disable()
+        shutil.rmtree(cls.version_dir)
+
+
+class HTMLConverterTests(SimpleTestCase):
+    def setUp(self):
+        self.converter = HTMLConverter()
+
+    def assertSameAsMultipass(self, document):
+        self.assertEqual(self.converter.get_html(document), self.converter.get_html_multipass(document))
+
+    def test_single_pass_matches_multipass(self):
+        document = build_body(5_000)
+        self.assertIsNotNone(self.converter.compile_html(document))
+        self.assertSameAsMultipass(document)
+
+    def test_nested_blocks(self):
+        document = '{p Some {b bold {a link href="https://example.com" target="_blank" a} b} text p}'
+        self.assertIsNotNone(self.converter.compile_html(document))
+        self.assertSameAsMultipass(document)
+
+    def test_ul_keeps_only_li_items(self):
+        document = '{ul\n  {li one li}\n  stray text\n  {li {b two b} li}\nul}'
+        self.assertEqual(
+            self.converter.get_html(document),
+            '<ul class="list-disc list-inside text-gray-800 space-y-2 mb-8">'
+            '<li class="ml-6 list-disc">one</li><li class="ml-6 list-disc"><strong>two</strong></li></ul>',
+        )
+
+    def test_irregular_markup_falls_back_to_multipass(self):
+        for document in (
+            '{p outer {p inner p} p}',
+            '{p unclosed {b bold p} b}',
+            '{b b} then {b real b}',
+            '{img src="a.jpg" alt="{b x b}" img}',
+            'text a} and {ul',
+        ):
+            with self.subTest(document=document):
+                self.assertIsNone(self.converter.compile_html(document))
+                self.assertSameAsMultipass(document)
+
+
+class RerenderHTMLCommandTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="{p Bio p}")
+        self.content = Content.objects.create(title="Post", slug="post", author=self.author, body="{p Hello p}")
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), "checkpoint.json")
+
+    def rerender(self, *args):
+        out = StringIO()
+        call_command("rerender_html", "--workers=1", f"--checkpoint={self.checkpoint}", *args, stdout=out)
+        return out.getvalue()
+
+    def test_skips_rows_with_unchanged_hash(self):
+        self.assertIn("Content: 0 rendered, 1 unchanged", self.rerender())
+
+    def test_rerenders_stale_rows(self):
+        Content.objects.filter(pk=self.content.pk).update(html_body="stale", html_body_hash="")
+        Author.objects.filter(pk=self.author.pk).update(html_description="stale", html_description_hash="")
+
+        output = self.rerender()
+
+        self.assertIn("Content: 1 rendered, 0 unchanged", output)
+        self.content.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.content.html_body, self.content.get_html_content())
+        self.assertEqual(self.author.html_description, self.author.get_html_description())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_rerender_updates_what_save_maintains(self):
+        Content.objects.filter(pk=self.content.pk).update(html_body="<p>Stale</p>", html_body_hash="")
+        search.index_contents([self.content.pk])
+        updated_at = Content.objects.get(pk=self.content.pk).updated_at
+
+        with mock.patch("horizon.utils.bulk_updates.invalidate_page_dependencies") as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.rerender("--skip-authors")
+
+        self.assertGreater(Content.objects.get(pk=self.content.pk).updated_at, updated_at)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT body FROM {search.SEARCH_TABLE} WHERE rowid = %s", [self.content.pk])
+            self.assertEqual(cursor.fetchone(), ("Hello",))
+        self.assertEqual(set(invalidate.call_args.args[0]), {f"content:{self.content.pk}"})
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, "w") as f:
+            json.dump({"filters": {"type": None, "tag": None, "category": None, "published_only": False,
+                                   "skip_authors": False}, "last_ids": {"Content": self.content.pk}}, f)
+        Content.objects.filter(pk=self.content.pk).update(html_body_hash="")
+
+        self.assertIn("Content: 0 rendered, 0 unchanged", self.rerender())
+
+
+class ContentSaveTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+
+    def count_conversions(self):
+        return mock.patch.object(HTMLConverter, "get_html", autospec=True, side_effect=HTMLConverter.get_html)
+
+    def test_converts_only_when_body_changes(self):
+        with self.count_conversions() as get_html:
+            content = Content.objects.create(title="Post", slug="post", author=self.author, body="{p One p}")
+            self.assertEqual(get_html.call_count, 1)
+
+            content.publish = True
+            content.save()
+            self.assertEqual(get_html.call_count, 1)
+
+            content = Content.objects.get(pk=content.pk)
+            content.title = "Renamed"
+            content.save()
+            self.assertEqual(get_html.call_count, 1)
+
+            content.body = "{p Two p}"
+            content.save()
+            self.assertEqual(get_html.call_count, 2)
+
+        self.assertIn("Two", Content.objects.get(pk=content.pk).html_body)
+
+    def test_update_fields_without_body_never_touches_html_body(self):
+        news = Type.objects.create(name="news")
+        content = Content.objects.create(title="Post", slug="post", type=news, author=self.author, body="{p One p}")
+        Content.objects.filter(pk=content.pk).update(html_body="kept")
+
+        with self.count_conversions() as get_html:
+            content = Content.objects.get(pk=content.pk)
+            content.body = "{p Two p}"
+            content.publish = True
+            content.save(update_fields=["publish"])
+            self.assertEqual(get_html.call_count, 0)
+
+            content = Content.objects.defer("body").get(pk=content.pk)
+            content.publish = False
+            with self.assertNumQueries(3):  # The author, the content and its card
+                content.save()
+            self.assertEqual(get_html.call_count, 0)
+
+        self.assertEqual(Content.objects.get(pk=content.pk).html_body, "kept")
+
+    def test_update_fields_with_body_updates_html_body(self):
+        content = Content.objects.create(title="Post", slug="post", author=self.author, body="{p One p}")
+
+        with self.count_conversions() as get_html:
+            content.body = "{p Two p}"
+            content.save(update_fields=["body"])
+            self.assertEqual(get_html.call_count, 1)
+
+        self.assertIn("Two", Content.objects.get(pk=content.pk).html_body)
+
+    def test_body_left_out_of_update_fields_is_rendered_when_saved(self):
+        content = Content.objects.create(title="Post", slug="post", author=self.author, body="{p One p}")
+        content = Content.objects.get(pk=content.pk)
+        content.body = "{p Two p}"
+        content.save(update_fields=["title"])  # Doesn't write the body
+        content.save(update_fields=["body"])
+
+        stored = Content.objects.get(pk=content.pk)
+        self.assertEqual(stored.body, "{p Two p}")
+        self.assertIn("Two", stored.html_body)
+        self.assertFalse(stored.body_needs_render())
+
+    def test_fields_left_out_of_update_fields_are_indexed_when_saved(self):
+        content = Content.objects.create(title="Post", slug="post", author=self.author, body="{p One p}", publish=True)
+        content = Content.objects.get(pk=content.pk)
+        content.title = "Renamed"
+        content.save(update_fields=["publish"])
+        content.save(update_fields=["title"])
+        self.assertTrue(content.search_fields_changed)  # The title wasn't indexed by the first save
+
+    def test_author_converts_only_when_description_changes(self):
+        with self.count_conversions() as get_html:
+            author = Author.objects.get(pk=self.author.pk)
+            author.save(update_fields=["updated_at"])
+            author.title = "Senior Editor"
+            author.save()
+            self.assertEqual(get_html.call_count, 0)
+
+            author.description = "{p New bio p}"
+            author.save(update_fields=["title"])  # Doesn't write the description
+            self.assertEqual(get_html.call_count, 0)
+            author.save(update_fields=["description"])
+            self.assertEqual(get_html.call_count, 1)
+
+        self.assertIn("New bio", Author.objects.get(pk=self.author.pk).html_description)
+
+
+class QueryBudgetMixin:
+    """
+    Runs a view and fails if it goes over the budget declared with @query_budget,
+    or repeats a query.
+    """
+
+    def assertWithinQueryBudget(self, view, path="/", **view_kwargs):
+        get_taxonomy()  # Loaded once per process, not per request
+        request = RequestFactory().get(path)
+        with record_queries() as recorder:
+            response = view(request, **view_kwargs)
+        self.assertEqual(response.status_code, 200)
+        queries = "\n".join(sql for sql, _, _ in recorder.queries)
+        self.assertLessEqual(recorder.count, view.query_budget, f"{view.__name__} went over its query budget:\n{queries}")
+        self.assertEqual(recorder.duplicates, 0, f"{view.__name__} repeated queries:\n{queries}")
+        return recorder
+
+
+class ViewQueryBudgetTests(VersionFilesMixin, QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        news = Type.objects.create(name="news")
+        review = Type.objects.create(name="review")
+        tags = [Tag.objects.create(name=name) for name in ("Home Main", "Home Featured", "Top News", "Category Main", "Category Featured")]
+        categories = [Category.objects.create(name=name) for name in ("products", "hardware", "devices", "wearables", "assistants")]
+        authors = [Author.objects.create(first_name=f"First{i}", last_name="Last", title="Editor", description="Bio") for i in range(3)]
+
+        for i in range(12):
+            content = Content.objects.create(
+                title=f"Post {i}", slug=f"post-{i}", type=news if i % 2 else review, author=authors[i % 3],
+                body="{p Body p}", publish=True, image_featured_srcset={f"https://example.com/{i}.jpg": "400w"},
+            )
+            content.tags.set(tags)
+            content.categories.set(categories)
+        cls.content = content
+
+    def test_home(self):
+        self.assertWithinQueryBudget(home)
+
+    def test_news_type_page(self):
+        self.assertWithinQueryBudget(news_type_page)
+        cursor = CursorPaginator(Content.objects.filter(type__name="news", publish=True), 4).get_cursors()[0]
+        self.assertWithinQueryBudget(news_type_page, f"/news/?after={cursor}")
+
+    def test_content_detail(self):
+        self.assertWithinQueryBudget(content_detail, type=self.content.type.name, slug=self.content.slug)
+
+    def test_products_category_page(self):
+        self.assertWithinQueryBudget(products_category_page)
+
+    def test_query_plans(self):
+        pages = get_audited_pages()
+        self.assertEqual(len(pages), 7)  # Both listings have a second page
+        for view, path, view_kwargs in pages:
+            for sql, _, steps, problems in audit_view(view, path, **view_kwargs):
+                self.assertEqual(problems, [], f"{path}: {sql}\n" + "\n".join(steps))
+
+    @override_settings(DEBUG=True)
+    def test_middleware_emits_headers_in_debug(self):
+        response = self.client.get("/")
+        self.assertEqual(response["X-DB-Query-Budget"], str(home.query_budget))
+        self.assertLessEqual(int(response["X-DB-Query-Count"]), home.query_budget)
+        self.assertIn("X-DB-Rows", response)
+
+    def test_middleware_is_silent_without_debug(self):
+        self.assertNotIn("X-DB-Query-Count", self.client.get("/"))
+
+
+class CursorPaginationTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        self.contents = [
+            Content.objects.create(title=f"Post {i}", slug=f"post-{i}", author=author, body="{p x p}", publish=True)
+            for i in range(9)
+        ]
+        # Ties on published_at are ordered by id
+        Content.objects.filter(pk__in=[content.pk for content in self.contents[3:6]]).update(published_at=timezone.now())
+        self.paginator = CursorPaginator(Content.objects.all(), 4)
+
+    def test_walks_every_page_both_ways(self):
+        expected = list(Content.objects.order_by("-published_at", "-pk"))
+        pages = [self.paginator.get_page()]
+        while pages[-1].has_next:
+            with self.assertNumQueries(2):
+                pages.append(self.paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([content for page in pages for content in page], expected)
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        self.assertEqual(self.paginator.get_cursors(), [page.next_cursor for page in pages[:-1]])
+
+        self.assertTrue(pages[0].is_first)
+        self.assertIsNone(pages[1].previous_cursor)  # Back to the first page
+        previous = self.paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(previous.object_list, pages[1].object_list)
+        self.assertEqual(previous.next_cursor, pages[1].next_cursor)
+
+    def test_invalid_cursor_is_the_first_page(self):
+        self.assertTrue(self.paginator.get_page("not-a-cursor").is_first)
+
+
+class SectionTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        self.products, self.hardware, self.devices = (Category.objects.create(name=name) for name in ("products", "hardware", "devices"))
+        self.featured, self.hidden = Tag.objects.create(name="Featured"), Tag.objects.create(name="Hidden")
+        self.contents = []
+        for i, (categories, tags) in enumerate((
+            ([self.products, self.hardware], [self.featured]),
+            ([self.products, self.devices], [self.featured]),
+            ([self.products, self.hardware], [self.featured, self.hidden]),
+            ([self.products, self.hardware], []),
+            ([self.hardware], [self.featured]),
+        )):
+            content = Content.objects.create(title=f"Post {i}", slug=f"post-{i}", author=author, body="{p x p}", publish=True)
+            content.categories.set(categories)
+            content.tags.set(tags)
+            self.contents.append(content)
+        Content.objects.create(title="Draft", slug="draft", author=author, body="{p x p}").tags.set([self.featured])
+        get_taxonomy()
+
+    def compose(self, **sections):
+        return {name: [content.pk for content in contents] for name, contents in compose_sections(Content.objects.all(), sections).items()}
+
+    def test_partitions_the_candidates(self):
+        ids = [content.pk for content in self.contents]
+        with self.assertNumQueries(3):
+            sections = self.compose(
+                featured=Section(include_categories=["products"], include_tags=["Featured"], exclude_tags=["Hidden"]),
+                hardware=Section(include_categories=["products"], filter_categories=["hardware"], include_tags=["Featured"], limit=1),
+                devices=Section(include_categories=["products"], filter_categories=["devices"], exclude_categories=["hardware"]),
+                products=Section(include_categories=["products"], limit=2),
+                latest=Section(limit=2),
+                empty=Section(include_tags=["Missing"]),
+            )
+        self.assertEqual(sections, {
+            "featured": [ids[1], ids[0]],
+            "hardware": [ids[2]],
+            "devices": [ids[1]],
+            "products": [ids[3], ids[2]],
+            "latest": [ids[4], ids[3]],
+            "empty": [],
+        })
+
+    def test_matches_the_filtered_querysets(self):
+        from horizon.views import _get_filtered_content
+
+        for kwargs in (
+            {"include_categories": ["products"], "include_tags": ["Featured"]},
+            {"include_categories": ["products", "hardware"], "filter_categories": ["hardware"], "exclude_tags": ["Hidden"]},
+            {"include_categories": ["hardware"], "exclude_categories": ["devices"], "limit": 2},
+        ):
+            limit = kwargs.pop("limit", None)
+            expected = [content.pk for content in _get_filtered_content(**kwargs).order_by("-published_at", "-pk")[:limit]]
+            kwargs["limit"] = limit
+            self.assertEqual(self.compose(section=Section(**kwargs))["section"], expected, kwargs)
+
+    @mock.patch("horizon.utils.sections.CANDIDATES_PER_SLOT", 1)
+    def test_reads_a_bounded_number_of_candidates(self):
+        ids = [content.pk for content in self.contents]
+        with self.assertNumQueries(2):
+            self.assertEqual(self.compose(featured=Section(include_tags=["Featured"], limit=2)), {"featured": [ids[4], ids[2]]})
+
+        # The newest candidate isn't in "products": the section reads every candidate instead
+        with self.assertNumQueries(3):
+            sections = self.compose(featured=Section(include_categories=["products"], include_tags=["Featured"], exclude_tags=["Hidden"], limit=1))
+        self.assertEqual(sections, {"featured": [ids[1]]})
+
+    def test_section_without_terms_needs_a_limit(self):
+        with self.assertRaises(ValueError):
+            Section()
+
+
+class TaxonomyTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        self.news = Type.objects.create(name="news")
+        self.tag = Tag.objects.create(name="Top News")
+        self.category = Category.objects.create(name="products")
+
+    def test_lookups_dont_query_once_loaded(self):
+        with self.assertNumQueries(1):
+            get_taxonomy()
+        with self.assertNumQueries(0):
+            registry = get_taxonomy()
+            self.assertEqual(registry.get(TYPE, "news"), self.news)
+            self.assertEqual(registry.get_ids(TAG, ["Top News", "Missing"]), [self.tag.pk])
+            self.assertEqual(registry.get_by_id(CATEGORY, self.category.pk).name, "products")
+            self.assertIsNone(registry.get(CATEGORY, "Top News"))
+
+    def test_changes_reload_every_process(self):
+        get_taxonomy()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = "Breaking"
+            self.tag.save()
+        self.assertIsNotNone(get_taxonomy().get(TAG, "Breaking"))
+        version = taxonomy._read_version()
+        self.assertNotEqual(version, "")
+
+        # Another worker changes a row: this process reloads once it sees the new version
+        Tag.objects.filter(pk=self.tag.pk).update(name="Top News")
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_taxonomy().get(TAG, "Top News"))
+        taxonomy._write_version()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_taxonomy().get(TAG, "Top News"), self.tag)
+
+    def test_missing_tag_lists_the_latest_of_the_type(self):
+        author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        content = Content.objects.create(title="Post", slug="post", type=self.news, author=author, body="{p x p}", publish=True)
+
+        # The tag exists but tags nothing: the section is empty
+        self.assertEqual(list(self.client.get("/news/").context["top_news_articles"]), [])
+
+        # No tag of that name: the section falls back to the latest news
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.delete()
+        self.assertEqual([card.pk for card in self.client.get("/news/").context["top_news_articles"]], [content.pk])
+
+    def test_unknown_type_is_a_404_without_query(self):
+        get_taxonomy()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/missing-type/some-slug/").status_code, 404)
+
+
+class StructuredDataTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        self.news = Type.objects.create(name="news")
+        self.author = Author.objects.create(first_name="Ada", last_name="Lovelace", title="Editor", description="Bio")
+        self.content = Content.objects.create(
+            title="Fish & Chips", slug="post", type=self.news, author=self.author, body="{p x p}", publish=True,
+            image_featured="https://example.com/a.jpg",
+        )
+
+    def get_structured_data(self):
+        return json.loads(Content.objects.get(pk=self.content.pk).structured_data)
+
+    def test_built_on_save(self):
+        data = self.get_structured_data()
+        self.assertEqual(data["@type"], "NewsArticle")
+        self.assertEqual(data["headline"], "Fish &amp; Chips")
+        self.assertEqual(data["mainEntityOfPage"]["@id"], "https://thegamehorizon.com/news/post")
+        self.assertEqual(data["author"]["name"], "Ada Lovelace")
+        self.assertEqual(data["image"], "https://example.com/a.jpg")
+        self.assertNotIn("\n", self.content.structured_data)
+
+        content = Content.objects.get(pk=self.content.pk)
+        content.type = Type.objects.create(name="review")
+        content.image_featured = "https://example.com/b.jpg"
+        content.save(update_fields=["type", "image_featured"])
+        data = self.get_structured_data()
+        self.assertEqual((data["@type"], data["image"]), ("Article", "https://example.com/b.jpg"))
+
+    def test_update_fields_by_attname_rebuild_it(self):
+        other = Author.objects.create(first_name="Grace", last_name="Hopper", title="Editor", description="Bio")
+        content = Content.objects.get(pk=self.content.pk)
+        content.author_id = other.pk
+        content.save(update_fields=["author_id"])
+        self.assertEqual(self.get_structured_data()["author"]["name"], "Grace Hopper")
+        self.assertEqual(ContentCard.objects.get(pk=self.content.pk).author_name, "Grace Hopper")
+
+        Author.objects.filter(pk=other.pk).update(last_name="Murray")  # Skips the signals
+        content = Content.objects.get(pk=self.content.pk)
+        content.title = "Fish"
+        content.save(update_fields=["title"])
+        self.assertEqual(self.get_structured_data()["author"]["name"], "Grace Murray")  # Read from the Author
+
+    def test_renaming_the_author_or_type_refreshes_it(self):
+        self.author.last_name = "King"
+        self.author.save()
+        self.news.name = "updates"
+        self.news.save()
+        data = self.get_structured_data()
+        self.assertEqual(data["author"]["name"], "Ada King")
+        self.assertEqual(data["mainEntityOfPage"]["@id"], "https://thegamehorizon.com/updates/post")
+        self.assertEqual(data["@type"], "Article")
+
+    def test_rebuild_writes_only_changed_contents(self):
+        out = StringIO()
+        call_command("rebuild_structured_data", stdout=out)
+        self.assertIn("of 0 contents", out.getvalue())
+
+        Content.objects.filter(pk=self.content.pk).update(structured_data="")
+        call_command("rebuild_structured_data", stdout=out)
+        self.assertIn("of 1 contents", out.getvalue())
+        content = Content.objects.get(pk=self.content.pk)
+        self.assertGreater(content.updated_at, self.content.updated_at)
+        self.assertEqual(json.loads(content.structured_data)["dateModified"], timezone.localtime(content.updated_at).isoformat())
+
+    def test_pages_emit_it_as_stored(self):
+        self.assertContains(self.client.get("/"), WEBSITE_STRUCTURED_DATA)
+        self.assertContains(self.client.get("/news/post/"), self.content.structured_data)
+
+
+class ContentCardTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        self.news = Type.objects.create(name="news")
+        self.author = Author.objects.create(first_name="Ada", last_name="Lovelace", title="Editor", description="Bio")
+        self.content = Content.objects.create(
+            title="Post", slug="post", type=self.news, author=self.author, body="{p x p}", publish=True,
+            image_featured="https://example.com/a.jpg",
+            image_featured_srcset={"https://example.com/a-480.jpg": "480w", "https://example.com/a-960.jpg": "960w"},
+            image_featured_sources={"image/webp": {"https://example.com/a-480.webp": "480w"}},
+        )
+
+    def get_card(self):
+        return ContentCard.objects.get(pk=self.content.pk)
+
+    def test_built_on_save(self):
+        card = self.get_card()
+        self.assertEqual(card.url_path, "/news/post/")
+        self.assertEqual((card.type_name, card.author_name), ("news", "Ada Lovelace"))
+        self.assertEqual(card.srcset, self.content.get_srcset())
+        self.assertEqual(card.get_picture_sources(), self.content.get_picture_sources())
+        self.assertEqual((card.published_at, card.publish), (self.content.published_at, True))
+
+        content = Content.objects.get(pk=self.content.pk)
+        content.title = "Renamed"
+        content.publish = False
+        content.save(update_fields=["title", "publish"])
+        self.assertEqual((self.get_card().title, self.get_card().publish), ("Renamed", False))
+
+    def test_unchanged_card_is_not_written(self):
+        content = Content.objects.get(pk=self.content.pk)
+        content.read_time = 5
+        with self.assertNumQueries(2):  # The author, for the structured data, and the content
+            content.save()
+
+    def test_renaming_the_author_or_type_refreshes_it(self):
+        self.author.first_name = "Augusta"
+        self.author.save()
+        self.news.name = "updates"
+        self.news.save()
+        card = self.get_card()
+        self.assertEqual((card.author_name, card.type_name, card.url_path), ("Augusta Lovelace", "updates", "/updates/post/"))
+
+    def test_deleted_with_the_content(self):
+        self.content.delete()
+        self.assertFalse(ContentCard.objects.exists())
+
+    def test_listings_show_cards(self):
+        response = self.client.get("/news/")
+        self.assertContains(response, 'href="/news/post/"')
+        self.assertContains(response, self.content.get_srcset())
+
+
+@override_settings(FRAGMENT_CACHE_ENABLED=True)
+class FragmentCacheTests(VersionFilesMixin, TestCase):
+    template_name = "horizon/cards/news_latest.html"
+
+    def setUp(self):
+        caches[settings.FRAGMENT_CACHE_ALIAS].clear()
+        self.news = Type.objects.create(name="news")
+        self.author = Author.objects.create(first_name="Ada", last_name="Lovelace", title="Editor", description="Bio")
+        for i in range(3):
+            Content.objects.create(title=f"Post {i}", slug=f"post-{i}", type=self.news, author=self.author, body="{p x p}", publish=True)
+
+    def render(self, with_age=True):
+        cards = ContentCard.objects.order_by("pk")
+        with mock.patch.object(fragment_cache, "get_template", wraps=fragment_cache.get_template) as get_template:
+            html = fragment_cache.render_cards(self.template_name, cards, with_age)
+        return html, get_template.call_count
+
+    def test_only_misses_are_rendered(self):
+        html, rendered = self.render()
+        self.assertEqual(rendered, 3)
+        self.assertEqual(self.render(), (html, 0))
+
+        content = Content.objects.get(slug="post-1")
+        content.title = "Renamed"
+        content.save()
+        html, rendered = self.render()
+        self.assertEqual(rendered, 1)
+        self.assertIn("Renamed", html)
+
+    def test_renaming_the_author_renders_the_cards_again(self):
+        self.render()
+        self.author.first_name = "Augusta"
+        self.author.save()
+        html, rendered = self.render()
+        self.assertEqual(rendered, 3)
+        self.assertIn("By Augusta Lovelace", html)
+
+    def test_cards_are_keyed_by_their_age(self):
+        self.render()
+        self.assertEqual(self.render(with_age=False)[1], 3)
+        with mock.patch.object(fragment_cache, "timesince", return_value="1\xa0day"):
+            html, rendered = self.render()
+        self.assertEqual(rendered, 3)
+        self.assertIn("1\xa0day ago", html)
+
+    def test_pages_match_the_uncached_ones(self):
+        for path in ("/", "/news/", "/news/post-0/"):
+            with override_settings(FRAGMENT_CACHE_ENABLED=False):
+                uncached = self.client.get(path)
+            self.assertContains(uncached, "Post 0")
+            self.assertEqual(self.client.get(path).content, uncached.content)  # Renders the fragments
+            self.assertEqual(self.client.get(path).content, uncached.content)  # Reads them
+
+
+class GenerateContentTests(VersionFilesMixin, TestCase):
+    def generate(self):
+        out = StringIO()
+        call_command("generate_content", "--articles=20", "--authors=3", "--seed=7", "--body-size=2000", "--batch-size=8",
+                     "--workers=1", stdout=out)
+        self.assertIn("Generated 20 articles", out.getvalue())
+        return [
+            (content.slug, content.title, content.body, content.html_body, content.published_at, content.author.first_name,
+             content.type.name, sorted(content.categories.values_list("name", flat=True)), sorted(content.tags.values_list("name", flat=True)))
+            for content in Content.objects.select_related("author", "type").order_by("pk")
+        ]
+
+    def test_generates_the_same_content_from_a_seed(self):
+        generated = self.generate()
+        self.assertEqual(len(generated), 20)
+        content = Content.objects.filter(publish=True).latest("published_at")
+        self.assertFalse(content.body_needs_render())
+        self.assertEqual(content.html_body, HTMLConverter().get_html(content.body))
+        self.assertIn("{figure_img_src_set}", "".join(Content.objects.values_list("body", flat=True)))
+        self.assertEqual(content.updated_at, content.published_at)
+        self.assertEqual(content.card.published_at, content.published_at)
+        self.assertIn('"@type"', content.structured_data)
+        self.assertGreater(len({row[4] for row in generated}), 1)  # Published at different times
+        author = content.author
+        self.assertEqual(author.html_description, author.get_html_description())
+        self.assertEqual(author.html_description_hash, HTMLConverter.get_render_hash(author.description))
+
+        Content.objects.all().delete()
+        Author.objects.all().delete()
+        self.assertEqual(self.generate(), generated)  # The types, categories and tags already exist
+
+    def test_keeps_the_connection_of_the_callers_transaction(self):
+        # TestCase runs each test in a transaction
+        with mock.patch.object(type(connections["default"]), "close") as close:
+            self.generate()
+        close.assert_not_called()
+
+
+class CompressionTests(SimpleTestCase):
+    def test_choose_encoding(self):
+        available = {"gzip": b"", "br": b""}
+        self.assertEqual(choose_encoding("gzip, deflate, br", available), "br")
+        self.assertEqual(choose_encoding("gzip;q=1.0, br;q=0.5", available), "gzip")
+        self.assertEqual(choose_encoding("br;q=0, *", available), "gzip")
+        self.assertEqual(choose_encoding("br", {"gzip": b""}), None)
+        self.assertEqual(choose_encoding("identity", available), None)
+        self.assertEqual(choose_encoding(None, available), None)
+
+
+class ConditionalGetTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        news = Type.objects.create(name="news")
+        self.author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        self.contents = [
+            Content.objects.create(title=f"Post {i}", slug=f"post-{i}", type=news, author=self.author, body="{p x p}", publish=True)
+            for i in range(12)
+        ]
+        self.contents[0].tags.add(Tag.objects.create(name="shared"))
+        self.contents[1].tags.add(Tag.objects.get(name="shared"))
+        rebuild_related_content()
+
+    def assertNotModified(self, path, queries=1, **headers):
+        with self.assertNumQueries(queries):
+            response = self.client.get(path, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])
+
+    def assertModified(self, path, **headers):
+        self.assertEqual(self.client.get(path, **headers).status_code, 200)
+
+    def test_detail_page(self):
+        path = "/news/post-0/"
+        response = self.client.get(path)
+        etag = {"HTTP_IF_NONE_MATCH": response["ETag"]}
+        self.assertNotModified(path, **etag)
+        self.assertNotModified(path, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+
+        # The related posts changed, a minute later, as Last-Modified has a one second resolution
+        self.contents[1].tags.clear()
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(minutes=1)):
+            rebuild_related_content()
+        self.assertModified(path, **etag)
+        self.assertModified(path, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+
+        response = self.client.get(path)
+        etag = {"HTTP_IF_NONE_MATCH": response["ETag"]}
+        self.author.title = "Senior Editor"
+        self.author.save()
+        self.assertModified(path, **etag)
+
+        self.assertEqual(self.client.get("/news/missing/", HTTP_IF_NONE_MATCH="*").status_code, 404)
+
+    def test_listing_pages(self):
+        cursor = encode_cursor(self.contents[1].published_at, self.contents[1].pk)
+        for path in ("/", "/news/", f"/news/?after={cursor}"):
+            response = self.client.get(path)
+            # The validators are read from the listings version, however many contents there are
+            self.assertNotModified(path, queries=0, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertNotModified(path, queries=0, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+
+        for change in (
+            lambda: self.contents[2].delete(),
+            lambda: self.contents[3].tags.add(Tag.objects.get(name="shared")),
+            lambda: Author.objects.get(pk=self.author.pk).save(),
+        ):
+            etag = self.client.get("/news/")["ETag"]
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertModified("/news/", HTTP_IF_NONE_MATCH=etag)
+
+
+class RelatedContentTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        self.news = Type.objects.create(name="news")
+        self.games = Category.objects.create(name="games")
+        self.hardware = Category.objects.create(name="hardware")
+        self.tag = Tag.objects.create(name="rpg")
+
+    def create(self, slug, categories=(), tags=(), publish=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            content = Content.objects.create(title=slug, slug=slug, type=self.news, author=self.author, body="{p x p}", publish=publish)
+            content.categories.set(categories)
+            content.tags.set(tags)
+        return content
+
+    def related(self, content):
+        return list(content.related_content.order_by("-score").values_list("related__slug", flat=True))
+
+    def test_ranks_by_shared_categories_and_tags(self):
+        games = self.create("games", [self.games])
+        both = self.create("both", [self.games, self.hardware], [self.tag])
+        self.create("other", [self.hardware])
+        source = self.create("source", [self.games, self.hardware], [self.tag])
+
+        self.assertEqual(self.related(source), ["both", "other", "games"])  # Ties go to the newer post
+        self.assertIn("source", self.related(games))
+        self.assertEqual(self.related(both)[0], "source")
+
+    def test_incremental_updates_match_rebuild(self):
+        posts = [self.create(f"post-{i}", [self.games] if i % 2 else [self.hardware], [self.tag] if i % 3 else []) for i in range(10)]
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[1].categories.add(self.hardware)
+            posts[2].publish = False
+            posts[2].save()
+            posts[3].delete()
+            self.tag.contents.remove(posts[4])
+
+        incremental = {content.slug: self.related(content) for content in Content.objects.all()}
+        rebuild_related_content()
+        self.assertEqual(incremental, {content.slug: self.related(content) for content in Content.objects.all()})
+        self.assertNotIn("post-2", sum(incremental.values(), []))
+
+    def test_detail_page_reads_related_posts(self):
+        self.create("related", [self.games])
+        self.create("unrelated", [self.hardware])
+        source = self.create("source", [self.games])
+
+        response = self.client.get(f"/news/{source.slug}/")
+
+        self.assertEqual([post.slug for post in response.context["related_posts"]], ["related"])
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        self.news = Type.objects.create(name="news")
+        self.featured = Tag.objects.create(name="Home Featured")
+        self.shown = self.create("shown", tags=[self.featured])
+        self.draft = self.create("draft", publish=False)
+
+    def create(self, slug, tags=(), publish=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            content = Content.objects.create(title=slug, slug=slug, type=self.news, author=self.author, body="{p x p}", publish=publish)
+            content.tags.set(tags)
+        return content
+
+    def get(self, path="/"):
+        return self.client.get(path)["X-Page-Cache"]
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.get(), "MISS")
+        self.assertEqual(self.get(), "HIT")
+        self.assertEqual(self.get("/?page=2"), "MISS")
+        self.assertEqual(get_page_cache_stats()["hits"], 1)
+        self.assertEqual(get_page_cache_stats()["misses"], 2)
+
+    def test_serves_compressed_variants(self):
+        plain = self.client.get("/")
+        with mock.patch("horizon.utils.page_cache.compress_variants") as compress:
+            for _ in range(2):
+                response = self.client.get("/", HTTP_ACCEPT_ENCODING="br;q=0, gzip, deflate")
+                self.assertEqual(response["Content-Encoding"], "gzip")
+                self.assertIn("Accept-Encoding", response["Vary"])
+                self.assertEqual(gzip.decompress(response.content), plain.content)
+                self.assertEqual(response["Content-Length"], str(len(response.content)))
+        compress.assert_not_called()  # Compressed once, when the page was rendered
+
+        response = self.client.get("/", HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, plain.content)
+
+        response = self.client.get("/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_saving_shown_content_invalidates(self):
+        self.get()
+        self.get(f"/news/{self.draft.slug}/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shown.title = "Renamed"
+            self.shown.save()
+
+        self.assertEqual(self.get(), "MISS")
+        self.assertEqual(self.get(f"/news/{self.draft.slug}/"), "HIT")
+        self.assertGreater(get_page_cache_stats()["invalidations"], 0)
+
+    def test_change_during_render_isnt_stored(self):
+        from horizon import views
+
+        def render_after_change(*args, **kwargs):
+            # Another request commits a change after this one read the database
+            with self.captureOnCommitCallbacks(execute=True):
+                Content.objects.get(pk=self.shown.pk).save()
+            return render(*args, **kwargs)
+
+        render = views.render
+        with mock.patch("horizon.views.render", side_effect=render_after_change):
+            self.assertEqual(self.get(), "MISS")
+        self.assertEqual(self.get(), "MISS")
+        self.assertEqual(self.get(), "HIT")
+
+    def test_editing_draft_keeps_listings(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.draft.title = "Still a draft"
+            self.draft.save()
+        self.assertEqual(self.get(), "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.draft.publish = True
+            self.draft.save()
+        self.assertEqual(self.get(), "MISS")
+
+    def test_publishing_keeps_unrelated_detail_pages(self):
+        self.get(f"/news/{self.shown.slug}/")
+        self.create("another")
+        self.assertEqual(self.get(f"/news/{self.shown.slug}/"), "HIT")
+
+    def test_type_rename_invalidates_detail_pages(self):
+        self.get(f"/news/{self.shown.slug}/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.news.name = "updates"
+            self.news.save()
+        self.assertEqual(self.client.get(f"/news/{self.shown.slug}/").status_code, 404)
+
+    def test_tag_and_author_changes_invalidate(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.draft.tags.add(self.featured)
+        self.assertEqual(self.get(), "MISS")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.last_name = "Lovelace"
+            self.author.save()
+        self.assertEqual(self.get(), "MISS")
+        self.assertEqual(self.get(), "HIT")
+
+    def test_check_refuses_process_local_cache(self):
+        self.assertEqual([error.id for error in check_page_cache_backend(None)], ["horizon.E001"])
+        shared = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "horizon_cache"}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_page_cache_backend(None), [])
+        with override_settings(PAGE_CACHE_ENABLED=False):
+            self.assertEqual(check_page_cache_backend(None), [])
+
+
+class ExportStaticSiteTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        news = Type.objects.create(name="news")
+        self.contents = [
+            Content.objects.create(title=f"Post {i}", slug=f"post-{i}", type=news, author=author, body="{p x p}", publish=True)
+            for i in range(6)
+        ]
+        self.output = tempfile.mkdtemp()
+
+    def export(self):
+        out = StringIO()
+        call_command("export_static_site", f"--output={self.output}", "--workers=1", stdout=out)
+        return out.getvalue()
+
+    def test_exports_pages_and_rebuilds_only_changed_ones(self):
+        self.assertIn("9 rendered, 0 unchanged", self.export())  # home, 2 news pages, 6 articles
+        cursor = encode_cursor(self.contents[2].published_at, self.contents[2].pk)
+        for path in ("index.html", "news/index.html", f"news/after/{cursor}/index.html", "news/post-0/index.html.gz"):
+            self.assertTrue(os.path.exists(os.path.join(self.output, path)), path)
+
+        self.assertIn("0 rendered, 9 unchanged", self.export())
+
+        self.contents[0].title = "Renamed"
+        self.contents[0].save()
+        self.assertIn("3 rendered, 6 unchanged", self.export())  # home, the news page showing it, the article
+
+        self.contents[1].publish = False
+        self.contents[1].save()
+        self.assertIn("1 removed", self.export())
+        self.assertFalse(os.path.exists(os.path.join(self.output, "news/post-1/index.html")))
+
+    def test_changed_site_version_renders_every_page(self):
+        self.export()
+        with mock.patch("horizon.utils.static_export.get_site_version", return_value="deployed"):
+            self.assertIn("9 rendered, 0 unchanged", self.export())
+
+
+def make_jpeg(name="photo.jpg", size=(2000, 1000)):
+    out = tempfile.SpooledTemporaryFile()
+    Image.new("RGB", size, (200, 80, 40)).save(out, "JPEG")
+    out.seek(0)
+    return SimpleUploadedFile(name, out.read(), content_type="image/jpeg")
+
+
+class ImageDerivativeTests(SimpleTestCase):
+    def test_decodes_original_once(self):
+        path = os.path.join(tempfile.mkdtemp(), "photo.jpg")
+        Image.new("RGB", (3000, 2000), (10, 120, 200)).save(path)
+
+        with mock.patch.object(images.Image, "open", wraps=Image.open) as image_open:
+            outputs = images.create_derivatives(path)
+        self.assertEqual(image_open.call_count, 1)
+
+        for output in outputs:
+            with Image.open(output["path"]) as img:
+                self.assertEqual((img.format.lower(), img.size), (output["format"], (output["width"], output["height"])))
+        self.assertEqual(
+            sorted({(output["width"], output["height"]) for output in outputs}),
+            [(100, 66), (400, 266), (800, 533), (1200, 800), (1600, 1066)],
+        )
+        self.assertEqual({output["format"] for output in outputs}, set(images.DERIVATIVE_FORMATS))
+
+        # Existing outputs aren't resized again
+        with mock.patch.object(images.Image.Image, "resize") as resize:
+            images.create_derivatives(path)
+        resize.assert_not_called()
+
+
+class ImageJobTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        media_root = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def process_jobs(self):
+        out, err = StringIO(), StringIO()
+        call_command("process_image_jobs", "--once", "--workers=1", stdout=out, stderr=err)
+        return out.getvalue()
+
+    def test_save_queues_job_for_worker(self):
+        image = UploadedImage.objects.create(title="Photo", image=make_jpeg())
+        self.assertEqual(image.derivatives_status, UploadedImage.DerivativesStatus.PENDING)
+        self.assertEqual(image.available_resized_images(), "")
+
+        self.assertIn("1 done, 0 failed", self.process_jobs())
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives_status, UploadedImage.DerivativesStatus.DONE)
+        self.assertIn("photo_1600x800.jpg (1600x800 jpeg, ", image.available_resized_images())
+        self.assertIn("0 done, 0 failed", self.process_jobs())
+
+        # Saving without a new image doesn't queue it again
+        image.title = "Renamed"
+        image.save()
+        self.assertEqual(image.derivatives_status, UploadedImage.DerivativesStatus.DONE)
+
+    @override_settings(IMAGE_DERIVATIVES_INLINE=True)
+    def test_inline_mode_processes_on_save(self):
+        image = UploadedImage.objects.create(title="Photo", image=make_jpeg())
+        self.assertEqual(image.derivatives_status, UploadedImage.DerivativesStatus.DONE)
+        self.assertEqual(len(image.derivatives), 5 * len(images.DERIVATIVE_FORMATS))
+
+    @override_settings(IMAGE_DERIVATIVES_INLINE=True, SITE_URL="https://example.com")
+    def test_attached_image_fills_srcsets(self):
+        image = UploadedImage.objects.create(title="Photo", image=make_jpeg())
+        author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio", profile_image_upload=image)
+        news = Type.objects.create(name="news")
+        content = Content.objects.create(
+            title="Post", slug="post", type=news, author=author, body="{p x p}", publish=True, image_featured_upload=image,
+        )
+
+        self.assertEqual(content.image_featured, f"https://example.com/media/{image.image.name}")
+        self.assertEqual(len(content.image_featured_srcset), 5)
+        self.assertTrue(all(url.endswith(".jpg") for url in content.image_featured_srcset))
+        self.assertEqual(len(content.image_featured_sources["image/webp"]), 5)
+        self.assertEqual(author.profile_image_srcset, content.image_featured_srcset)
+
+        response = self.client.get("/news/post/")
+        self.assertContains(response, '<source type="image/webp" srcset="https://example.com/media/', count=2)
+        self.assertContains(response, "_400x200.webp 400w")
+
+    def test_job_completion_updates_attached_contents(self):
+        image = UploadedImage.objects.create(title="Photo", image=make_jpeg())
+        author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        content = Content.objects.create(title="Post", slug="post", author=author, body="{p x p}", image_featured_upload=image)
+        self.assertEqual(content.image_featured_srcset, {})
+
+        self.process_jobs()
+        content.refresh_from_db()
+        self.assertEqual(len(content.image_featured_srcset), 5)
+        self.assertEqual(len(content.image_featured_sources["image/webp"]), 5)
+
+    @override_settings(IMAGE_DERIVATIVES_INLINE=True)
+    def test_reconcile_rebuilds_manifest_from_disk(self):
+        image = UploadedImage.objects.create(title="Photo", image=make_jpeg())
+        manifest = image.derivatives
+        self.assertEqual(manifest[0]["checksum"], images.get_file_checksum(os.path.join(settings.MEDIA_ROOT, manifest[0]["name"])))
+
+        def reconcile(*args):
+            out = StringIO()
+            call_command("reconcile_image_derivatives", *args, stdout=out)
+            image.refresh_from_db()
+            return out.getvalue()
+
+        self.assertIn("1 images, 0 manifests updated, 0 requeued", reconcile())
+        self.assertEqual(image.derivatives, manifest)
+
+        removed = manifest.pop()
+        os.remove(os.path.join(settings.MEDIA_ROOT, removed["name"]))
+        with open(os.path.join(settings.MEDIA_ROOT, manifest[0]["name"]), "ab") as f:
+            f.write(b"extra")
+        manifest[0]["bytes"] += 5
+        manifest[0]["checksum"] = images.get_file_checksum(os.path.join(settings.MEDIA_ROOT, manifest[0]["name"]))
+
+        self.assertIn("1 images, 1 manifests updated, 1 requeued", reconcile("--requeue"))
+        self.assertEqual(image.derivatives, manifest)
+        self.assertEqual(image.derivatives_status, UploadedImage.DerivativesStatus.PENDING)
+
+    def test_failures_are_retried_then_recorded(self):
+        image = UploadedImage.objects.create(title="Broken", image=SimpleUploadedFile("broken.jpg", b"not a jpeg"))
+
+        for attempt in range(1, 4):
+            self.assertIn("0 done, 1 failed", self.process_jobs())
+            image.refresh_from_db()
+            self.assertEqual(image.derivatives_attempts, attempt)
+            self.assertIn("UnidentifiedImageError", image.derivatives_error)
+            if attempt < 3:
+                self.assertEqual(image.derivatives_status, UploadedImage.DerivativesStatus.PENDING)
+                self.assertIn("0 done, 0 failed", self.process_jobs())  # Waiting for its backoff
+                UploadedImage.objects.filter(pk=image.pk).update(derivatives_retry_at=None)
+
+        self.assertEqual(image.derivatives_status, UploadedImage.DerivativesStatus.FAILED)
+        self.assertIn("0 done, 0 failed", self.process_jobs())
+
+    def test_late_results_of_lost_claims_are_dropped(self):
+        image = UploadedImage.objects.create(title="Photo", image=make_jpeg())
+        [(pk, path, claim)] = image_jobs.claim_image_jobs(1)
+        outputs, error = image_jobs.run_image_job(path)
+
+        # The claim timed out and another worker claimed the job
+        UploadedImage.objects.filter(pk=pk).update(derivatives_retry_at=timezone.now())
+        [(_, _, new_claim)] = image_jobs.claim_image_jobs(1)
+        self.assertFalse(image_jobs.record_image_job_result(pk, outputs, error, claim))
+        self.assertEqual(UploadedImage.objects.get(pk=pk).derivatives_status, UploadedImage.DerivativesStatus.PROCESSING)
+
+        # The image was replaced while the job ran
+        image.refresh_from_db()
+        image.image = make_jpeg()
+        image.save()
+        self.assertFalse(image_jobs.record_image_job_result(pk, outputs, error, new_claim))
+        self.assertEqual(UploadedImage.objects.get(pk=pk).derivatives_status, UploadedImage.DerivativesStatus.PENDING)
+
+    def test_abandoned_jobs_run_out_of_attempts(self):
+        image = UploadedImage.objects.create(title="Photo", image=make_jpeg())
+        for _ in range(image_jobs.MAX_ATTEMPTS):
+            self.assertEqual(len(image_jobs.claim_image_jobs(1)), 1)  # The worker dies
+            UploadedImage.objects.filter(pk=image.pk).update(derivatives_retry_at=timezone.now())
+
+        self.assertEqual(image_jobs.claim_image_jobs(1), [])
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives_attempts, image_jobs.MAX_ATTEMPTS)
+        self.assertEqual(image.derivatives_status, UploadedImage.DerivativesStatus.FAILED)
+
+
+class ResizedImageTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        dirs = override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_RESIZE_CACHE_DIR=tempfile.mkdtemp())
+        dirs.enable()
+        self.addCleanup(dirs.disable)
+        self.image = UploadedImage.objects.create(title="Photo", image=make_jpeg())
+        self.name = self.image.image.name
+
+    def get(self, url):
+        response = self.client.get(url)
+        if response.status_code == 200:
+            with Image.open(BytesIO(b"".join(response.streaming_content))) as img:
+                response.image_size = img.size
+        return response
+
+    def test_public_width_is_rendered_once(self):
+        url = f"/media/r/640x0/{self.name}"
+        with mock.patch.object(image_resize, "create_resized_version", wraps=images.create_resized_version) as render:
+            self.assertEqual(self.get(url).image_size, (640, 320))
+            with self.assertNumQueries(0):
+                response = self.get(url)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(response.image_size, (640, 320))
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_other_sizes_need_a_signature(self):
+        self.assertEqual(self.client.get(f"/media/r/500x0/{self.name}").status_code, 403)
+        self.assertEqual(self.client.get(f"/media/r/300x300/{self.name}?s=forged").status_code, 403)
+
+        url = image_resize.get_resized_image_url(self.name, 300, 300)
+        self.assertEqual(self.get(url).image_size, (300, 300))
+        self.assertEqual(self.client.get(url.replace("300x300", "301x300")).status_code, 403)
+
+    def test_unknown_images_are_not_found(self):
+        self.assertEqual(self.client.get("/media/r/640x0/images/missing/photo.jpg").status_code, 404)
+
+    @override_settings(IMAGE_RESIZE_ACCEL_REDIRECT="/_resized/")
+    def test_hands_files_to_nginx(self):
+        response = self.client.get(f"/media/r/640x0/{self.name}")
+        path = image_resize.get_cache_path(640, 0, self.name)
+        self.assertEqual(response["X-Accel-Redirect"], "/_resized/" + os.path.relpath(path, settings.IMAGE_RESIZE_CACHE_DIR))
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response.content, b"")
+
+    def test_concurrent_requests_render_once(self):
+        path = image_resize.get_cache_path(640, 0, self.name)
+        calls = []
+
+        def render(path):
+            calls.append(path)
+            time.sleep(0.2)
+            with open(path, "wb") as f:
+                f.write(b"x")
+
+        threads = [threading.Thread(target=image_resize.render_once, args=(path, render)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_prune_removes_least_recently_used(self):
+        for width in (160, 320, 480):
+            self.client.get(f"/media/r/{width}x0/{self.name}")
+        paths = {width: image_resize.get_cache_path(width, 0, self.name) for width in (160, 320, 480)}
+        for age, width in enumerate((320, 160, 480)):
+            os.utime(paths[width], (time.time() - 1000 * (3 - age),) * 2)
+
+        sizes = {width: os.path.getsize(path) for width, path in paths.items()}
+        removed = image_resize.prune_image_cache(max_bytes=sizes[480] + sizes[160] + 1)
+        self.assertEqual(removed, 2)  # Down to 90% of the maximum
+        self.assertEqual([width for width, path in paths.items() if os.path.exists(path)], [480])
+        self.assertTrue(all(os.path.exists(f"{path}.lock") for path in paths.values()))  # Maybe held by a render
+
+
+@override_settings(SITE_URL="https://example.com")
+class SitemapTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        cache_dir = override_settings(SITEMAP_CACHE_DIR=tempfile.mkdtemp())
+        cache_dir.enable()
+        self.addCleanup(cache_dir.disable)
+        shard_size = mock.patch.object(sitemaps, "SHARD_SIZE", 2)
+        shard_size.start()
+        self.addCleanup(shard_size.stop)
+
+        self.news = Type.objects.create(name="news")
+        author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        self.contents = [
+            Content.objects.create(title=f"Post {i}", slug=f"post-{i}", type=self.news, author=author, body="{p x p}", publish=True)
+            for i in range(5)
+        ]
+        self.shards = sorted({content.pk // 2 for content in self.contents})
+
+    def get(self, path):
+        response = self.client.get(path)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, content.decode()
+
+    def test_index_lists_every_shard(self):
+        response, xml = self.get("/sitemap.xml")
+        self.assertEqual(response["Content-Type"], "application/xml")
+        for shard in self.shards:
+            self.assertIn(f"<loc>https://example.com/sitemap-{shard}.xml</loc>", xml)
+        self.assertIn("<loc>https://example.com/sitemap-news.xml</loc>", xml)
+
+    def test_shards_are_cached_until_their_contents_change(self):
+        shard = self.contents[0].pk // 2
+        in_shard = [content for content in self.contents if content.pk // 2 == shard]
+        _, xml = self.get(f"/sitemap-{shard}.xml")
+        self.assertEqual(xml.count("<url>"), len(in_shard))
+        self.assertIn("<loc>https://example.com/news/post-0/</loc>", xml)
+
+        with mock.patch.object(sitemaps, "iter_shard") as iter_shard, self.assertNumQueries(1):
+            response, cached = self.get(f"/sitemap-{shard}.xml")
+        iter_shard.assert_not_called()
+        self.assertEqual(cached, xml)
+
+        # Editing a content in another shard doesn't touch this one
+        self.contents[-1].title = "Edited"
+        self.contents[-1].save()
+        self.assertEqual(self.get(f"/sitemap-{shard}.xml")[1], xml)
+
+        in_shard[0].publish = False
+        in_shard[0].save()
+        _, xml = self.get(f"/sitemap-{shard}.xml")
+        self.assertEqual(xml.count("<url>"), len(in_shard) - 1)
+        self.assertEqual(len(os.listdir(settings.SITEMAP_CACHE_DIR)), 1)  # The previous version was removed
+
+        self.assertEqual(self.client.get("/sitemap-999.xml").status_code, 404)
+
+    def test_type_rename_changes_cached_shards(self):
+        shard = self.contents[0].pk // 2
+        self.get(f"/sitemap-{shard}.xml")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.news.name = "updates"
+            self.news.save()
+        self.assertIn("<loc>https://example.com/updates/post-0/</loc>", self.get(f"/sitemap-{shard}.xml")[1])
+
+    def test_closed_stream_leaves_no_temporary_file(self):
+        path = sitemaps.get_shard_cache_path(self.contents[0].pk // 2)
+        chunks = sitemaps.iter_and_cache(iter(["<urlset>", "</urlset>"]), path)
+        next(chunks)
+        chunks.close()  # The client disconnected
+        self.assertEqual(os.listdir(settings.SITEMAP_CACHE_DIR), [])
+
+    def test_news_sitemap_only_lists_recent_news(self):
+        Content.objects.filter(pk=self.contents[0].pk).update(published_at=timezone.now() - timedelta(days=3))
+        _, xml = self.get("/sitemap-news.xml")
+        self.assertEqual(xml.count("<news:news>"), 4)
+        self.assertNotIn("post-0/", xml)
+        self.assertIn("<news:title>Post 1</news:title>", xml)
+
+
+class SearchTests(VersionFilesMixin, TestCase):
+    def setUp(self):
+        self.news = Type.objects.create(name="news")
+        self.author = Author.objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        self.titled = self.create("Dragon Age review", "{p A long awaited sequel p}")
+        self.mentioned = self.create("Weekly roundup", "{p Rumours & leaks: a new {b dragon b} game is coming p}")
+
+    def create(self, title, body, publish=True, slug=None):
+        return Content.objects.create(
+            title=title, slug=slug or title.lower().replace(" ", "-"), type=self.news, author=self.author, body=body, publish=publish
+        )
+
+    def search(self, query, **params):
+        response = self.client.get("/search/", {"q": query, **params})
+        return [article.slug for article, _ in response.context["results"]], response
+
+    def test_ranks_matches_with_snippets(self):
+        with self.assertNumQueries(2):
+            slugs, response = self.search("dragon")
+        self.assertEqual(slugs, ["dragon-age-review", "weekly-roundup"])
+        self.assertContains(response, "Rumours &amp; leaks: a new <mark>dragon</mark> game")
+
+        self.assertEqual(self.search("dragon gam")[0], ["weekly-roundup"])  # Every word, the last one as a prefix
+        self.assertEqual(self.search('"); DROP')[0], [])
+        self.assertEqual(self.search("")[0], [])
+
+    def test_pages_with_a_cursor(self):
+        for i in range(12):
+            self.create(f"Patch notes {i}", "{p Another patch p}")
+        slugs, response = self.search("patch")
+        self.assertEqual(len(slugs), search.SEARCH_PAGE_SIZE)
+        next_slugs, response = self.search("patch", after=response.context["next_cursor"])
+        self.assertEqual(len(next_slugs), 2)
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertEqual(len(set(slugs + next_slugs)), 12)
+
+    def test_index_follows_changes(self):
+        self.titled.title = "Elden Ring review"
+        self.titled.save()
+        self.assertEqual(self.search("dragon")[0], ["weekly-roundup"])
+
+        tag = Tag.objects.create(name="Souls")
+        self.titled.tags.add(tag)
+        self.assertEqual(self.search("souls")[0], ["dragon-age-review"])
+        tag.name = "Soulslike"
+        tag.save()
+        self.assertEqual(self.search("soulslike")[0], ["dragon-age-review"])
+        tag.delete()
+        self.assertEqual(self.search("soulslike")[0], [])
+
+        self.mentioned.publish = False
+        self.mentioned.save()
+        self.assertEqual(self.search("dragon")[0], [])
+        self.mentioned.delete()
+        self.assertEqual(search.rebuild_search_index(), 1)
+
+    def test_admin_searches_the_index(self):
+        self.create("Draft about dragons", "{p Not out yet p}", publish=False)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.get("/admin/horizon/content/", {"q": "dragon"})
+        self.assertEqual(
+            sorted(content.slug for content in response.context["cl"].result_list),
+            ["draft-about-dragons", "dragon-age-review", "weekly-roundup"],
+        )
+
+
+class DataMigrationTests(VersionFilesMixin, TransactionTestCase):
+    """
+    Migrates a populated database through the data migrations, with the historical models.
+    """
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("horizon", target)])
+        return executor.loader.project_state([("horizon", target)]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes("horizon")[0][1])
+
+    def test_indexes_existing_contents(self):
+        apps = self.migrate("0024_author_updated_at")
+        news = apps.get_model("horizon", "Type").objects.create(name="news")
+        author = apps.get_model("horizon", "Author").objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        content = apps.get_model("horizon", "Content").objects.create(
+            title="Dragon review", slug="dragon", type=news, author=author, body="{p x p}", html_body="<p>A long sequel</p>", publish=True,
+        )
+        content.tags.add(apps.get_model("horizon", "Tag").objects.create(name="rpg"))
+
+        self.migrate("0025_content_search")
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid, body, terms FROM {search.SEARCH_TABLE}")
+            self.assertEqual(cursor.fetchall(), [(content.pk, "A long sequel", "rpg")])
+
+    def test_builds_structured_data_of_existing_contents(self):
+        apps = self.migrate("0027_listing_indexes")
+        news = apps.get_model("horizon", "Type").objects.create(name="news")
+        author = apps.get_model("horizon", "Author").objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        content = apps.get_model("horizon", "Content").objects.create(
+            title="Dragon review", slug="dragon", type=news, author=author, body="{p x p}", html_body="<p>A long sequel</p>", publish=True,
+        )
+
+        apps = self.migrate("0028_content_structured_data")
+        structured_data = json.loads(apps.get_model("horizon", "Content").objects.get(pk=content.pk).structured_data)
+        self.assertEqual(structured_data["@type"], "NewsArticle")
+        self.assertEqual(structured_data["mainEntityOfPage"]["@id"], "https://thegamehorizon.com/news/dragon")
+        self.assertEqual(structured_data["author"]["name"], "Ada L")
+
+    def test_builds_cards_of_existing_contents(self):
+        apps = self.migrate("0028_content_structured_data")
+        news = apps.get_model("horizon", "Type").objects.create(name="news")
+        author = apps.get_model("horizon", "Author").objects.create(first_name="Ada", last_name="L", title="Editor", description="Bio")
+        content = apps.get_model("horizon", "Content").objects.create(
+            title="Post", slug="post", type=news, author=author, body="{p x p}", publish=True,
+            image_featured_srcset={"https://example.com/a.jpg": "480w"},
+        )
+
+        apps = self.migrate("0029_content_card")
+        card = apps.get_model("horizon", "ContentCard").objects.get(pk=content.pk)
+        self.assertEqual((card.url_path, card.author_name, card.srcset), ("/news/post/", "Ada L", "https://example.com/a.jpg 480w"))
@@ -1,5 +1,7 @@
 from django.urls import path
-from .views import home, content_detail, news_type_page, products_category_page
+from .views import (
+    home, content_detail, news_type_page, products_category_page, resized_image, search, sitemap_index, sitemap_shard, news_sitemap,
+)
 from django.shortcuts import render
 from django.conf import settings
 from django.conf.urls.static import static
@@ -8,7 +10,13 @@ urlpatterns = [
     path('', home, name='home'),  # Homepage
     # path('products/', products_category_page, name='products_category_page_path_name'),
     path('news/', news_type_page, name='news_type_page_path_name'),  # News page
+    path('search/', search, name='search'),  # Search results
+    path('sitemap.xml', sitemap_index, name='sitemap_index'),  # Sitemap index (see horizon/utils/sitemaps.py)
+    path('sitemap-news.xml', news_sitemap, name='news_sitemap'),
+    path('sitemap-<int:shard>.xml', sitemap_shard, name='sitemap_shard'),
     path('<str:type>/<slug:slug>/', content_detail, name='content_detail_path_name'),  # Detail page
+    # On-demand resized images, e.g. /media/r/640x0/images/<folder>/photo.jpg
+    path(f"{settings.MEDIA_URL.strip('/')}/r/<int:width>x<int:height>/<path:name>", resized_image, name='resized_image'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,43 @@
+"""
+bulk_update() for the contents and authors that the pages show.
+
+bulk_update() skips save() and the signals, so bulk_save() also does what they would for the
+fields it writes: set `updated_at` (the conditional GET validators and the export tokens read it),
+update the search rows of contents whose indexed fields changed, and invalidate the cached pages
+showing the rows. Commands and helpers that write many rows at once go through it.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from horizon.utils.page_cache import invalidate_page_dependencies, is_page_cache_enabled
+from horizon.utils.search import index_contents
+
+
+def bulk_save(objects, fields):
+    """
+    Writes `fields` of a list of Content or Author objects with bulk_update(). `updated_at` is set
+    to now, unless it is one of the `fields`. Returns the number of objects.
+    """
+    from horizon.models import SEARCH_FIELDS, Content
+
+    if not objects:
+        return 0
+    model = type(objects[0])
+    fields = set(fields)
+    if "updated_at" not in fields:
+        now = timezone.now()
+        for obj in objects:
+            obj.updated_at = now
+        fields.add("updated_at")
+
+    pks = [obj.pk for obj in objects]
+    with transaction.atomic():
+        model.objects.bulk_update(objects, sorted(fields))
+        if model is Content and fields & set(SEARCH_FIELDS):
+            index_contents(pks)
+
+    # `content:<id>` and `author:<id>`, see horizon.utils.page_cache
+    if is_page_cache_enabled():
+        prefix = model.__name__.lower()
+        transaction.on_commit(lambda: invalidate_page_dependencies(f"{prefix}:{pk}" for pk in pks))
+    return len(objects)
@@ -0,0 +1,86 @@
+"""
+ContentCard, the read model of the listings.
+
+A card holds what an article card shows: the content's title, slug, description, featured image
+and publication date, plus its type name, author name, URL path and srcset strings, computed once
+here instead of joined and formatted for every card of every page. Listings read cards instead of
+Content rows, whose `body` and `html_body` make them large.
+
+Content.save() writes the card of the content when one of its fields changes, and the signals
+refresh the cards of an author or type when it is renamed (see horizon/signals.py). Changes that
+skip save() (bulk_create(), update(), raw SQL) must call refresh_cards().
+"""
+from django.urls import reverse
+
+from horizon.utils.structured_data import get_author_name
+
+
+# The Content fields copied into its card, as they are named on both models
+COPIED_FIELDS = ("title", "slug", "description", "image_featured", "image_caption", "published_at", "publish", "type_id", "author_id")
+# The Content fields a card is built from
+SOURCE_FIELDS = (*COPIED_FIELDS, "image_featured_srcset", "image_featured_sources")
+# The card fields that change with the content (all but the primary key)
+CARD_FIELDS = (*COPIED_FIELDS, "type_name", "author_name", "url_path", "srcset", "avif_srcset", "webp_srcset")
+
+REFRESH_BATCH_SIZE = 500
+
+
+def _get_models():
+    from horizon.models import Content, ContentCard
+    return Content, ContentCard
+
+
+def format_srcset(srcset):
+    """
+    Returns a `srcset` attribute from a dictionary like { "https://example.com/small.jpg": "480w", ... }
+    """
+    return ", ".join(f"{url} {width}" for url, width in (srcset or {}).items())
+
+
+def get_card_fields(content, type_name, author_name):
+    """
+    Returns the card fields of a content whose type is named `type_name`.
+    """
+    sources = content.image_featured_sources or {}
+    return {
+        **{field: getattr(content, field) for field in COPIED_FIELDS},
+        "type_name": type_name or "",
+        "author_name": author_name,
+        "url_path": reverse("content_detail_path_name", args=[type_name, content.slug]) if type_name else "",
+        "srcset": format_srcset(content.image_featured_srcset),
+        "avif_srcset": format_srcset(sources.get("image/avif")),
+        "webp_srcset": format_srcset(sources.get("image/webp")),
+    }
+
+
+def save_cards(cards):
+    """
+    Inserts or updates the given ContentCard objects, bumping their `updated_at`. One query per
+    REFRESH_BATCH_SIZE cards.
+    """
+    ContentCard = _get_models()[1]
+    ContentCard.objects.bulk_create(
+        cards, batch_size=REFRESH_BATCH_SIZE, update_conflicts=True, unique_fields=["content"],
+        update_fields=[*CARD_FIELDS, "updated_at"],
+    )
+
+
+def refresh_cards(contents):
+    """
+    Rebuilds the cards of the `contents` queryset. Returns the number of cards.
+    """
+    ContentCard = _get_models()[1]
+    count = 0
+    batch = []
+    contents = contents.select_related("type", "author").only(
+        *(field.removesuffix("_id") for field in SOURCE_FIELDS), "type__name", "author__first_name", "author__last_name"
+    )
+    for content in contents.iterator(chunk_size=REFRESH_BATCH_SIZE):
+        fields = get_card_fields(content, content.type.name if content.type else None, get_author_name(content.author))
+        batch.append(ContentCard(content_id=content.pk, **fields))
+        if len(batch) == REFRESH_BATCH_SIZE:
+            save_cards(batch)
+            count += len(batch)
+            batch = []
+    save_cards(batch)
+    return count + len(batch)
@@ -0,0 +1,70 @@
+"""
+Precompressed variants of rendered pages, shared by the page cache and the static export.
+brotli is optional: without the package, only gzip variants are produced.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Smaller bodies don't gain enough to be worth a Content-Encoding
+MIN_SIZE = 512
+
+# Preferred encoding first, used to break ties between equal q-values
+ENCODINGS = ("br", "gzip")
+
+
+def compress_variants(content):
+    """
+    Returns {encoding: compressed content} for every available encoding. Compresses at the highest
+    levels, which is only affordable because callers do it once per page version.
+    """
+    if len(content) < MIN_SIZE:
+        return {}
+    variants = {"gzip": gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli:
+        variants["br"] = brotli.compress(content, quality=BROTLI_QUALITY)
+    return variants
+
+
+def get_accepted_encodings(header):
+    """
+    Parses an Accept-Encoding header into {coding: q-value}.
+    """
+    accepted = {}
+    for part in header.split(","):
+        coding, *params = [value.strip() for value in part.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def choose_encoding(header, available):
+    """
+    Returns the best encoding among `available` the client accepts, or None for identity.
+    """
+    accepted = get_accepted_encodings(header or "")
+    best = None
+    best_q = 0.0
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
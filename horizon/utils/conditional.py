@@ -0,0 +1,96 @@
+"""
+Conditional GET for the horizon views: ETag and Last-Modified validators computed before the view
+does any work, so If-None-Match/If-Modified-Since can be answered with a 304.
+
+A detail page's validators take one small query. The listings share a version file instead
+(settings.LISTINGS_VERSION_FILE), which the signals bump on any change a listing can show, so
+their validators cost one file read however many contents there are.
+"""
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.views.decorators.http import condition
+
+from horizon.utils.utils import HTMLConverter
+
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+@lru_cache(maxsize=None)
+def get_site_version():
+    """
+    Returns a hash of the templates and the HTML converter, so a deploy that changes how pages
+    are rendered changes every ETag. Computed once per process.
+    """
+    digest = hashlib.md5(HTMLConverter.get_fingerprint().encode())
+    for folder, folders, filenames in os.walk(TEMPLATES_DIR):
+        folders.sort()
+        for filename in sorted(filenames):
+            with open(os.path.join(folder, filename), "rb") as f:
+                digest.update(filename.encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _write_listings_version():
+    path = settings.LISTINGS_VERSION_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"{time.time_ns()}:{uuid.uuid4().hex}")  # Unique, so concurrent bumps can't write the same version
+    os.replace(tmp_path, path)
+
+
+def get_listings_version():
+    """
+    Returns (version, changed_at) of the listings. A missing file is created, so a deleted one
+    can't bring back a version clients already have.
+    """
+    try:
+        with open(settings.LISTINGS_VERSION_FILE) as f:
+            version = f.read()
+    except FileNotFoundError:
+        _write_listings_version()
+        return get_listings_version()
+    changed_at = datetime.fromtimestamp(int(version.split(":")[0]) / 10 ** 9, tz=timezone.utc)
+    return version, changed_at
+
+
+def invalidate_listings():
+    """
+    Changes the validators of every listing once the transaction commits.
+    """
+    transaction.on_commit(_write_listings_version)
+
+
+def conditional_page(get_validators):
+    """
+    Adds ETag/Last-Modified to a view's responses and answers conditional requests with a 304.
+    get_validators(request, *args, **kwargs) returns (state, last_modified), or None when there is
+    no such page. `state` is any repr()-able value that changes whenever the page does; it is
+    computed once per request for both validators.
+    """
+    def get_cached_validators(request, *args, **kwargs):
+        if not hasattr(request, "_page_validators"):
+            request._page_validators = get_validators(request, *args, **kwargs)
+        return request._page_validators
+
+    def etag(request, *args, **kwargs):
+        validators = get_cached_validators(request, *args, **kwargs)
+        if validators is None:
+            return None
+        # Weak, since the page cache serves the same page with different Content-Encodings
+        return 'W/"%s"' % hashlib.md5(f"{get_site_version()}:{validators[0]!r}".encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        validators = get_cached_validators(request, *args, **kwargs)
+        return validators[1] if validators else None
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
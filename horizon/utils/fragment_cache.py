@@ -0,0 +1,68 @@
+"""
+Cached HTML of the article cards, enabled with settings.FRAGMENT_CACHE_ENABLED.
+
+A card is rendered by a small template (horizon/templates/horizon/cards/) and its HTML is cached
+under the template name, the content id and the card's `updated_at`, which changes whenever the
+card is written (see horizon/utils/cards.py). A new version of a card misses, so nothing has to
+be invalidated: old fragments age out of the cache.
+
+render_cards() gets the fragments of a whole listing in one round trip to the cache, renders the
+misses and stores them in a second one. Cards that show their age ("3 hours ago") also key their
+fragment by that text, so they are rendered again when it changes.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from django.utils.timesince import timesince
+
+
+FRAGMENT_KEY_PREFIX = "horizon-fragment:"
+
+
+def is_fragment_cache_enabled():
+    return getattr(settings, "FRAGMENT_CACHE_ENABLED", False)
+
+
+def _get_cache():
+    return caches[getattr(settings, "FRAGMENT_CACHE_ALIAS", "default")]
+
+
+def _fragment_key(template_name, card, age):
+    version = f"{template_name}:{card.pk}:{card.updated_at.timestamp()}:{age}"
+    return FRAGMENT_KEY_PREFIX + hashlib.md5(version.encode()).hexdigest()
+
+
+def get_card_context(card, with_age=False):
+    """
+    Returns the context of a card template: the card and, with `with_age`, the time since it was
+    published, as the `timesince` filter formats it.
+    """
+    age = timesince(card.published_at) if with_age and card.published_at else ""
+    return {"card": card, "age": age}
+
+
+def render_cards(template_name, cards, with_age=False):
+    """
+    Returns the HTML of the ContentCard objects `cards` rendered one after the other with the
+    `template_name` template.
+    """
+    contexts = [get_card_context(card, with_age) for card in cards]
+    if not contexts:
+        return ""
+    if not is_fragment_cache_enabled():
+        template = get_template(template_name)
+        return mark_safe("".join(template.render(context) for context in contexts))
+
+    cache = _get_cache()
+    keys = [_fragment_key(template_name, context["card"], context["age"]) for context in contexts]
+    fragments = cache.get_many(keys)
+    missing = {}
+    for key, context in zip(keys, contexts):
+        if key not in fragments and key not in missing:
+            missing[key] = get_template(template_name).render(context)
+    if missing:
+        cache.set_many(missing, timeout=getattr(settings, "FRAGMENT_CACHE_TIMEOUT", None))
+    return mark_safe("".join(fragments[key] if key in fragments else missing[key] for key in keys))
@@ -0,0 +1,232 @@
+"""
+DB-backed job queue for UploadedImage derivatives.
+
+UploadedImage rows are the jobs: save() marks an image `pending`, and the process_image_jobs
+command claims pending rows, generates their derivatives in a process pool and records the
+outcome on the row, unless the row was claimed again or its image replaced meanwhile. Failed and
+abandoned jobs are retried with a backoff until they run out of attempts.
+
+The outputs are recorded in UploadedImage.derivatives, a manifest the admin and the srcsets are
+built from. reconcile_image_derivatives() rebuilds it from the files on disk.
+"""
+import os
+import posixpath
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from horizon.utils.images import (
+    DERIVATIVE_FORMATS, DERIVATIVE_WIDTHS, create_derivatives, get_file_checksum, scan_derivatives,
+)
+
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = timedelta(seconds=30)
+
+# A claimed job that isn't finished within this time (e.g. the worker died) is claimed again
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def _get_model():
+    from horizon.models import UploadedImage
+    return UploadedImage
+
+
+def claim_image_jobs(limit):
+    """
+    Claims up to `limit` jobs that are due. Returns [(pk, image path, claim)], `claim` being what
+    record_image_job_result() needs to check the job is still this worker's.
+    Each row is claimed with a conditional UPDATE, so concurrent workers never run the same job.
+    Claiming counts as an attempt, so a job whose worker keeps dying runs out of attempts too.
+    """
+    UploadedImage = _get_model()
+    Status = UploadedImage.DerivativesStatus
+    now = timezone.now()
+
+    # Abandoned claims that were the last attempt
+    UploadedImage.objects.filter(
+        derivatives_status=Status.PROCESSING, derivatives_retry_at__lte=now, derivatives_attempts__gte=MAX_ATTEMPTS,
+    ).update(
+        derivatives_status=Status.FAILED,
+        derivatives_error=f"Not finished within {CLAIM_TIMEOUT} after {MAX_ATTEMPTS} attempts",
+        derivatives_retry_at=None,
+    )
+
+    due = (
+        Q(derivatives_status=Status.PENDING, derivatives_retry_at__isnull=True)
+        | Q(derivatives_status__in=[Status.PENDING, Status.PROCESSING], derivatives_retry_at__lte=now)
+    )
+    claimed_until = now + CLAIM_TIMEOUT
+
+    claimed = []
+    for pk, retry_at, status in (
+        UploadedImage.objects.filter(due, derivatives_attempts__lt=MAX_ATTEMPTS).order_by("pk")
+        .values_list("pk", "derivatives_retry_at", "derivatives_status")[:limit]
+    ):
+        updated = UploadedImage.objects.filter(pk=pk, derivatives_status=status, derivatives_retry_at=retry_at).update(
+            derivatives_status=Status.PROCESSING,
+            derivatives_attempts=F("derivatives_attempts") + 1,
+            derivatives_retry_at=claimed_until,
+        )
+        if updated:
+            claimed.append(pk)
+
+    # The claim is the image it was made for and its deadline, which a later claim of the same row replaces
+    return [
+        (image.pk, image.image.path, (image.image.name, claimed_until))
+        for image in UploadedImage.objects.filter(pk__in=claimed).order_by("pk")
+    ]
+
+
+def _get_manifest(image, outputs):
+    """
+    Returns the manifest entries of an image's outputs, sorted by width and format.
+    Names are relative to the storage, like the original's.
+    """
+    folder = posixpath.dirname(image.image.name)
+    return sorted((
+        {
+            "width": output["width"],
+            "height": output["height"],
+            "format": output["format"],
+            "name": posixpath.join(folder, os.path.basename(output["path"])),
+            "bytes": output["bytes"],
+            "checksum": output["checksum"],
+        }
+        for output in outputs
+    ), key=lambda entry: (entry["width"], entry["format"]))
+
+
+def record_image_job_result(pk, outputs=None, error=None, claim=None):
+    """
+    Marks a job done and records its outputs, or records its error and schedules a retry
+    until MAX_ATTEMPTS is reached. Contents and authors using a finished image get its srcsets.
+    With the `claim` of claim_image_jobs(), nothing is recorded if the job was claimed again or
+    its image replaced in the meantime. Returns whether the result was recorded.
+    """
+    UploadedImage = _get_model()
+    Status = UploadedImage.DerivativesStatus
+    image = UploadedImage.objects.filter(pk=pk).only("image", "derivatives_attempts").first()
+    if image is None:
+        return False  # Deleted while processing
+
+    if error is None:
+        fields = {
+            "derivatives": _get_manifest(image, outputs),
+            "derivatives_status": Status.DONE,
+            "derivatives_error": "",
+            "derivatives_retry_at": None,
+        }
+    elif image.derivatives_attempts < MAX_ATTEMPTS:
+        fields = {
+            "derivatives_status": Status.PENDING,
+            "derivatives_error": error,
+            "derivatives_retry_at": timezone.now() + RETRY_BACKOFF * 2 ** (image.derivatives_attempts - 1),
+        }
+    else:
+        fields = {"derivatives_status": Status.FAILED, "derivatives_error": error, "derivatives_retry_at": None}
+
+    job = UploadedImage.objects.filter(pk=pk)
+    if claim is not None:
+        name, claimed_until = claim
+        job = job.filter(derivatives_status=Status.PROCESSING, image=name, derivatives_retry_at=claimed_until)
+    if not job.update(**fields):
+        return False
+    if error is None:
+        UploadedImage.objects.get(pk=pk).update_attached()
+    return True
+
+
+def run_image_job(path):
+    """
+    Generates the derivatives of one image. Returns (outputs, None) on success or (None, error message).
+    """
+    try:
+        return create_derivatives(path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def process_image_job(pk):
+    """
+    Runs a job inline in the current process. Used when settings.IMAGE_DERIVATIVES_INLINE is on.
+    """
+    UploadedImage = _get_model()
+    image = UploadedImage.objects.get(pk=pk)
+    UploadedImage.objects.filter(pk=pk).update(
+        derivatives_status=UploadedImage.DerivativesStatus.PROCESSING,
+        derivatives_attempts=F("derivatives_attempts") + 1,
+    )
+    record_image_job_result(pk, *run_image_job(image.image.path))
+
+
+def _is_complete(derivatives):
+    present = {(entry["width"], entry["format"]) for entry in derivatives}
+    return all((width, fmt) in present for width in DERIVATIVE_WIDTHS for fmt in DERIVATIVE_FORMATS)
+
+
+def reconcile_image_derivatives(batch_size=500, verify=False, requeue=False, stdout=None):
+    """
+    Rebuilds the derivatives manifest of every image from the files on disk, with one directory
+    listing per image and bulk updates. Checksums are reused for files whose size didn't change,
+    unless `verify`. With `requeue`, done images missing a width or format are queued again.
+    Returns {"images", "updated", "requeued", "missing"}; `missing` counts images whose original is gone.
+    """
+    UploadedImage = _get_model()
+    Status = UploadedImage.DerivativesStatus
+    fields = ["derivatives", "derivatives_status", "derivatives_error", "derivatives_attempts", "derivatives_retry_at"]
+    stats = {"images": 0, "updated": 0, "requeued": 0, "missing": 0}
+    changed = []
+    attached = []
+
+    def flush():
+        UploadedImage.objects.bulk_update(changed, fields)
+        for image in attached:
+            image.update_attached()
+        changed.clear()
+        attached.clear()
+
+    images = UploadedImage.objects.only("image", *fields).order_by("pk")
+    for image in images.iterator(chunk_size=batch_size):
+        stats["images"] += 1
+        path = image.image.path
+        folder = os.path.dirname(path)
+        filenames = os.listdir(folder) if os.path.isdir(folder) else []
+        if os.path.basename(path) not in filenames:
+            stats["missing"] += 1
+
+        known = {entry["name"]: entry for entry in image.derivatives}
+        outputs = scan_derivatives(path, filenames)
+        for output in outputs:
+            output["bytes"] = os.path.getsize(output["path"])
+            entry = known.get(posixpath.join(posixpath.dirname(image.image.name), os.path.basename(output["path"])))
+            if entry and entry.get("bytes") == output["bytes"] and entry.get("checksum") and not verify:
+                output["checksum"] = entry["checksum"]
+            else:
+                output["checksum"] = get_file_checksum(output["path"])
+        derivatives = _get_manifest(image, outputs)
+
+        updated = derivatives != image.derivatives
+        if updated:
+            if {entry["name"] for entry in derivatives} != set(known):
+                attached.append(image)
+            image.derivatives = derivatives
+            stats["updated"] += 1
+        if requeue and image.derivatives_status == Status.DONE and not _is_complete(derivatives):
+            image.derivatives_status = Status.PENDING
+            image.derivatives_error = ""
+            image.derivatives_attempts = 0
+            image.derivatives_retry_at = None
+            stats["requeued"] += 1
+            updated = True
+        if updated:
+            changed.append(image)
+
+        if len(changed) >= batch_size:
+            flush()
+        if stdout and stats["images"] % batch_size == 0:
+            stdout.write(f"{stats['images']} images reconciled")
+
+    flush()
+    return stats
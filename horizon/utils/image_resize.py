@@ -0,0 +1,153 @@
+"""
+On-demand resized versions of uploaded images, served at /media/r/<width>x<height>/<image name>.
+
+A height of 0 keeps the aspect ratio, otherwise the image is cropped to fill the box. Widths in
+settings.IMAGE_RESIZE_WIDTHS (with a height of 0) are public; any other size needs the signature
+added by get_resized_image_url(), so crawlers can't fill the disk with arbitrary sizes.
+
+Rendered versions are kept in a disk cache under settings.IMAGE_RESIZE_CACHE_DIR, sharded by the
+first bytes of their key. Hits refresh the file's mtime, and once the cache grows past
+settings.IMAGE_RESIZE_CACHE_MAX_BYTES the least recently used files are removed. A lock file per
+version makes concurrent requests for it, from any worker process, render it only once.
+"""
+import fcntl
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+from horizon.utils.images import create_resized_version
+
+
+SIGNATURE_SALT = "horizon.image_resize"
+
+# Hits refresh a file's mtime at most this often, so a hit rarely writes to the disk
+TOUCH_INTERVAL = 60 * 60
+# Pruning scans the whole cache, so it runs at most this often
+PRUNE_INTERVAL = 60
+# Pruning removes files until the cache is back under this share of its maximum size
+PRUNE_TARGET = 0.9
+
+
+def _get_signature(width, height, name):
+    return signing.Signer(salt=SIGNATURE_SALT).signature(f"{width}x{height}/{name}")
+
+
+def get_resized_image_url(name, width, height=0):
+    """
+    Returns the URL of a resized version of the uploaded image stored as `name`,
+    signed when the size isn't public.
+    """
+    url = reverse("resized_image", kwargs={"width": width, "height": height, "name": name})
+    if height or width not in settings.IMAGE_RESIZE_WIDTHS:
+        url += f"?s={_get_signature(width, height, name)}"
+    return url
+
+
+def is_resize_allowed(width, height, name, signature=None):
+    if width <= 0 or height < 0:
+        return False
+    if not height and width in settings.IMAGE_RESIZE_WIDTHS:
+        return True
+    return signature is not None and signing.constant_time_compare(signature, _get_signature(width, height, name))
+
+
+def get_cache_path(width, height, name):
+    key = hashlib.sha256(f"{width}x{height}/{name}".encode()).hexdigest()
+    ext = os.path.splitext(name)[1].lower()
+    return os.path.join(settings.IMAGE_RESIZE_CACHE_DIR, key[:2], key[2:4], key + ext)
+
+
+def render_once(path, render):
+    """
+    Calls render(path) unless `path` exists, holding a lock so concurrent callers, in this process
+    or another one, wait for the first render instead of repeating it.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(path):
+            return False  # Rendered by another request while this one waited
+        render(path)
+        return True
+
+
+def get_resized_image(name, width, height):
+    """
+    Returns the cache path of a resized version, rendering it if needed,
+    or None when `name` isn't an uploaded image.
+    """
+    path = get_cache_path(width, height, name)
+    try:
+        if time.time() - os.stat(path).st_mtime > TOUCH_INTERVAL:
+            os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    from horizon.models import UploadedImage
+    image = UploadedImage.objects.filter(image=name).only("image").first()
+    if image is None:
+        return None
+    if render_once(path, lambda path: create_resized_version(image.image.path, path, width, height)):
+        maybe_prune_image_cache()
+    return path
+
+
+def prune_image_cache(max_bytes=None):
+    """
+    Removes the least recently used versions until the cache is under PRUNE_TARGET of `max_bytes`.
+    Returns the number of files removed.
+
+    Lock files are kept: a render may hold one, and a request opening the path of a removed lock
+    file would lock a new file and render the same version concurrently. They are empty, one per
+    version ever rendered.
+    """
+    max_bytes = settings.IMAGE_RESIZE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files = []
+    total = 0
+    for folder, _, filenames in os.walk(settings.IMAGE_RESIZE_CACHE_DIR):
+        for filename in filenames:
+            if filename.endswith((".lock", ".tmp")) or filename.startswith("."):
+                continue
+            path = os.path.join(folder, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    files.sort()
+    for _, size, path in files:
+        if total <= max_bytes * PRUNE_TARGET:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def maybe_prune_image_cache():
+    """
+    Prunes the cache unless it was pruned in the last PRUNE_INTERVAL seconds, by any process.
+    """
+    marker = os.path.join(settings.IMAGE_RESIZE_CACHE_DIR, ".pruned")
+    try:
+        if time.time() - os.stat(marker).st_mtime < PRUNE_INTERVAL:
+            return
+    except FileNotFoundError:
+        pass
+    with open(marker, "w"):
+        pass
+    prune_image_cache()
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import re
+from PIL import Image, ImageOps, features
+
+
+# Widths of the resized versions generated for every uploaded image
+DERIVATIVE_WIDTHS = [100, 400, 800, 1200, 1600]
+
+# Every width is written in each of these formats: {format: (extension, mime type)}.
+# JPEG comes from the original's extension and is the fallback for browsers without WebP/AVIF.
+DERIVATIVE_FORMATS = {"jpeg": (None, "image/jpeg"), "webp": (".webp", "image/webp")}
+# AVIF needs Pillow 11.2+ built with libavif
+if "avif" in features.modules and features.check_module("avif"):
+    DERIVATIVE_FORMATS["avif"] = (".avif", "image/avif")
+
+# Formats of the derivative files found on disk, by extension (other than the original's)
+DERIVATIVE_EXTENSIONS = {".webp": "webp", ".avif": "avif"}
+
+
+def get_derivative_quality(width):
+    # Small versions are shown at full size, so they keep more quality
+    if width == 100:
+        return 100
+    if width == 400:
+        return 80
+    return 50
+
+
+def get_derivative_path(orig_path, size, ext=None):
+    """
+    Resized versions are stored in the same folder as the original image,
+    with a filename suffix indicating their dimensions.
+    """
+    folder = os.path.dirname(orig_path)
+    base, orig_ext = os.path.splitext(os.path.basename(orig_path))
+    return os.path.join(folder, f"{base}_{size[0]}x{size[1]}{ext or orig_ext}")
+
+
+def get_derivative_sizes(orig_size):
+    """
+    Returns the size of every resized version, preserving the aspect ratio.
+    """
+    orig_width, orig_height = orig_size
+    return [(width, int(orig_height * width / orig_width)) for width in DERIVATIVE_WIDTHS]
+
+
+def get_file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_derivatives(orig_path, filenames):
+    """
+    Returns [{"width", "height", "format", "path"}] for the derivative files of an image among
+    `filenames`, the listing of its folder.
+    """
+    base, orig_ext = os.path.splitext(os.path.basename(orig_path))
+    pattern = re.compile(rf"{re.escape(base)}_(\d+)x(\d+)(\.\w+)")
+    folder = os.path.dirname(orig_path)
+    outputs = []
+    for filename in filenames:
+        match = pattern.fullmatch(filename)
+        if not match:
+            continue
+        ext = match.group(3)
+        fmt = "jpeg" if ext == orig_ext else DERIVATIVE_EXTENSIONS.get(ext.lower())
+        if fmt:
+            outputs.append({
+                "width": int(match.group(1)),
+                "height": int(match.group(2)),
+                "format": fmt,
+                "path": os.path.join(folder, filename),
+            })
+    return outputs
+
+
+def create_derivatives(orig_path):
+    """
+    Creates every resized version of an image, in every format, that doesn't exist yet.
+    Returns [{"width", "height", "format", "path", "bytes", "checksum"}]. Runs in the image job
+    worker processes, so it must not touch the database.
+
+    The original is decoded once. JPEGs are decoded in draft mode at the smallest DCT scale that
+    still covers twice the largest output, and the outputs are produced from largest to smallest,
+    each one resized from the previous one instead of from the full-size pixels.
+    """
+    with Image.open(orig_path) as img:
+        sizes = sorted(get_derivative_sizes(img.size), reverse=True)
+        outputs = [
+            {"width": size[0], "height": size[1], "format": fmt, "path": get_derivative_path(orig_path, size, ext)}
+            for size in sizes
+            for fmt, (ext, _) in DERIVATIVE_FORMATS.items()
+        ]
+        missing = [size for size in sizes if any(
+            not os.path.exists(output["path"]) for output in outputs if (output["width"], output["height"]) == size
+        )]
+        if missing:
+            _write_derivatives(img, missing, outputs)
+
+    for output in outputs:
+        output["bytes"] = os.path.getsize(output["path"])
+        output["checksum"] = get_file_checksum(output["path"])
+    return outputs
+
+
+def _write_derivatives(img, missing, outputs):
+    largest = missing[0]
+    img.draft(None, (largest[0] * 2, largest[1] * 2))
+    img.load()
+    source = img
+    previous = None
+    for size in missing:
+        # Downscale from the previous output when it is itself a downscale, never from an upscaled one
+        base = previous if previous is not None and previous.width < source.width else source
+        resized = base if base.size == size else base.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        for output in outputs:
+            if (output["width"], output["height"]) == size and not os.path.exists(output["path"]):
+                _save(resized, output["path"], output["format"], get_derivative_quality(size[0]))
+        previous = resized
+
+
+def _save(img, path, fmt, quality):
+    if fmt != "jpeg" and img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGB")  # e.g. CMYK JPEGs
+    img.save(path, format=fmt, quality=quality)
+
+
+def create_resized_version(orig_path, path, width, height=0):
+    """
+    Writes a single resized version of an image to `path`, for the on-demand resizing endpoint.
+    A height of 0 keeps the aspect ratio, otherwise the image is cropped around its center to
+    fill the box. Images are never upscaled. The file appears atomically.
+    """
+    with Image.open(orig_path) as img:
+        fmt = img.format.lower()
+        width = min(width, img.width)
+        height = min(height, img.height) if height else max(1, round(img.height * width / img.width))
+        img.draft(None, (width * 2, height * 2))
+        resized = ImageOps.fit(img, (width, height), Image.Resampling.LANCZOS)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    _save(resized, tmp_path, fmt, get_derivative_quality(width))
+    os.replace(tmp_path, path)
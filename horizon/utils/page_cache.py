@@ -0,0 +1,173 @@
+"""
+Opt-in full-page cache for the horizon views, enabled with settings.PAGE_CACHE_ENABLED.
+
+Pages are cached by path and query string. While a view runs it records the dependencies of its
+page (`content:<id>`, `author:<id>`, `type:<name>`, `tag:<name>`, `category:<name>` and
+`content-list` for anything listing recent content). Every dependency has a version in the cache,
+and a cached page stores the versions it was rendered with. Invalidating a dependency bumps its
+version, so exactly the pages that used it miss on their next request.
+
+Every invalidation also bumps the version of ANY_DEPENDENCY. A page is only stored if that version
+didn't change while its view ran, so the versions it stores are the ones from before the view read
+the database: a change committed during the render can't be stored as seen.
+
+Cached pages also store gzip (and brotli) variants of their body, compressed once when the page
+is rendered. Responses use the best variant the client's Accept-Encoding allows.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from horizon.utils.compression import choose_encoding, compress_variants
+
+
+PAGE_KEY_PREFIX = "horizon-page:"
+DEPENDENCY_KEY_PREFIX = "horizon-page-dep:"
+STATS_KEY_PREFIX = "horizon-page-stats:"
+STATS = ("hits", "misses", "invalidations")
+ANY_DEPENDENCY = "*"
+
+
+def is_page_cache_enabled():
+    return getattr(settings, "PAGE_CACHE_ENABLED", False)
+
+
+def _page_key(request):
+    return PAGE_KEY_PREFIX + hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+
+def _dependency_key(dependency):
+    return DEPENDENCY_KEY_PREFIX + hashlib.md5(dependency.encode()).hexdigest()
+
+
+def _count(stat, delta=1):
+    key = STATS_KEY_PREFIX + stat
+    if not cache.add(key, delta, timeout=None):
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, timeout=None)
+
+
+def get_page_cache_stats():
+    """
+    Returns the hit, miss and invalidation counters.
+    """
+    values = cache.get_many([STATS_KEY_PREFIX + stat for stat in STATS])
+    return {stat: values.get(STATS_KEY_PREFIX + stat, 0) for stat in STATS}
+
+
+def _get_versions(dependencies):
+    """
+    Returns the current version of each dependency, creating versions that don't exist yet.
+    New versions start from the clock so an evicted version never matches an old page again.
+    """
+    keys = {dependency: _dependency_key(dependency) for dependency in dependencies}
+    versions = cache.get_many(list(keys.values()))
+    missing = [key for key in keys.values() if key not in versions]
+    if missing:
+        initial = time.time_ns()
+        for key in missing:
+            cache.add(key, initial, timeout=None)
+        versions.update(cache.get_many(missing))
+    return {dependency: versions.get(key) for dependency, key in keys.items()}
+
+
+def invalidate_page_dependencies(dependencies):
+    """
+    Bumps the version of every dependency, which invalidates the pages that used it, and of
+    ANY_DEPENDENCY, which keeps the pages being rendered from being stored.
+    """
+    dependencies = set(dependencies)
+    if not dependencies:
+        return
+    for dependency in (*dependencies, ANY_DEPENDENCY):
+        try:
+            cache.incr(_dependency_key(dependency))
+        except ValueError:
+            pass  # No page uses it yet
+    _count("invalidations", len(dependencies))
+
+
+def record_page_dependencies(request, *dependencies):
+    """
+    Adds dependencies to the page being rendered. Does nothing when the page isn't being cached.
+    """
+    recorded = getattr(request, "page_dependencies", None)
+    if recorded is not None:
+        recorded.update(dependencies)
+
+
+def record_content_dependencies(request, contents):
+    """
+    Records the contents shown on the page and their authors.
+    """
+    if getattr(request, "page_dependencies", None) is None:
+        return
+    for content in contents:
+        record_page_dependencies(request, f"content:{content.pk}", f"author:{content.author_id}")
+
+
+def page_cache(view):
+    """
+    Caches the successful GET responses of a view with the dependencies it records.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_page_cache_enabled() or request.method not in ("GET", "HEAD"):
+            return view(request, *args, **kwargs)
+
+        key = _page_key(request)
+        entry = cache.get(key)
+        if entry is not None and _get_versions(entry["versions"]) == entry["versions"]:
+            _count("hits")
+            return _get_response(request, entry, "HIT")
+
+        _count("misses")
+        generation = _get_versions([ANY_DEPENDENCY])
+        request.page_dependencies = set()
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming:
+            response["X-Page-Cache"] = "MISS"
+            return response
+
+        versions = _get_versions(request.page_dependencies | {ANY_DEPENDENCY})
+        if versions.pop(ANY_DEPENDENCY) != generation[ANY_DEPENDENCY]:
+            # Something was invalidated while the view ran, maybe after it read it: don't store the page
+            response["X-Page-Cache"] = "MISS"
+            return response
+
+        entry = {
+            "content": response.content,
+            "content_type": response["Content-Type"],
+            "variants": compress_variants(response.content),
+            "versions": versions,
+        }
+        cache.set(key, entry, getattr(settings, "PAGE_CACHE_TIMEOUT", 60 * 60 * 24))
+        return _get_response(request, entry, "MISS", response)
+
+    return wrapper
+
+
+def _get_response(request, entry, status, response=None):
+    """
+    Returns the response for a cache entry, with the best encoded variant for the request.
+    On a miss, `response` is the view's response, which keeps its other headers.
+    """
+    if response is None:
+        response = HttpResponse(content_type=entry["content_type"])
+    variants = entry.get("variants", {})
+    encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING"), variants)
+    response.content = variants[encoding] if encoding else entry["content"]
+    if encoding:
+        response["Content-Encoding"] = encoding
+    if variants:
+        patch_vary_headers(response, ["Accept-Encoding"])
+    response["Content-Length"] = str(len(response.content))
+    response["X-Page-Cache"] = status
+    return response
@@ -0,0 +1,99 @@
+"""
+Keyset (cursor) pagination for the listings, newest first on (published_at, id).
+
+A page is addressed by the cursor of the last item before it, `?after=<cursor>`, and fetched
+with an indexed range condition instead of an OFFSET, so every page costs the same and there
+is no COUNT. The previous page is found the same way, looking back from the first item, so
+both links are `?after=` cursors (or the bare path for the first page) and a given page is
+always reached through the same URL, which keeps the page cache and the static export simple.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(published_at, pk):
+    return f"{(published_at - _EPOCH) // _MICROSECOND}-{pk}"
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (published_at, id) of a cursor, or None when it is missing or invalid.
+    """
+    micros, _, pk = (cursor or "").rpartition("-")
+    try:
+        return _EPOCH + int(micros) * _MICROSECOND, int(pk)
+    except (ValueError, OverflowError):
+        return None
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, has_previous, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.has_next = next_cursor is not None
+        self.has_previous = has_previous
+        self.previous_cursor = previous_cursor  # None when the previous page is the first one
+        self.is_first = not has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Paginates a queryset of contents by (published_at, id), newest first. Two queries per page
+    after the first one: the page itself, and the few keys needed for the previous link.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def get_page(self, cursor=None):
+        after = decode_cursor(cursor)
+        contents = self.queryset.order_by("-published_at", "-pk")
+        if after:
+            published_at, pk = after
+            # The leading `published_at <=` is the range the index scan starts from, the rest breaks ties
+            contents = contents.filter(Q(published_at__lt=published_at) | Q(pk__lt=pk), published_at__lte=published_at)
+
+        object_list = list(contents[:self.per_page + 1])
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[:self.per_page]
+            next_cursor = encode_cursor(object_list[-1].published_at, object_list[-1].pk)
+
+        previous_cursor = None
+        if after:
+            # The previous page is the `per_page` items up to and including the cursor's,
+            # and it starts after the item just newer than those.
+            keys = list(
+                self.queryset.filter(Q(published_at__gt=published_at) | Q(pk__gte=pk), published_at__gte=published_at)
+                .order_by("published_at", "pk")
+                .values_list("published_at", "pk")[:self.per_page + 1]
+            )
+            if len(keys) > self.per_page:
+                previous_cursor = encode_cursor(*keys[-1])
+
+        return CursorPage(object_list, next_cursor, after is not None, previous_cursor)
+
+    def get_cursors(self):
+        """
+        Returns the cursor of every page after the first, reading only the keys.
+        """
+        cursors = []
+        keys = self.queryset.order_by("-published_at", "-pk").values_list("published_at", "pk")
+        previous = None
+        for index, key in enumerate(keys.iterator()):
+            if index and index % self.per_page == 0:
+                cursors.append(encode_cursor(*previous))
+            previous = key
+        return cursors
@@ -0,0 +1,94 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+class QueryRecorder:
+    """
+    Records the queries run on a connection through `connection.execute_wrapper`:
+    query count, duplicate queries, total DB time and rows fetched.
+    """
+
+    def __init__(self):
+        self.queries = []  # (sql, params, duration) tuples
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self._count_fetched_rows(context["cursor"])
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, params, time.perf_counter() - start))
+
+    def _count_fetched_rows(self, cursor):
+        # CursorWrapper forwards fetch* to the DB cursor through __getattr__, so
+        # instance attributes can shadow them. Wrap each cursor only once.
+        if getattr(cursor, "_query_recorder", None) is self:
+            return
+        cursor._query_recorder = self
+        db_cursor = cursor.cursor
+
+        def fetchone():
+            row = db_cursor.fetchone()
+            self.rows += row is not None
+            return row
+
+        def fetchmany(size=db_cursor.arraysize):
+            rows = db_cursor.fetchmany(size)
+            self.rows += len(rows)
+            return rows
+
+        def fetchall():
+            rows = db_cursor.fetchall()
+            self.rows += len(rows)
+            return rows
+
+        cursor.fetchone, cursor.fetchmany, cursor.fetchall = fetchone, fetchmany, fetchall
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duplicates(self):
+        """
+        Returns the number of queries that repeat an earlier query with the same SQL and params.
+        """
+        counts = Counter((sql, repr(params)) for sql, params, _ in self.queries)
+        return sum(count - 1 for count in counts.values())
+
+    @property
+    def time(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    def get_headers(self):
+        return {
+            "X-DB-Query-Count": str(self.count),
+            "X-DB-Duplicate-Queries": str(self.duplicates),
+            "X-DB-Time-Ms": f"{self.time * 1000:.2f}",
+            "X-DB-Rows": str(self.rows),
+        }
+
+
+@contextmanager
+def record_queries():
+    """
+    Records every query run on the default connection inside the block.
+    """
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+
+
+def query_budget(queries):
+    """
+    Declares the maximum number of queries a view may run per request.
+    QueryBudgetMiddleware reports it in debug mode and the view tests enforce it.
+    """
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
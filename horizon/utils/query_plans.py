@@ -0,0 +1,107 @@
+"""
+Checks the SQLite query plans of the views' queries.
+
+audit_view() runs a view, records its queries (see horizon.utils.query_budget) and runs
+EXPLAIN QUERY PLAN on each one. Steps that read a whole table or index (SCAN) or sort rows in
+a temporary B-tree (USE TEMP B-TREE) are reported as problems: both grow with the table, where
+an index search is bounded by the rows the page shows.
+"""
+import re
+
+from django.db import connection
+from django.test import RequestFactory
+
+from horizon.utils.query_budget import record_queries
+
+
+# Plan steps that are bounded even though they match PROBLEM_STEPS
+ALLOWED_STEPS = (
+    re.compile(r"SCAN \w+ VIRTUAL TABLE INDEX \d+:M"),  # FTS5 MATCH lookup
+    re.compile(r"SCAN CONSTANT ROW"),
+    # The taxonomy registry reads these small tables whole, once per process (see horizon.utils.taxonomy)
+    re.compile(r"SCAN horizon_(type|tag|category)$"),
+)
+PROBLEM_STEPS = re.compile(r"^(SCAN |USE TEMP B-TREE)")
+ORDERED_INDEX_SCAN = re.compile(r"^SCAN \w+ USING (COVERING )?INDEX ")
+LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+
+def explain(sql, params):
+    """
+    Returns the steps of a query's plan, indented by depth.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        rows = cursor.fetchall()
+
+    depths = {0: -1}
+    steps = []
+    for step_id, parent_id, _, detail in rows:
+        depths[step_id] = depths.get(parent_id, -1) + 1
+        steps.append("  " * depths[step_id] + detail)
+    return steps
+
+
+def get_plan_problems(sql, steps):
+    """
+    Returns the steps of a plan that grow with the table. An index scan is fine in a query with a
+    LIMIT and no sort: the index delivers the order and the scan stops once the page is full.
+    Sorting the matches of a full-text search (ranked by relevance) is expected.
+    """
+    steps = [step.strip() for step in steps]
+    sorts = any(step.startswith("USE TEMP B-TREE") for step in steps)
+    full_text = any(step.startswith("SCAN") and "VIRTUAL TABLE" in step for step in steps)
+    problems = []
+    for step in steps:
+        if not PROBLEM_STEPS.match(step) or any(allowed.match(step) for allowed in ALLOWED_STEPS):
+            continue
+        if ORDERED_INDEX_SCAN.match(step) and LIMIT.search(sql) and not sorts:
+            continue
+        if step == "USE TEMP B-TREE FOR ORDER BY" and full_text:
+            continue
+        problems.append(step)
+    return problems
+
+
+def audit_view(view, path, **view_kwargs):
+    """
+    Runs a view and returns [(sql, params, plan steps, problems)] for each distinct query it ran.
+    """
+    request = RequestFactory().get(path)
+    with record_queries() as recorder:
+        view(request, **view_kwargs)
+
+    audited = []
+    seen = set()
+    for sql, params, _ in recorder.queries:
+        if sql in seen or not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        seen.add(sql)
+        steps = explain(sql, params)
+        audited.append((sql, params, steps, get_plan_problems(sql, steps)))
+    return audited
+
+
+def get_audited_pages():
+    """
+    Returns [(view, path, view kwargs)] covering every listing query shape: first and later pages,
+    a detail page and a search.
+    """
+    from horizon.models import Content
+    from horizon.utils.pagination import CursorPaginator
+    from horizon.views import _get_filtered_content, content_detail, home, news_type_page, products_category_page, search
+
+    pages = [(home, "/", {}), (news_type_page, "/news/", {}), (products_category_page, "/products/", {})]
+    for view, path, per_page, contents in (
+        (news_type_page, "/news/", 4, Content.objects.filter(type__name="news", publish=True)),
+        (products_category_page, "/products/", 2, _get_filtered_content(include_categories=["products"])),
+    ):
+        cursors = CursorPaginator(contents, per_page).get_cursors()
+        if cursors:
+            pages.append((view, f"{path}?after={cursors[0]}", {}))
+
+    latest = Content.objects.filter(publish=True, type__isnull=False).select_related("type").order_by("-published_at").first()
+    if latest:
+        pages.append((content_detail, f"/{latest.type.name}/{latest.slug}/", {"type": latest.type.name, "slug": latest.slug}))
+        pages.append((search, f"/search/?q={latest.title.split()[0]}", {}))
+    return pages
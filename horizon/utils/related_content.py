@@ -0,0 +1,256 @@
+"""
+Maintains the RelatedContent index used by the detail page.
+
+Related posts share at least one category or tag with the content. They are scored by
+shared categories, shared tags, same type and recency, and the top RELATED_CONTENT_LIMIT
+are stored per content. Recency is measured against the content's own publish date, so
+scores don't drift over time and stored entries stay valid until something changes.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from horizon.utils.page_cache import invalidate_page_dependencies, is_page_cache_enabled
+
+
+RELATED_CONTENT_LIMIT = 6
+
+CATEGORY_WEIGHT = 3.0
+TAG_WEIGHT = 2.0
+TYPE_WEIGHT = 1.0
+RECENCY_WEIGHT = 2.0
+RECENCY_HALF_LIFE_DAYS = 30
+
+# Only the most recent published contents of each category/tag are considered as candidates.
+# This bounds the work per content when a category holds most of the site.
+CANDIDATES_PER_TERM = 500
+
+
+def _get_models():
+    from horizon.models import Content, RelatedContent
+    return Content, RelatedContent
+
+
+def _score(shared_categories, shared_tags, same_type, published_at, reference):
+    age_days = abs((reference - published_at).total_seconds()) / 86400
+    return (
+        CATEGORY_WEIGHT * shared_categories
+        + TAG_WEIGHT * shared_tags
+        + TYPE_WEIGHT * same_type
+        + RECENCY_WEIGHT * 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    )
+
+
+def _rank(pk, type_id, published_at, categories, tags, category_postings, tag_postings, candidates):
+    """
+    Returns the top [(related_pk, score)] for a content, given the candidate postings of its terms
+    and `candidates` mapping each published pk to (type_id, published_at).
+    """
+    shared = defaultdict(lambda: [0, 0])
+    for category_id in categories:
+        for candidate_pk in category_postings.get(category_id, ()):
+            shared[candidate_pk][0] += 1
+    for tag_id in tags:
+        for candidate_pk in tag_postings.get(tag_id, ()):
+            shared[candidate_pk][1] += 1
+    shared.pop(pk, None)
+
+    ranked = []
+    for candidate_pk, (shared_categories, shared_tags) in shared.items():
+        candidate_type_id, candidate_published_at = candidates[candidate_pk]
+        same_type = type_id is not None and candidate_type_id == type_id
+        score = _score(shared_categories, shared_tags, same_type, candidate_published_at, published_at)
+        ranked.append((score, candidate_published_at, candidate_pk))
+
+    ranked.sort(reverse=True)
+    return [(candidate_pk, score) for score, _, candidate_pk in ranked[:RELATED_CONTENT_LIMIT]]
+
+
+def _load_terms(content_ids=None):
+    """
+    Returns {pk: (category_ids, tag_ids)} for the given contents, or all contents.
+    """
+    Content, _ = _get_models()
+    terms = defaultdict(lambda: (set(), set()))
+    for through, field, index in ((Content.categories.through, "category_id", 0), (Content.tags.through, "tag_id", 1)):
+        rows = through.objects.all()
+        if content_ids is not None:
+            rows = rows.filter(content_id__in=content_ids)
+        for content_id, term_id in rows.values_list("content_id", field).iterator():
+            terms[content_id][index].add(term_id)
+    return terms
+
+
+def _query_postings(term_field, term_ids, candidates):
+    """
+    Returns {term_id: [pk, ...]} with the most recent published contents of each term,
+    and records their (type_id, published_at) in `candidates`.
+    """
+    Content, _ = _get_models()
+    postings = {}
+    for term_id in term_ids:
+        rows = (
+            Content.objects.filter(**{term_field: term_id}, publish=True)
+            .order_by("-published_at")
+            .values_list("pk", "type_id", "published_at")[:CANDIDATES_PER_TERM]
+        )
+        postings[term_id] = []
+        for pk, type_id, published_at in rows:
+            candidates[pk] = (type_id, published_at)
+            postings[term_id].append(pk)
+    return postings
+
+
+def _replace_entries(ranked_by_pk):
+    """
+    Replaces the stored related entries of every content in `ranked_by_pk`.
+    """
+    Content, RelatedContent = _get_models()
+    with transaction.atomic():
+        RelatedContent.objects.filter(content_id__in=list(ranked_by_pk)).delete()
+        RelatedContent.objects.bulk_create([
+            RelatedContent(content_id=pk, related_id=related_pk, score=score)
+            for pk, ranked in ranked_by_pk.items()
+            for related_pk, score in ranked
+        ])
+        Content.objects.filter(pk__in=list(ranked_by_pk)).update(related_updated_at=timezone.now())
+
+    if is_page_cache_enabled():
+        invalidate_page_dependencies(f"related:{pk}" for pk in ranked_by_pk)
+
+
+def recompute_related_content(content_ids):
+    """
+    Recomputes the related entries of the given contents from scratch.
+    """
+    Content, _ = _get_models()
+    content_ids = set(content_ids)
+    rows = Content.objects.filter(pk__in=content_ids).values_list("pk", "type_id", "published_at")
+    rows = {pk: (type_id, published_at) for pk, type_id, published_at in rows}
+    terms = _load_terms(list(rows))
+
+    candidates = {}
+    category_postings = _query_postings("categories", {c for cats, _ in terms.values() for c in cats}, candidates)
+    tag_postings = _query_postings("tags", {t for _, tags in terms.values() for t in tags}, candidates)
+
+    _replace_entries({
+        pk: _rank(pk, type_id, published_at, *terms[pk], category_postings, tag_postings, candidates)
+        for pk, (type_id, published_at) in rows.items()
+    })
+
+
+def update_related_content(content_id):
+    """
+    Updates the index after a content was saved, (un)published or had its categories/tags changed.
+
+    The content's own entries are recomputed. It is then merged into the lists of the contents it
+    now shares a category or tag with (the recent candidates of its terms). Lists it has to leave,
+    or where its score dropped, are recomputed.
+    """
+    Content, RelatedContent = _get_models()
+    recompute_related_content([content_id])
+
+    row = Content.objects.filter(pk=content_id).values_list("type_id", "published_at", "publish").first()
+    listing_ids = set(RelatedContent.objects.filter(related_id=content_id).values_list("content_id", flat=True))
+    if row is None:
+        recompute_related_content(listing_ids)
+        return
+
+    type_id, published_at, publish = row
+    categories, tags = _load_terms([content_id])[content_id]
+
+    # Contents that share a term with this one, and how many terms they share
+    candidates = {}
+    category_postings = _query_postings("categories", categories, candidates)
+    tag_postings = _query_postings("tags", tags, candidates)
+    shared = defaultdict(lambda: [0, 0])
+    for index, postings in ((0, category_postings), (1, tag_postings)):
+        for pks in postings.values():
+            for pk in pks:
+                shared[pk][index] += 1
+    shared.pop(content_id, None)
+    if not publish:
+        shared = {}
+
+    entries = defaultdict(dict)
+    for pk, related_pk, score in RelatedContent.objects.filter(content_id__in=set(shared) | listing_ids).values_list(
+        "content_id", "related_id", "score"
+    ):
+        entries[pk][related_pk] = score
+
+    stale = listing_ids - set(shared)
+    merged = {}
+    for pk, (shared_categories, shared_tags) in shared.items():
+        neighbour_type_id, neighbour_published_at = candidates[pk]
+        same_type = type_id is not None and neighbour_type_id == type_id
+        score = _score(shared_categories, shared_tags, same_type, published_at, neighbour_published_at)
+        ranked = entries[pk]
+        old_score = ranked.get(content_id)
+
+        if old_score is not None:
+            if score < old_score and len(ranked) >= RELATED_CONTENT_LIMIT:
+                stale.add(pk)  # Something outside the list may now rank higher
+            elif score != old_score:
+                ranked[content_id] = score
+                merged[pk] = ranked
+        elif len(ranked) < RELATED_CONTENT_LIMIT or score > min(ranked.values()):
+            ranked[content_id] = score
+            if len(ranked) > RELATED_CONTENT_LIMIT:
+                del ranked[min(ranked, key=ranked.get)]
+            merged[pk] = ranked
+
+    if merged:
+        _replace_entries({pk: list(ranked.items()) for pk, ranked in merged.items() if pk not in stale})
+    if stale:
+        recompute_related_content(stale)
+
+
+def rebuild_related_content(batch_size=1000, stdout=None):
+    """
+    Rebuilds the whole index in memory with a handful of queries. Returns the number of contents indexed.
+    """
+    Content, RelatedContent = _get_models()
+    contents = {}
+    candidates = {}
+    for pk, type_id, published_at, publish in Content.objects.values_list(
+        "pk", "type_id", "published_at", "publish"
+    ).iterator():
+        contents[pk] = (type_id, published_at)
+        if publish:
+            candidates[pk] = (type_id, published_at)
+
+    terms = _load_terms()
+    category_postings = defaultdict(list)
+    tag_postings = defaultdict(list)
+    for pk in candidates:
+        categories, tags = terms.get(pk, ((), ()))
+        for category_id in categories:
+            category_postings[category_id].append(pk)
+        for tag_id in tags:
+            tag_postings[tag_id].append(pk)
+    for postings in (category_postings, tag_postings):
+        for term_id, pks in postings.items():
+            pks.sort(key=lambda pk: candidates[pk][1], reverse=True)
+            del pks[CANDIDATES_PER_TERM:]
+
+    with transaction.atomic():
+        RelatedContent.objects.all().delete()
+        batch = []
+        for done, (pk, (type_id, published_at)) in enumerate(contents.items(), 1):
+            categories, tags = terms.get(pk, ((), ()))
+            ranked = _rank(pk, type_id, published_at, categories, tags, category_postings, tag_postings, candidates)
+            for related_pk, score in ranked:
+                batch.append(RelatedContent(content_id=pk, related_id=related_pk, score=score))
+            if len(batch) >= batch_size:
+                RelatedContent.objects.bulk_create(batch)
+                batch = []
+            if stdout and done % batch_size == 0:
+                stdout.write(f"{done}/{len(contents)} contents indexed")
+        RelatedContent.objects.bulk_create(batch)
+        Content.objects.update(related_updated_at=timezone.now())
+
+    if is_page_cache_enabled():
+        invalidate_page_dependencies(f"related:{pk}" for pk in contents)
+
+    return len(contents)
@@ -0,0 +1,156 @@
+"""
+Full-text search over contents, backed by an SQLite FTS5 table.
+
+horizon_content_search has one row per content (rowid = content id) with its title, description,
+body text (html_body without markup) and tag/category names. Signals keep it in sync (see
+horizon/signals.py) and rebuild_search_index() fills it from scratch.
+
+Results are ranked by BM25 with per-column weights and paginated with a keyset cursor on
+(score, content id), so deep pages cost the same as the first one.
+"""
+import html
+import re
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.utils.html import escape, strip_tags
+
+
+SEARCH_TABLE = "horizon_content_search"
+
+# BM25 weights of the title, description, body and terms columns
+COLUMN_WEIGHTS = (10.0, 4.0, 1.0, 5.0)
+
+SEARCH_PAGE_SIZE = 10
+MAX_QUERY_TERMS = 10
+SNIPPET_TOKENS = 24
+
+# snippet() markers, replaced by <mark> tags once the snippet is escaped
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+INDEX_BATCH_SIZE = 500
+
+
+def _get_model():
+    from horizon.models import Content
+    return Content
+
+
+def get_body_text(html_body):
+    """
+    Returns the text of a rendered body, with tags replaced by spaces so words don't run together.
+    """
+    return " ".join(html.unescape(strip_tags((html_body or "").replace("<", " <"))).split())
+
+
+def index_contents(content_ids):
+    """
+    Updates the search rows of the given contents, removing those that no longer exist.
+    """
+    Content = _get_model()
+    content_ids = list(content_ids)
+    for start in range(0, len(content_ids), INDEX_BATCH_SIZE):
+        ids = content_ids[start:start + INDEX_BATCH_SIZE]
+        terms = defaultdict(list)
+        for through, field in ((Content.tags.through, "tag__name"), (Content.categories.through, "category__name")):
+            for content_id, name in through.objects.filter(content_id__in=ids).values_list("content_id", field):
+                terms[content_id].append(name)
+        rows = [
+            (pk, title, description, get_body_text(html_body or body), " ".join(terms[pk]))
+            for pk, title, description, html_body, body in Content.objects.filter(pk__in=ids).values_list(
+                "pk", "title", "description", "html_body", "body"
+            )
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids)
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, body, terms) VALUES (%s, %s, %s, %s, %s)", rows
+            )
+
+
+def remove_contents(content_ids):
+    content_ids = list(content_ids)
+    if content_ids:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(content_ids))})", content_ids)
+
+
+def rebuild_search_index():
+    """
+    Rebuilds the whole search table. Returns the number of contents indexed.
+    """
+    Content = _get_model()
+    content_ids = list(Content.objects.order_by("pk").values_list("pk", flat=True))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        index_contents(content_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return len(content_ids)
+
+
+def get_match_query(query):
+    """
+    Turns user input into an FTS5 MATCH expression: every word must match, and the last one
+    matches as a prefix so results show up while typing. Returns "" when there is nothing to search.
+    """
+    words = re.findall(r"\w+", query)[:MAX_QUERY_TERMS]
+    if not words:
+        return ""
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def get_matching_ids_sql(query):
+    """
+    Returns (sql, params) selecting the ids of every content matching `query`, published or not.
+    Used by the admin as a subquery.
+    """
+    return f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [get_match_query(query)]
+
+
+def parse_cursor(cursor):
+    """
+    Returns the (score, content id) of a cursor made by search_contents(), or None when it is invalid.
+    """
+    score, _, pk = (cursor or "").partition(":")
+    try:
+        return float(score), int(pk)
+    except ValueError:
+        return None
+
+
+def _format_snippet(snippet):
+    return escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def search_contents(query, after=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Returns ([(content id, snippet HTML)], next cursor) for the published contents matching `query`,
+    best first, starting after the (score, content id) `after`. The cursor is None on the last page.
+    """
+    match = get_match_query(query)
+    if not match:
+        return [], None
+
+    bm25 = f"bm25({SEARCH_TABLE}, {', '.join(map(str, COLUMN_WEIGHTS))})"
+    sql = (
+        f"SELECT {SEARCH_TABLE}.rowid, {bm25} AS score,"
+        f" snippet({SEARCH_TABLE}, -1, %s, %s, %s, {SNIPPET_TOKENS})"
+        f" FROM {SEARCH_TABLE} JOIN horizon_content ON horizon_content.id = {SEARCH_TABLE}.rowid"
+        f" WHERE {SEARCH_TABLE} MATCH %s AND horizon_content.publish AND horizon_content.type_id IS NOT NULL"
+    )
+    params = [_MARK_START, _MARK_END, "…", match]
+    if after:
+        sql += f" AND ({bm25}, {SEARCH_TABLE}.rowid) > (%s, %s)"
+        params += list(after)
+    sql += f" ORDER BY score, {SEARCH_TABLE}.rowid LIMIT %s"
+    params.append(limit + 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    next_cursor = f"{rows[limit - 1][1]!r}:{rows[limit - 1][0]}" if len(rows) > limit else None
+    return [(pk, _format_snippet(snippet)) for pk, _, snippet in rows[:limit]], next_cursor
@@ -0,0 +1,149 @@
+"""
+Composes the curated sections of a page ("Home Featured", the featured contents of each product
+category...) from one pass over the database.
+
+A page declares its sections by category and tag names, resolved to ids by the taxonomy registry
+(see horizon.utils.taxonomy). compose_sections() reads, in a single query, the terms of the
+newest published contents that could be in each section, a few per slot, with their publication
+dates from the cards (see horizon.utils.cards), partitions them in Python and loads the cards of
+the chosen contents in a second query. A section whose other conditions reject most of its
+candidates reads all of them in one more query. Sections without any term (the latest contents)
+add one query each, for their keys only.
+"""
+from django.db.models import Exists, OuterRef, Q, Value
+
+from horizon.utils.taxonomy import CATEGORY, TAG, get_taxonomy
+
+
+# A section with a limit reads this many candidates per slot before its other conditions filter them
+CANDIDATES_PER_SLOT = 4
+
+
+def _get_models():
+    from horizon.models import Content, ContentCard
+    return Content, ContentCard
+
+
+class Section:
+    """
+    Published contents that have any of `include_categories`, any of `filter_categories`, any of
+    `include_tags` and none of `exclude_categories` or `exclude_tags`, newest first. Empty
+    conditions are ignored, so a section without any term lists the latest contents.
+    """
+
+    def __init__(self, include_categories=(), filter_categories=(), exclude_categories=(),
+                 include_tags=(), exclude_tags=(), limit=None):
+        self.include_categories = tuple(include_categories)
+        self.filter_categories = tuple(filter_categories)
+        self.exclude_categories = tuple(exclude_categories)
+        self.include_tags = tuple(include_tags)
+        self.exclude_tags = tuple(exclude_tags)
+        self.limit = limit
+        if not self.get_driving_terms() and limit is None:
+            raise ValueError("A section without categories or tags needs a limit.")
+
+    def get_driving_terms(self):
+        """
+        Returns (kind, names) of the condition every content of the section must meet and that
+        is likely the most selective: tags are curated, categories are broad.
+        """
+        for kind, names in ((TAG, self.include_tags), (CATEGORY, self.filter_categories), (CATEGORY, self.include_categories)):
+            if names:
+                return kind, names
+        return None
+
+    def get_terms(self):
+        return {
+            CATEGORY: {*self.include_categories, *self.filter_categories, *self.exclude_categories},
+            TAG: {*self.include_tags, *self.exclude_tags},
+        }
+
+    def matches(self, terms):
+        """
+        Whether a content with `terms`, a set of (kind, name), belongs to the section.
+        """
+        def has_any(kind, names):
+            return any((kind, name) in terms for name in names)
+
+        return (
+            (not self.include_categories or has_any(CATEGORY, self.include_categories))
+            and (not self.filter_categories or has_any(CATEGORY, self.filter_categories))
+            and (not self.include_tags or has_any(TAG, self.include_tags))
+            and not has_any(CATEGORY, self.exclude_categories)
+            and not has_any(TAG, self.exclude_tags)
+        )
+
+
+def _get_candidate_terms(sections, bounded=True):
+    """
+    Returns {content id: (published_at, {(kind, name)})} for the published contents that meet the
+    driving condition of a section, with every term any section refers to. One query.
+    With `bounded`, a section with a limit only reads its newest limit * CANDIDATES_PER_SLOT
+    candidates, so the query doesn't grow with the contents of its terms.
+    """
+    Content, ContentCard = _get_models()
+    taxonomy = get_taxonomy()
+    throughs = {CATEGORY: (Content.categories.through, "category_id"), TAG: (Content.tags.through, "tag_id")}
+    referenced = {CATEGORY: set(), TAG: set()}
+    candidates = Q()
+    for section in sections:
+        for kind, names in section.get_terms().items():
+            referenced[kind].update(taxonomy.get_ids(kind, names))
+        kind, names = section.get_driving_terms()
+        ids = taxonomy.get_ids(kind, names)
+        if not ids:
+            continue  # None of its driving terms exist
+        through, field = throughs[kind]
+        driving = through.objects.filter(**{f"{field}__in": ids})
+        if bounded and section.limit is not None:
+            newest = (
+                ContentCard.objects.filter(Exists(driving.filter(content_id=OuterRef("pk"))), publish=True)
+                .order_by("-published_at", "-pk")
+                .values("pk")[:section.limit * CANDIDATES_PER_SLOT]
+            )
+            candidates |= Q(content_id__in=newest)
+        else:
+            candidates |= Q(content_id__in=driving.values("content_id"))
+    if not candidates:
+        return {}
+
+    rows = [
+        through.objects.filter(candidates, **{f"{field}__in": referenced[kind]}, content__card__publish=True)
+        .annotate(kind=Value(kind))
+        .values_list("content_id", "content__card__published_at", field, "kind")
+        for kind, (through, field) in throughs.items() if referenced[kind]
+    ]
+    terms = {}
+    for pk, published_at, term_id, kind in rows[0].union(*rows[1:], all=True):
+        terms.setdefault(pk, (published_at, set()))[1].add((kind, taxonomy.get_by_id(kind, term_id).name))
+    return terms
+
+
+def compose_sections(cards, sections):
+    """
+    Returns {name: [card]} for the `sections` {name: Section}, with the cards loaded from the `cards`
+    queryset (ContentCard, or Content). Two queries for any number of sections with terms, plus one
+    per section without terms, and one per section its bounded candidates couldn't fill.
+    """
+    with_terms = [section for section in sections.values() if section.get_driving_terms()]
+    terms = _get_candidate_terms(with_terms) if with_terms else {}
+
+    def select(section, terms):
+        newest_first = sorted(terms, key=lambda pk: (terms[pk][0], pk), reverse=True)
+        return [pk for pk in newest_first if section.matches(terms[pk][1])][:section.limit]
+
+    selected = {}
+    for name, section in sections.items():
+        if section.get_driving_terms():
+            selected[name] = select(section, terms)
+            kind, names = section.get_driving_terms()
+            read = sum(1 for _, section_terms in terms.values() if any((kind, term) in section_terms for term in names))
+            if section.limit is not None and len(selected[name]) < section.limit <= read // CANDIDATES_PER_SLOT:
+                # Its other conditions rejected most of the newest candidates: read them all
+                selected[name] = select(section, _get_candidate_terms([section], bounded=False))
+        else:
+            latest = cards.filter(publish=True).order_by("-published_at", "-pk").values_list("pk", flat=True)
+            selected[name] = list(latest[:section.limit])
+
+    contents = cards.in_bulk({pk for ids in selected.values() for pk in ids}) if any(selected.values()) else {}
+    return {name: [contents[pk] for pk in ids if pk in contents] for name, ids in selected.items()}
@@ -0,0 +1,148 @@
+"""
+XML sitemaps for published contents: /sitemap.xml is a sitemap index pointing at one shard per
+SHARD_SIZE content IDs (/sitemap-<n>.xml) and at the news sitemap (/sitemap-news.xml).
+
+Shards are streamed from an iterator() queryset. While streaming, a shard is also written to
+settings.SITEMAP_CACHE_DIR under a name made of the count and latest `updated_at` of the published
+contents in its ID range and of the taxonomy version (URLs contain the type name), so it is served
+from disk until a content in that range or a type changes. Checking that takes one aggregate query
+and works the same in every worker process.
+"""
+import glob
+import os
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from horizon.utils.taxonomy import get_taxonomy_version
+
+
+# Search engines accept at most 50,000 URLs per sitemap
+SHARD_SIZE = 50_000
+
+NEWS_TYPE = "news"
+NEWS_MAX_AGE = timedelta(hours=48)
+NEWS_PUBLICATION = "The Game Horizon"
+NEWS_LANGUAGE = "en"
+
+ITERATOR_CHUNK_SIZE = 2000
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+NEWS_NS = "http://www.google.com/schemas/sitemap-news/0.9"
+
+
+def _get_published():
+    from horizon.models import Content
+    return Content.objects.filter(publish=True, type__isnull=False)
+
+
+def _get_url(path):
+    return escape(f"{settings.SITE_URL}/{path}")
+
+
+def get_sitemap_index():
+    """
+    Returns the sitemap index, with the latest modification of every shard. One query.
+    """
+    shards = (
+        _get_published()
+        .annotate(shard=F("pk") / SHARD_SIZE)
+        .values("shard")
+        .annotate(lastmod=Max("updated_at"))
+        .order_by("shard")
+    )
+    parts = [XML_HEADER, f'<sitemapindex xmlns="{SITEMAP_NS}">\n']
+    for row in shards:
+        url = _get_url(f"sitemap-{row['shard']}.xml")
+        parts.append(f"<sitemap><loc>{url}</loc><lastmod>{row['lastmod'].isoformat()}</lastmod></sitemap>\n")
+    parts.append(f"<sitemap><loc>{_get_url('sitemap-news.xml')}</loc></sitemap>\n")
+    parts.append("</sitemapindex>\n")
+    return "".join(parts)
+
+
+def get_shard_cache_path(shard):
+    """
+    Returns the cache file of a shard's current version, or None when the shard is empty.
+    """
+    contents = _get_published().filter(pk__gte=shard * SHARD_SIZE, pk__lt=(shard + 1) * SHARD_SIZE)
+    state = contents.aggregate(count=Count("pk"), updated=Max("updated_at"))
+    if not state["count"]:
+        return None
+    version = f"{state['count']}-{state['updated'].timestamp():.6f}-{get_taxonomy_version()[:12] or 0}"
+    return os.path.join(settings.SITEMAP_CACHE_DIR, f"sitemap-{shard}-{version}.xml")
+
+
+def iter_shard(shard):
+    """
+    Yields the XML of a shard, a few URLs at a time.
+    """
+    contents = (
+        _get_published()
+        .filter(pk__gte=shard * SHARD_SIZE, pk__lt=(shard + 1) * SHARD_SIZE)
+        .select_related("type")
+        .only("slug", "updated_at", "type__name")
+        .order_by("pk")
+    )
+    yield f'{XML_HEADER}<urlset xmlns="{SITEMAP_NS}">\n'
+    batch = []
+    for content in contents.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        batch.append(
+            f"<url><loc>{_get_url(content.get_url_path() + '/')}</loc>"
+            f"<lastmod>{content.updated_at.isoformat()}</lastmod></url>\n"
+        )
+        if len(batch) >= ITERATOR_CHUNK_SIZE:
+            yield "".join(batch)
+            batch = []
+    yield "".join(batch) + "</urlset>\n"
+
+
+def iter_and_cache(chunks, path):
+    """
+    Yields `chunks` while writing them to `path`. The file only appears once complete, and older
+    versions of the same shard are removed. A response closed early (the client disconnected)
+    leaves no temporary file behind.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        shard_prefix = "-".join(os.path.basename(path).split("-")[:2])  # sitemap-<n>
+        for old_path in glob.glob(os.path.join(os.path.dirname(path), f"{shard_prefix}-*.xml")):
+            os.remove(old_path)
+        os.replace(tmp_path, path)
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass  # Moved in place
+
+
+def iter_news_sitemap():
+    """
+    Yields the news sitemap: news published in the last NEWS_MAX_AGE.
+    """
+    contents = (
+        _get_published()
+        .filter(type__name=NEWS_TYPE, published_at__gte=timezone.now() - NEWS_MAX_AGE)
+        .select_related("type")
+        .only("slug", "title", "published_at", "type__name")
+        .order_by("-published_at")
+    )
+    yield f'{XML_HEADER}<urlset xmlns="{SITEMAP_NS}" xmlns:news="{NEWS_NS}">\n'
+    for content in contents.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield (
+            f"<url><loc>{_get_url(content.get_url_path() + '/')}</loc><news:news>"
+            f"<news:publication><news:name>{escape(NEWS_PUBLICATION)}</news:name>"
+            f"<news:language>{NEWS_LANGUAGE}</news:language></news:publication>"
+            f"<news:publication_date>{content.published_at.isoformat()}</news:publication_date>"
+            f"<news:title>{escape(content.title)}</news:title>"
+            f"</news:news></url>\n"
+        )
+    yield "</urlset>\n"
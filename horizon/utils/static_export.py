@@ -0,0 +1,157 @@
+"""
+Renders the public pages to static files for the export_static_site command.
+
+Each page is written to <output>/<url path>/index.html with precompressed .gz (and .br when
+the brotli package is installed) siblings. News pages after the first are written to
+news/after/<cursor>/index.html (see horizon.utils.pagination), so nginx has to map
+`?after=<cursor>` to them, e.g.:
+
+    location = /news/ { try_files /news/after/$arg_after/index.html /news/index.html =404; }
+
+Pages record their dependencies while rendering (see horizon.utils.page_cache). The export
+manifest stores them with a token per dependency, so later runs only re-render the pages
+whose inputs changed. Every token includes the site version (the templates and the HTML
+converter), so the first run after a deploy that changes the markup re-renders every page.
+"""
+import hashlib
+import inspect
+import os
+from collections import defaultdict
+
+from horizon.utils.compression import compress_variants
+from horizon.utils.conditional import get_site_version
+
+
+def get_export_paths():
+    """
+    Returns the URL path of every page to export: home, each news page and each published content.
+    """
+    from horizon.models import Content
+    from horizon.utils.pagination import CursorPaginator
+
+    paths = ["/"]
+    news_cursors = CursorPaginator(Content.objects.filter(type__name="news", publish=True), 4).get_cursors()
+    paths += ["/news/"] + [f"/news/?after={cursor}" for cursor in news_cursors]
+    paths += [
+        f"/{type_name}/{slug}/"
+        for type_name, slug in Content.objects.filter(publish=True, type__isnull=False)
+        .order_by("pk")
+        .values_list("type__name", "slug")
+    ]
+    return paths
+
+
+def get_output_path(output_dir, path):
+    """
+    Maps a URL path to the file it is exported to.
+    """
+    path, _, query = path.partition("?")
+    parts = [part for part in path.split("/") if part]
+    if query.startswith("after="):
+        parts += ["after", query[len("after="):]]
+    return os.path.join(output_dir, *parts, "index.html")
+
+
+def _token(rows):
+    return hashlib.md5(repr(sorted(rows)).encode()).hexdigest()
+
+
+def get_dependency_tokens():
+    """
+    Returns a token for every dependency a page can record. A token changes whenever the
+    rendered output of a page using that dependency may change, the site version included.
+    """
+    from horizon.models import Author, Content, RelatedContent
+
+    # Listings change when contents enter, leave or move within them, which membership and publish
+    # dates capture. Edits to the contents they show are covered by the content:<id> tokens.
+    tokens = {}
+    published_at = {}
+    published = []
+    by_type = defaultdict(list)
+    for pk, updated, created, publish, type_name in Content.objects.values_list(
+        "pk", "updated_at", "published_at", "publish", "type__name"
+    ):
+        tokens[f"content:{pk}"] = updated.isoformat()
+        if publish:
+            published_at[pk] = created.isoformat()
+            published.append((pk, published_at[pk]))
+            by_type[type_name].append((pk, published_at[pk]))
+
+    tokens["content-list"] = _token(published)
+    for type_name, rows in by_type.items():
+        tokens[f"type:{type_name}"] = _token(rows)
+
+    for prefix, through, field in (("tag", Content.tags.through, "tag__name"), ("category", Content.categories.through, "category__name")):
+        by_term = defaultdict(list)
+        for name, content_id in through.objects.filter(content__publish=True).values_list(field, "content_id"):
+            by_term[name].append((content_id, published_at[content_id]))
+        for name, rows in by_term.items():
+            tokens[f"{prefix}:{name}"] = _token(rows)
+
+    for row in Author.objects.values_list():
+        tokens[f"author:{row[0]}"] = _token([row])
+
+    related = defaultdict(list)
+    for content_id, related_id, score in RelatedContent.objects.values_list("content_id", "related_id", "score"):
+        related[content_id].append((related_id, score))
+    for content_id, rows in related.items():
+        tokens[f"related:{content_id}"] = _token(rows)
+
+    site_version = get_site_version()
+    return {dependency: f"{site_version}:{token}" for dependency, token in tokens.items()}
+
+
+def _write(file_path, data):
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+
+
+def write_page(file_path, html):
+    """
+    Writes a page with its precompressed siblings.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    _write(file_path, html)
+    for encoding, content in compress_variants(html).items():
+        _write(f"{file_path}.{'gz' if encoding == 'gzip' else encoding}", content)
+
+
+def remove_page(file_path):
+    for suffix in ("", ".gz", ".br"):
+        if os.path.exists(file_path + suffix):
+            os.remove(file_path + suffix)
+
+
+def init_worker(settings_module):
+    """
+    Sets up Django in a worker process that wasn't forked from a configured one.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+    django.setup()
+
+
+def render_pages(paths, output_dir, host):
+    """
+    Renders and writes the given pages. Returns {path: [dependencies]}.
+    Calls the undecorated views, past @conditional_page and @page_cache, so every page records its dependencies.
+    """
+    from django.test import RequestFactory
+    from django.urls import resolve
+
+    factory = RequestFactory(SERVER_NAME=host)
+    dependencies = {}
+    for path in paths:
+        request = factory.get(path)
+        request.page_dependencies = set()
+        match = resolve(request.path)
+        view = inspect.unwrap(match.func)
+        response = view(request, *match.args, **match.kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        write_page(get_output_path(output_dir, path), response.content)
+        dependencies[path] = sorted(request.page_dependencies)
+    return dependencies
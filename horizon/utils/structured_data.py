@@ -0,0 +1,117 @@
+"""
+JSON-LD structured data of the pages.
+
+The homepage's WebSite block never changes, so it is a constant. The NewsArticle/Article block of
+a content is built when the content is saved and stored, compact, in Content.structured_data, so
+the detail view emits it as is. Content.save() rebuilds it, and the signals refresh the contents of
+an author or type when it is renamed (see horizon/signals.py).
+"""
+import json
+
+from django.utils.html import escape
+from django.utils.timezone import localtime, now
+
+from horizon.utils.bulk_updates import bulk_save
+
+
+SITE_URL = "https://thegamehorizon.com"
+
+PUBLISHER = {
+    "@type": "Organization",
+    "name": "The Game Horizon",
+    "logo": {
+        "@type": "ImageObject",
+        "url": f"{SITE_URL}/static/publisher_256x256.png",
+        "width": 256,
+        "height": 256,
+    },
+}
+
+# schema.org type of each content type, "Article" for the others.
+# Reviews stay Articles: a ReviewNewsArticle needs an itemReviewed block (item name, brand...),
+# otherwise Google Search Console reports a critical issue.
+ARTICLE_TYPES = {"news": "NewsArticle"}
+DEFAULT_ARTICLE_TYPE = "Article"
+
+REFRESH_BATCH_SIZE = 500
+
+
+def dumps(data):
+    return json.dumps(data, separators=(",", ":"))
+
+
+WEBSITE_STRUCTURED_DATA = dumps({
+    "@context": "https://schema.org",
+    "@type": "WebSite",
+    "name": "The Game Horizon",
+    "url": SITE_URL,
+    "description": "Your ultimate source for gaming news, reviews, guides, and more.",
+    "publisher": {**PUBLISHER, "url": SITE_URL},
+    "potentialAction": {
+        "@type": "SearchAction",
+        "target": f"{SITE_URL}/search/?q={{search_term_string}}",
+        "query-input": "required name=search_term_string",
+    },
+})
+
+
+def get_article_structured_data(content, type_name, author_name, published_at, modified_at):
+    """
+    Returns the JSON-LD of a content of type `type_name`, or "" for contents without a type
+    (they have no page).
+    """
+    if not type_name:
+        return ""
+    return dumps({
+        "@context": "https://schema.org",
+        "@type": ARTICLE_TYPES.get(type_name.lower(), DEFAULT_ARTICLE_TYPE),
+        "headline": escape(content.title),
+        "description": escape(content.meta_description),
+        "mainEntityOfPage": {
+            "@type": "WebPage",
+            "@id": f"{SITE_URL}/{type_name}/{content.slug}",
+        },
+        "author": {
+            "@type": "Person",
+            "name": author_name,
+        },
+        "publisher": PUBLISHER,
+        "datePublished": localtime(published_at).isoformat(),
+        "dateModified": localtime(modified_at).isoformat(),
+        "image": content.image_featured or "",
+    })
+
+
+def get_author_name(author):
+    return f"{author.first_name} {author.last_name}"
+
+
+def _without_dates(structured_data):
+    # Content.save() builds the dates microseconds before auto_now sets the stored timestamps
+    data = json.loads(structured_data) if structured_data else {}
+    data.pop("datePublished", None)
+    data.pop("dateModified", None)
+    return data
+
+
+def refresh_structured_data(contents):
+    """
+    Rebuilds the structured data of the `contents` queryset. The contents whose structured data
+    changed, dates aside, are written with bulk_save() and modified now. Returns the number of
+    contents written.
+    """
+    count = 0
+    batch = []
+    for content in contents.select_related("type", "author").iterator(chunk_size=REFRESH_BATCH_SIZE):
+        type_name = content.type.name if content.type else None
+        author_name = get_author_name(content.author)
+        built = get_article_structured_data(content, type_name, author_name, content.published_at, content.updated_at)
+        if _without_dates(built) == _without_dates(content.structured_data):
+            continue
+        content.updated_at = now()
+        content.structured_data = get_article_structured_data(content, type_name, author_name, content.published_at, content.updated_at)
+        batch.append(content)
+        if len(batch) == REFRESH_BATCH_SIZE:
+            count += bulk_save(batch, ["structured_data", "updated_at"])
+            batch = []
+    return count + bulk_save(batch, ["structured_data", "updated_at"])
@@ -0,0 +1,254 @@
+"""
+Synthetic content for the benchmarks and scaling tests, deterministic from a seed.
+
+generate_content() creates authors, types, categories, tags and articles whose bodies use the
+real markup ({p ...}, {figure_img_src_set}...) and whose terms include the curated tags the pages
+list. Everything is inserted with bulk_create(), the m2m through rows included, and the bodies
+are built and rendered by a process pool while the previous batch is inserted.
+
+bulk_create() skips Content.save() and the signals, so generate_content() builds what they
+maintain: publication dates and structured data before the insert, then cards, search rows,
+related content and the taxonomy and listings versions.
+"""
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection, connections, transaction
+
+from horizon.utils.cards import refresh_cards
+from horizon.utils.conditional import invalidate_listings
+from horizon.utils.related_content import rebuild_related_content
+from horizon.utils.search import index_contents
+from horizon.utils.structured_data import get_article_structured_data, get_author_name
+from horizon.utils.taxonomy import invalidate_taxonomy
+from horizon.utils.utils import HTMLConverter
+
+
+TYPES = {"news": 5, "reviews": 2, "guides": 2, "codes": 1}  # Name: weight
+PRODUCT_CATEGORIES = ["hardware", "devices", "wearables", "assistants"]
+PLATFORM_CATEGORIES = ["pc", "playstation", "xbox", "nintendo", "mobile"]
+CATEGORIES = ["products", *PRODUCT_CATEGORIES, *PLATFORM_CATEGORIES]
+TAGS = ["rpg", "shooter", "strategy", "indie", "esports", "multiplayer", "open world", "deals", "hands-on", "patch notes"]
+# Curated tags the pages list: name, share of the candidate articles that have it
+CURATED_TAGS = {"Home Main": 0.005, "Home Featured": 0.02, "Top News": 0.03, "Category Main": 0.05, "Category Featured": 0.1}
+WORDS = (
+    "horizon update season launch review guide console patch boss raid quest arena legend pixel shadow "
+    "frontier echo storm forge drift nova titan rogue saga realm player studio release trailer demo level "
+    "weapon armor skill tree build meta ranked match server controller headset keyboard mouse monitor "
+    "frame rate resolution battery price bundle sequel remaster expansion story world map dungeon"
+).split()
+IMAGE_WIDTHS = (320, 480, 640, 960, 1280)
+
+BATCH_SIZE = 1000
+PUBLISHED_SHARE = 0.95
+FIRST_PUBLISHED_AT = datetime(2020, 1, 1, tzinfo=timezone.utc)
+MINUTES_PER_ARTICLE = 37  # Average time between two publications
+
+
+def _get_models():
+    from horizon.models import Author, Category, Content, Tag, Type
+    return Author, Category, Content, Tag, Type
+
+
+def _sentence(rng, length=(6, 16)):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(*length))).capitalize()
+
+
+def _srcset(name, extension="jpg"):
+    return {f"https://example.com/media/r/{width}x0/{name}.{extension}": f"{width}w" for width in IMAGE_WIDTHS}
+
+
+def _paragraph(rng):
+    sentences = [f"{_sentence(rng)}." for _ in range(rng.randint(2, 6))]
+    if rng.random() < 0.4:
+        sentences.insert(rng.randint(0, len(sentences)), f"{{b {_sentence(rng, (2, 5))} b}}")
+    if rng.random() < 0.3:
+        link = f'{{a {_sentence(rng, (1, 3))} href="https://example.com/{rng.choice(WORDS)}" target="_blank" a}}'
+        sentences.insert(rng.randint(0, len(sentences)), link)
+    return f"{{p {' '.join(sentences)} p}}"
+
+
+def _figure(rng):
+    name = f"images/{rng.choice(WORDS)}-{rng.randrange(10 ** 6)}"
+    lines = [
+        f'    src="https://example.com/media/{name}.jpg"',
+        f'    figcaption="{_sentence(rng, (3, 8))}"',
+        f'    alt="{_sentence(rng, (2, 5))}"',
+        *(f'    srcset="{url} {width}"' for url, width in _srcset(name).items()),
+    ]
+    return "{figure_img_src_set}\n" + "\n".join(lines) + "\n{figure_img_src_set}"
+
+
+def _section(rng):
+    blocks = [f"{{h2 {_sentence(rng, (2, 6))} h2}}", *(_paragraph(rng) for _ in range(rng.randint(1, 4)))]
+    if rng.random() < 0.5:
+        blocks.append(_figure(rng))
+    if rng.random() < 0.3:
+        items = "\n".join(f"    {{li {_sentence(rng, (2, 8))} li}}" for _ in range(rng.randint(2, 6)))
+        blocks.append(f"{{ul\n{items}\nul}}")
+    if rng.random() < 0.4:
+        blocks += [f"{{h3 {_sentence(rng, (2, 6))} h3}}", _paragraph(rng)]
+    if rng.random() < 0.1:
+        blocks.append("{ads_by_google ads_by_google}")
+    if rng.random() < 0.2:
+        blocks.append("{hr hr}")
+    return "\n".join(blocks)
+
+
+def build_article_body(rng, size):
+    """
+    Returns a body of at least `size` characters of varied sections in the article markup.
+    """
+    sections = []
+    length = 0
+    while length < size:
+        sections.append(_section(rng))
+        length += len(sections[-1]) + 1
+    return "\n".join(sections)
+
+
+_converter = None
+
+
+def render_article_body(seed, index, size):
+    """
+    Returns the body of the article `index` of `seed`, its HTML and render hash. Runs in the process pool.
+    """
+    global _converter
+    _converter = _converter or HTMLConverter()
+    body = build_article_body(random.Random(f"{seed}:{index}"), size)
+    return body, _converter.get_html(body), HTMLConverter.get_render_hash(body)
+
+
+def _pick_terms(rng, type_name):
+    """
+    Returns the category and tag names of an article of type `type_name`.
+    """
+    if type_name != "news" and rng.random() < 0.3:
+        categories = ["products", rng.choice(PRODUCT_CATEGORIES)]
+        curated = ["Category Main", "Category Featured"]
+    else:
+        categories = rng.sample(PLATFORM_CATEGORIES, rng.randint(1, 2))
+        curated = ["Home Main", "Home Featured", *(["Top News"] if type_name == "news" else [])]
+    tags = rng.sample(TAGS, rng.randint(0, 3))
+    tags += [name for name in curated if rng.random() < CURATED_TAGS[name]]
+    return categories, tags
+
+
+def _create_terms(Model, names):
+    """
+    Returns {name: object}, creating the objects that don't exist yet.
+    """
+    Model.objects.bulk_create((Model(name=name) for name in names), ignore_conflicts=True)
+    return Model.objects.in_bulk(names, field_name="name")
+
+
+def _insert_batch(articles, rendered, types, categories, tags):
+    """
+    Inserts a batch of articles, with their bodies from the pool, and their category and tag rows.
+    Returns their ids.
+    """
+    _, _, Content, _, _ = _get_models()
+    contents = []
+    for (fields, type_name, _, _), (body, html_body, html_body_hash) in zip(articles, rendered):
+        content = Content(**fields, type=types[type_name], body=body, html_body=html_body, html_body_hash=html_body_hash)
+        # As Content.save() does, modified when published
+        content.structured_data = get_article_structured_data(
+            content, type_name, get_author_name(fields["author"]), fields["published_at"], fields["published_at"],
+        )
+        contents.append(content)
+    with transaction.atomic():
+        Content.objects.bulk_create(contents)
+        # bulk_create() sets the auto_now(_add) dates to now
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "UPDATE horizon_content SET published_at = %s, updated_at = %s WHERE id = %s",
+                [
+                    (*[connection.ops.adapt_datetimefield_value(fields["published_at"])] * 2, content.pk)
+                    for content, (fields, _, _, _) in zip(contents, articles)
+                ],
+            )
+        Content.categories.through.objects.bulk_create(
+            Content.categories.through(content_id=content.pk, category_id=categories[name].pk)
+            for content, (_, _, names, _) in zip(contents, articles) for name in names
+        )
+        Content.tags.through.objects.bulk_create(
+            Content.tags.through(content_id=content.pk, tag_id=tags[name].pk)
+            for content, (_, _, _, names) in zip(contents, articles) for name in names
+        )
+        ids = [content.pk for content in contents]  # Set by bulk_create()
+        refresh_cards(Content.objects.filter(pk__in=ids))
+    return ids
+
+
+def generate_content(articles, authors=20, seed=0, body_size=8000, batch_size=BATCH_SIZE, workers=None, stdout=None):
+    """
+    Generates `articles` articles by `authors` new authors, with bodies of a median `body_size`
+    characters, published in random order over `articles` * MINUTES_PER_ARTICLE minutes. The same
+    arguments generate the same rows. Slugs end with the seed and the article number, so a seed can
+    only be generated once per database. Returns the ids of the articles.
+    """
+    Author, Category, Content, Tag, Type = _get_models()
+    rng = random.Random(seed)
+
+    author_objects = [
+        Author(
+            first_name=rng.choice(WORDS).title(), last_name=rng.choice(WORDS).title(), title="Editor",
+            description=f"Writes about {rng.choice(WORDS)} and {rng.choice(WORDS)}.",
+        )
+        for _ in range(authors)
+    ]
+    for author in author_objects:  # As Author.save() does, which bulk_create() skips
+        author.html_description = author.get_html_description()
+        author.html_description_hash = HTMLConverter.get_render_hash(author.description)
+    author_objects = Author.objects.bulk_create(author_objects)
+    types = _create_terms(Type, list(TYPES))
+    categories = _create_terms(Category, CATEGORIES)
+    tags = _create_terms(Tag, [*TAGS, *CURATED_TAGS])
+    invalidate_taxonomy()  # bulk_create() skips the signals
+
+    ids = []
+    pending = None  # The batch being rendered by the pool
+    # The pool forks this process, and a forked child mustn't share the parent's database connections.
+    # One in a transaction can't be closed, but the workers never query, so it is left to the caller.
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()
+    with ProcessPoolExecutor(workers) as executor:
+        for start in range(0, articles, batch_size):
+            batch = []  # (Content fields, type name, category names, tag names)
+            sizes = []
+            for i in range(start, min(start + batch_size, articles)):
+                type_name = rng.choices(list(TYPES), weights=list(TYPES.values()))[0]
+                title = _sentence(rng, (4, 9))
+                sizes.append(int(rng.lognormvariate(math.log(body_size), 0.5)))
+                image = f"images/{rng.choice(WORDS)}-{seed}-{i}"
+                batch.append(({
+                    "title": title, "slug": f"{'-'.join(title.lower().split()[:4])}-{seed}-{i}",
+                    "author": rng.choice(author_objects), "meta_title": title, "meta_description": f"{title}, in depth.",
+                    "description": f"{title}: everything about {rng.choice(WORDS)} and {rng.choice(WORDS)}.",
+                    "read_time": max(1, sizes[-1] // 1500), "publish": rng.random() < PUBLISHED_SHARE,
+                    "image_featured": f"https://example.com/media/{image}.jpg", "image_featured_srcset": _srcset(image),
+                    "image_featured_sources": {
+                        "image/webp": _srcset(image, "webp"), "image/avif": _srcset(image, "avif"),
+                    },
+                    "image_caption": _sentence(rng, (3, 8)), "image_by": "Synthetic",
+                    "published_at": FIRST_PUBLISHED_AT + timedelta(minutes=rng.uniform(0, articles * MINUTES_PER_ARTICLE)),
+                }, type_name, *_pick_terms(rng, type_name)))
+            indexes = range(start, start + len(batch))
+            rendered = executor.map(render_article_body, [seed] * len(batch), indexes, sizes, chunksize=32)
+            if pending:
+                ids += _insert_batch(*pending, types, categories, tags)
+                if stdout:
+                    stdout.write(f"  {len(ids)} articles")
+            pending = (batch, rendered)
+        if pending:
+            ids += _insert_batch(*pending, types, categories, tags)
+
+    if ids:
+        index_contents(ids)
+        rebuild_related_content()
+        invalidate_listings()
+    return ids
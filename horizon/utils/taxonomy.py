@@ -0,0 +1,126 @@
+"""
+Process-local registry of the types, tags and categories, for name and id lookups without a query.
+
+get_taxonomy() loads every Type, Tag and Category row in one query and keeps them for the life of
+the process. The rows rarely change, so instead of an expiry the registry has a version, stored in
+settings.TAXONOMY_VERSION_FILE where every worker process can read it. Signals call
+invalidate_taxonomy() when a row is saved or deleted: the local registry is dropped at once and a
+new version is written when the transaction commits, so the other workers reload on their next
+lookup. Checking the version reads a few bytes from disk, no query.
+
+Changes that don't send signals (bulk_create(), update(), raw SQL) must call invalidate_taxonomy().
+"""
+import os
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+
+
+TYPE = "type"
+TAG = "tag"
+CATEGORY = "category"
+
+_loaded = None  # (version, Taxonomy)
+
+
+def _get_models():
+    from horizon.models import Category, Tag, Type
+    return {TYPE: Type, TAG: Tag, CATEGORY: Category}
+
+
+class Taxonomy:
+    """
+    A snapshot of the types, tags and categories. The objects are shared by every request of
+    the process and must not be modified.
+    """
+
+    def __init__(self, rows):
+        models = _get_models()
+        self._by_name = {kind: {} for kind in models}
+        self._by_id = {kind: {} for kind in models}
+        for pk, name, kind in rows:
+            obj = models[kind](pk=pk, name=name)
+            self._by_name[kind][name] = obj
+            self._by_id[kind][pk] = obj
+
+    def get(self, kind, name):
+        """
+        Returns the Type, Tag or Category named `name`, or None.
+        """
+        return self._by_name[kind].get(name)
+
+    def get_by_id(self, kind, pk):
+        return self._by_id[kind].get(pk)
+
+    def get_ids(self, kind, names):
+        """
+        Returns the ids of the existing `names`. Filtering on an empty list matches nothing
+        without a query.
+        """
+        return [self._by_name[kind][name].pk for name in names if name in self._by_name[kind]]
+
+
+def _read_version():
+    try:
+        with open(settings.TAXONOMY_VERSION_FILE) as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+def _write_version():
+    path = settings.TAXONOMY_VERSION_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(uuid.uuid4().hex)  # Unique, so concurrent bumps can't write the same version
+    os.replace(tmp_path, path)
+
+
+def get_taxonomy_version():
+    """
+    Returns the version of the types, tags and categories, which changes with any of them.
+    """
+    return _read_version()
+
+
+def load_taxonomy():
+    """
+    Reads every type, tag and category. One query.
+    """
+    querysets = [
+        model.objects.annotate(kind=Value(kind)).values_list("pk", "name", "kind")
+        for kind, model in _get_models().items()
+    ]
+    return Taxonomy(querysets[0].union(*querysets[1:], all=True))
+
+
+def get_taxonomy():
+    """
+    Returns the registry, loading it when the process has none or another process changed a row.
+    """
+    global _loaded
+    version = _read_version()  # Read before loading, so a change made during the load is seen next time
+    loaded = _loaded
+    if loaded is not None and loaded[0] == version:
+        return loaded[1]
+    taxonomy = load_taxonomy()
+    _loaded = (version, taxonomy)
+    return taxonomy
+
+
+def invalidate_taxonomy():
+    """
+    Drops the registry of this process now, and of every process once the transaction commits.
+    """
+    global _loaded
+
+    def invalidate():
+        global _loaded
+        _write_version()
+        _loaded = None
+
+    _loaded = None
+    transaction.on_commit(invalidate)
@@ -1,9 +1,19 @@
 import json
+import hashlib
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
 import re
 
 
+# Uses every tag once. Its rendered HTML identifies the converter output, so changing
+# any class string or tag changes the render hash of every document.
+FINGERPRINT_DOCUMENT = '''{h2 h h2}{h3 h h3}{p t {b b b} {a a href="h" target="t" a} p}{hr hr}
+{img src="s" alt="a" img}{figure_img src="s" alt="a" figcaption="c" figure_img}
+{img_src_set} src="s" alt="a" srcset="s 1w" {img_src_set}
+{figure_img_src_set} src="s" alt="a" figcaption="c" srcset="s 1w" {figure_img_src_set}
+{ul {li l li} ul}{li l li}{ads_by_google ads_by_google}'''
+
+
 class HTMLConverter:
     """
     Converts structured content into formatted HTML.
@@ -26,42 +36,179 @@ class HTMLConverter:
             "li": re.compile(r'\{li (.*?) li\}', re.DOTALL)
         }
 
+        # Every opening/closing marker of the tags above, in one alternation for the single pass.
+        self.token_pattern = re.compile(
+            r'\{(?:(?P<void>hr|ads_by_google) (?P=void)\}'
+            r'|(?P<toggle>img_src_set|figure_img_src_set)\}'
+            r'|(?P<ul_open>ul)'
+            r'|(?P<open>figure_img|img|h2|h3|li|p|a|b)(?= ))'
+            r'| (?P<close>figure_img|img|h2|h3|li|p|a|b)\}'
+            r'|(?P<ul_close>ul\})'
+        )
+
+        # Tags whose content is parsed for attributes instead of being wrapped.
+        self.attribute_tags = {"a", "img", "figure_img", "img_src_set", "figure_img_src_set"}
+
+    _fingerprint = None
+
+    @classmethod
+    def get_fingerprint(cls):
+        """
+        Returns a hash of the converter output for FINGERPRINT_DOCUMENT, computed once per process.
+        """
+        if cls._fingerprint is None:
+            html = cls().get_html(FINGERPRINT_DOCUMENT)
+            cls._fingerprint = hashlib.sha256(html.encode()).hexdigest()
+        return cls._fingerprint
+
+    @classmethod
+    def get_render_hash(cls, document):
+        """
+        Returns a hash of the document and the converter fingerprint.
+        The stored HTML of a document is current as long as this hash is unchanged.
+        """
+        return hashlib.sha256(f"{cls.get_fingerprint()}:{document}".encode()).hexdigest()
+
     def get_html(self, document):
+        """
+        Converts the document in a single linear walk over its markup tokens.
+        Falls back to the multi-pass converter when the markup is unbalanced, crossing or
+        nests a tag inside itself, since the output then depends on the order of the passes.
+        """
+        html = self.compile_html(document)
+        if html is None:
+            return self.get_html_multipass(document)
+        return html
+
+    def get_html_multipass(self, document):
+        """
+        Converts the document with one regex scan and replace loop per tag.
+        """
         for tag, pattern in self.tag_patterns.items():
             blocks = pattern.findall(document)
             document = self.replace_blocks(tag, blocks, document)
 
         return document
-    
+
+    def compile_html(self, document):
+        """
+        Tokenizes the document and emits HTML in one pass.
+        Every frame on the stack is [tag, content_start, parts, li_items].
+        Returns None if the markup can't be compiled to the exact multi-pass output.
+        """
+        root = ["", 0, [], None]
+        stack = [root]
+        position = 0
+
+        for match in self.token_pattern.finditer(document):
+            frame = stack[-1]
+            frame[2].append(document[position:match.start()])
+            position = match.end()
+            kind = match.lastgroup
+            tag = "ul" if kind in ("ul_open", "ul_close") else match.group(kind)
+
+            if kind in ("close", "ul_close") or (kind == "toggle" and frame[0] == tag):
+                content_end = match.start()
+                if frame[0] != tag or content_end < frame[1]:
+                    return None
+                stack.pop()
+
+                if tag in self.attribute_tags:
+                    html = self.render_block(tag, document[frame[1]:content_end])
+                elif tag == "ul":
+                    html = self.render_ul(frame[3])
+                else:
+                    html = self.render_block(tag, "".join(frame[2]))
+                stack[-1][2].append(html)
+
+                if tag == "li":
+                    for parent in stack:
+                        if parent[0] == "ul":
+                            parent[3].append(html)
+                continue
+
+            # Attribute tags are parsed from their raw text, so they can't hold other markup.
+            if frame[0] in self.attribute_tags:
+                return None
+
+            if kind == "void":
+                frame[2].append(self.render_block(tag, ""))
+                continue
+
+            if any(parent[0] == tag for parent in stack):
+                return None
+
+            if kind == "open":
+                position += 1  # Skip the space that follows the opening tag
+            stack.append([tag, position, [], [] if tag == "ul" else None])
+
+        if len(stack) > 1:
+            return None
+
+        root[2].append(document[position:])
+        return "".join(root[2])
+
     def replace_blocks(self, tag, blocks, document):
         for block_content in blocks:
-            if tag == "p":
-                document = document.replace(f'{{p {block_content} p}}', f'<p class="text-[15px] sm:text-base md:text-lg text-gray-700 leading-relaxed pb-4">{block_content}</p>')
-            if tag == "hr":
-                document = document.replace(f'{{hr hr}}', f'<hr class="my-6 border-t-1 border-gray-300">')
-            elif tag == "a":
-                # {a click this link to buy on etsy blank href="https://etsy.com" target="_blank" a}
-                # {a click this link to buy on etsy self href="https://etsy.com" target="_self" a}
-                attributes, text = self.parse_a_attributes(block_content)
-                document = document.replace(f'{{a {block_content} a}}', f'<a class="hover:text-accent text-[15px] sm:text-base md:text-lg underline" {attributes}>{text}</a>')
-            elif tag == "b":
-                document = document.replace(f'{{b {block_content} b}}', f'<strong>{block_content}</strong>')
-            elif tag == "h2":
-                document = document.replace(f'{{h2 {block_content} h2}}', f'<h2 class="text-xl sm:text-2xl md:text-3xl font-bold text-gray-800 leading-tight mt-4 mb-2">{block_content}</h2>')
-            elif tag == "h3":
-                document = document.replace(f'{{h3 {block_content} h3}}', f'<h3 class="text-base sm:text-lg md:text-xl font-bold text-gray-800 leading-tight mt-4 mb-2">{block_content}</h3>')
-            elif tag == "img":
-                # {img src="abc" alt="123" img}
-                attributes = self.parse_img_attributes(block_content)
-                document = document.replace(f'{{img {block_content} img}}', f'<img loading="lazy" {attributes}>')
-            elif tag == "figure_img":
-                # {figure_img src="abc" alt="123" figcaption="xyz" figure_img}
-                attributes = self.parse_img_attributes(block_content)
-                figure_caption = self.parse_figure_img_caption(block_content)
-
-                document = document.replace(
-                    f'{{figure_img {block_content} figure_img}}', 
-                    f'''<figure class="w-full mx-auto text-center mb-8">
+            if tag == "ul":
+                """
+                {ul
+                    {li some text li}
+                    {li some text li}
+                    {li some text li}
+                ul}
+                """
+                # Process nested <li> elements inside {ul}
+                li_matches = self.tag_patterns["li"].findall(block_content)
+                html = self.render_ul([self.render_block("li", li) for li in li_matches])
+            else:
+                html = self.render_block(tag, block_content)
+
+            document = document.replace(self.get_block_markup(tag, block_content), html)
+
+        return document
+
+    def get_block_markup(self, tag, block_content):
+        """
+        Returns the source markup of a block, as matched by its tag pattern.
+        """
+        if tag in ("hr", "ads_by_google"):
+            return f'{{{tag} {tag}}}'
+        if tag in ("img_src_set", "figure_img_src_set"):
+            return f'{{{tag}}}{block_content}{{{tag}}}'
+        if tag == "ul":
+            return f'{{ul{block_content}ul}}'
+        return f'{{{tag} {block_content} {tag}}}'
+
+    def render_block(self, tag, block_content):
+        """
+        Returns the HTML for a single block, given the text between its opening and closing tags.
+        """
+        if tag == "p":
+            return f'<p class="text-[15px] sm:text-base md:text-lg text-gray-700 leading-relaxed pb-4">{block_content}</p>'
+        elif tag == "hr":
+            return f'<hr class="my-6 border-t-1 border-gray-300">'
+        elif tag == "a":
+            # {a click this link to buy on etsy blank href="https://etsy.com" target="_blank" a}
+            # {a click this link to buy on etsy self href="https://etsy.com" target="_self" a}
+            attributes, text = self.parse_a_attributes(block_content)
+            return f'<a class="hover:text-accent text-[15px] sm:text-base md:text-lg underline" {attributes}>{text}</a>'
+        elif tag == "b":
+            return f'<strong>{block_content}</strong>'
+        elif tag == "h2":
+            return f'<h2 class="text-xl sm:text-2xl md:text-3xl font-bold text-gray-800 leading-tight mt-4 mb-2">{block_content}</h2>'
+        elif tag == "h3":
+            return f'<h3 class="text-base sm:text-lg md:text-xl font-bold text-gray-800 leading-tight mt-4 mb-2">{block_content}</h3>'
+        elif tag == "img":
+            # {img src="abc" alt="123" img}
+            attributes = self.parse_img_attributes(block_content)
+            return f'<img loading="lazy" {attributes}>'
+        elif tag == "figure_img":
+            # {figure_img src="abc" alt="123" figcaption="xyz" figure_img}
+            attributes = self.parse_img_attributes(block_content)
+            figure_caption = self.parse_figure_img_caption(block_content)
+
+            return f'''<figure class="w-full mx-auto text-center mb-8">
                         <img loading="lazy" {attributes} 
                             class="w-full h-auto object-cover shadow"
                         >
@@ -69,12 +216,9 @@ class HTMLConverter:
                             {figure_caption}
                         </figcaption>
                     </figure>'''
-                )
-            elif tag == "ads_by_google":
-                # {ads_by_google ads_by_google}
-                document = document.replace(
-                    f'{{ads_by_google ads_by_google}}', 
-                    '''<div>
+        elif tag == "ads_by_google":
+            # {ads_by_google ads_by_google}
+            return '''<div>
                         <ins class="adsbygoogle"
                             style="display:block; text-align:center;"
                             data-ad-layout="in-article"
@@ -86,35 +230,32 @@ class HTMLConverter:
                             </script>
                         </div>
                     '''
-                )
-            elif tag == "img_src_set":
-                """
-                {img_src_set}
-                    src="some_image_url"
-                    alt="some alt tag"
-                    srcset="some_image_url_50 50w"
-                    srcset="some_image_url_100 100w"
-                    srcset="some_image_url_800 800w"
-                {img_src_set}
-                """
-                attributes = self.parse_img_src_set_attributes(block_content)
-                document = document.replace(f'{{img_src_set}}{block_content}{{img_src_set}}', f'<img loading="lazy" {attributes}>')
-            elif tag == "figure_img_src_set":
-                """
-                {figure_img_src_set}
-                    src="some_image_url"
-                    figcaption="some caption"
-                    alt="some alt tag"
-                    srcset="some_image_url_50 50w"
-                    srcset="some_image_url_100 100w"
-                    srcset="some_image_url_800 800w"
-                {figure_img_src_set}
-                """
-                attributes = self.parse_img_src_set_attributes(block_content)
-                figure_caption = self.parse_figure_img_caption(block_content)
-                document = document.replace(
-                    f'{{figure_img_src_set}}{block_content}{{figure_img_src_set}}',
-                    f'''<figure class="w-full mx-auto pb-4 text-center">
+        elif tag == "img_src_set":
+            """
+            {img_src_set}
+                src="some_image_url"
+                alt="some alt tag"
+                srcset="some_image_url_50 50w"
+                srcset="some_image_url_100 100w"
+                srcset="some_image_url_800 800w"
+            {img_src_set}
+            """
+            attributes = self.parse_img_src_set_attributes(block_content)
+            return f'<img loading="lazy" {attributes}>'
+        elif tag == "figure_img_src_set":
+            """
+            {figure_img_src_set}
+                src="some_image_url"
+                figcaption="some caption"
+                alt="some alt tag"
+                srcset="some_image_url_50 50w"
+                srcset="some_image_url_100 100w"
+                srcset="some_image_url_800 800w"
+            {figure_img_src_set}
+            """
+            attributes = self.parse_img_src_set_attributes(block_content)
+            figure_caption = self.parse_figure_img_caption(block_content)
+            return f'''<figure class="w-full mx-auto pb-4 text-center">
                         <img loading="lazy" {attributes} 
                             class="w-full h-auto object-cover mb-2 shadow"
                         >
@@ -122,26 +263,16 @@ class HTMLConverter:
                             {figure_caption}
                         </figcaption>
                     </figure>'''
-                )
-            elif tag == "ul":
-                """
-                {ul
-                    {li some text li}
-                    {li some text li}
-                    {li some text li}
-                ul}
-                """
-                # Process nested <li> elements inside {ul}
-                li_matches = self.tag_patterns["li"].findall(block_content)
-                li_html = "".join([f'<li class="ml-6 list-disc">{li}</li>' for li in li_matches])
-                document = document.replace(f'{{ul{block_content}ul}}', f'<ul class="list-disc list-inside text-gray-800 space-y-2 mb-8">{li_html}</ul>')
-            elif tag == "li":
-                # Replace only standalone {li} tags (not needed since ul handles it)
-                document = document.replace(f'{{li {block_content} li}}', f'<li class="ml-6 list-disc">{block_content}</li>')
-            else:
-                print(f"Unknown block type: {tag}")
-        
-        return document
+        elif tag == "li":
+            return f'<li class="ml-6 list-disc">{block_content}</li>'
+        else:
+            raise ValueError(f"Unknown block type: {tag}")
+
+    def render_ul(self, li_items):
+        """
+        Returns the HTML for a {ul ... ul} block from its already rendered <li> items.
+        """
+        return f'<ul class="list-disc list-inside text-gray-800 space-y-2 mb-8">{"".join(li_items)}</ul>'
     
     def parse_img_attributes(self, content):
         # Uses regex to extract src and alt attributes
@@ -192,4 +323,13 @@ class HTMLConverter:
         if srcset_string:
             attributes_string += f' srcset="{srcset_string}"'
         
-        return attributes_string
\ No newline at end of file
+        return attributes_string
+
+
+def convert_documents(documents):
+    """
+    Converts a batch of documents. Used as the process pool worker for bulk rendering,
+    so it must not touch the database.
+    """
+    converter = HTMLConverter()
+    return [converter.get_html(document) for document in documents]
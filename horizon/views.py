@@ -1,64 +1,79 @@
 from django.shortcuts import render, get_object_or_404
-from .models import Content, Category, Type, Tag
-from django.db.models import Q
-from django.core.paginator import Paginator
-import json
-from django.utils.html import escape
-from django.utils.timezone import localtime
-
-
-def _getContentByTag(tag_name, limit):
-    tag = Tag.objects.filter(name=tag_name).first()
-    
-    if tag:
-        # Get all content tagged with the given tag
-        content = Content.objects.filter(tags=tag, publish=True).order_by('-published_at')[:limit]
-    else:
-        content = Content.objects.none()  # Return an empty queryset if no tag found
-    
-    return content
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from .models import Content, ContentCard
+from django.db.models import Exists, Max, OuterRef, Q
+import mimetypes
+import os
+from .utils.conditional import conditional_page, get_listings_version
+from .utils.image_resize import get_resized_image, is_resize_allowed
+from .utils.pagination import CursorPaginator
+from .utils.page_cache import page_cache, record_content_dependencies, record_page_dependencies
+from .utils.query_budget import query_budget
+from .utils import sitemaps
+from .utils.search import parse_cursor, search_contents
+from .utils.sections import Section, compose_sections
+from .utils.structured_data import WEBSITE_STRUCTURED_DATA
+from .utils.taxonomy import CATEGORY, TAG, TYPE, get_taxonomy
+
+
+def _get_cards():
+    # Listings read the cards of the contents (see horizon.utils.cards), not the Content rows with their bodies.
+    # A card's primary key is its content's id.
+    return ContentCard.objects.all()
 
 
 def _get_filtered_content(include_categories, filter_categories=None, exclude_categories=None, include_tags=None, exclude_tags=None, limit=None):
     """
-    Filters Content based on included/excluded categories and tags.
+    Filters content cards based on included/excluded categories and tags.
+    Categories and tags are given by name, resolved to ids by the taxonomy registry and matched in EXISTS subqueries.
 
     Args:
-        include_categories (list of Category): Required categories.
-        filter_categories (list of Category): Further filter by these categories.
-        exclude_categories (list of Category, optional): Categories to exclude.
-        include_tags (list of Tag, optional): Tags to include.
-        exclude_tags (list of Tag, optional): Tags to exclude.
+        include_categories (list of str): Required category names.
+        filter_categories (list of str): Further filter by these category names.
+        exclude_categories (list of str, optional): Category names to exclude.
+        include_tags (list of str, optional): Tag names to include.
+        exclude_tags (list of str, optional): Tag names to exclude.
         limit (int, optional): Maximum number of results. If None, return all.
 
     Returns:
-        QuerySet of Content objects.
+        QuerySet of ContentCard objects.
     """
 
     if not include_categories:
         raise ValueError("include_categories is required and cannot be empty.")
 
+    # Each condition is an EXISTS probe of the through table, so cards are walked newest first on
+    # card_published_idx and the walk stops at the limit, instead of joined, deduplicated and sorted.
+    taxonomy = get_taxonomy()
+
+    def has_categories(names):
+        return Exists(Content.categories.through.objects.filter(content_id=OuterRef('pk'), category_id__in=taxonomy.get_ids(CATEGORY, names)))
+
+    def has_tags(names):
+        return Exists(Content.tags.through.objects.filter(content_id=OuterRef('pk'), tag_id__in=taxonomy.get_ids(TAG, names)))
+
     # Start with the required categories filter
-    query = Q(categories__in=include_categories)
+    query = Q(has_categories(include_categories))
 
     # Exclude specific categories (if provided)
     if exclude_categories:
-        query &= ~Q(categories__in=exclude_categories)
+        query &= ~Q(has_categories(exclude_categories))
 
     # Further filter content that has the specific category (e.g., "hardware" or "devices").
     if filter_categories:
-        query &= Q(categories__in=filter_categories)
+        query &= Q(has_categories(filter_categories))
 
     # Include specific tags (if provided)
     if include_tags:
-        query &= Q(tags__in=include_tags)
+        query &= Q(has_tags(include_tags))
 
     # Exclude specific tags (if provided)
     if exclude_tags:
-        query &= ~Q(tags__in=exclude_tags)
+        query &= ~Q(has_tags(exclude_tags))
 
-    # Apply filters and ensure unique results
-    content_qs = Content.objects.filter(query, publish=True).distinct().order_by('-published_at')
+    # Apply filters. EXISTS can't repeat rows, so no DISTINCT is needed
+    content_qs = _get_cards().filter(query, publish=True).order_by('-published_at')
 
     # Apply limit if specified
     if limit:
@@ -68,69 +83,102 @@ def _get_filtered_content(include_categories, filter_categories=None, exclude_ca
 
 
 def _getContentByType(type_name, tag_name, limit):
-    # Get "tech" category
-    type_obj = Type.objects.filter(name=type_name).first()
-    tag = Tag.objects.filter(name=tag_name).first() if tag_name else None
-
-    if tag:
-        all_content = Content.objects.filter(type=type_obj, tags=tag, publish=True).order_by('-published_at')[:limit]
-    else:
-        all_content = Content.objects.filter(type=type_obj, publish=True).order_by('-published_at')[:limit]
-    return all_content
-
-def _getRecentContent(limit):
-    all_content = Content.objects.filter(publish=True).order_by('-published_at')[:limit]
-    return all_content
-
-
+    taxonomy = get_taxonomy()
+    all_content = _get_cards().filter(type_id__in=taxonomy.get_ids(TYPE, [type_name]), publish=True)
+    tag_ids = taxonomy.get_ids(TAG, [tag_name]) if tag_name else []
+    # A tag that doesn't exist yet is ignored, so the section lists the latest contents of the type instead of nothing
+    if tag_ids:
+        all_content = all_content.filter(
+            Exists(Content.tags.through.objects.filter(content_id=OuterRef('pk'), tag_id__in=tag_ids))
+        )
+    return all_content.order_by('-published_at')[:limit]
+
+
+def _get_listing_validators(request):
+    # Bumped by the signals on any change a listing can show, so no query is needed
+    return get_listings_version()
+
+
+def _get_detail_validators(request, type, slug):
+    # The content, its author, when its related posts were last rewritten and their latest edit, as a single grouped row
+    rows = Content.objects.filter(type_id__in=get_taxonomy().get_ids(TYPE, [type]), slug=slug).values(
+        'updated_at', 'author__updated_at', 'related_updated_at',
+    ).annotate(related_updated=Max('related_content__related__updated_at'))
+    state = next(iter(rows), None)  # `slug` is unique
+    if state is None:
+        return None
+    return state, max(filter(None, state.values()))
+
+
+@conditional_page(_get_listing_validators)
+@page_cache
+@query_budget(4)
 def home(request):
-    home_main_content = _getContentByTag("Home Main", 1)
-    home_featured_contents = _getContentByTag("Home Featured", 20)
-    recent_contents= _getRecentContent(20)
-
-    structured_data = _generate_structured_data()  # No `content`, so it generates homepage JSON-LD
+    # The sections are composed together, see horizon.utils.sections
+    sections = compose_sections(_get_cards(), {
+        'main': Section(include_tags=["Home Main"], limit=1),
+        'featured': Section(include_tags=["Home Featured"], limit=20),
+        'recent': Section(limit=20),
+    })
+    home_main_content = sections['main']
+    home_featured_contents = sections['featured']
+    recent_contents = sections['recent']
+
+    record_page_dependencies(request, "tag:Home Main", "tag:Home Featured", "content-list")
+    for contents in (home_main_content, home_featured_contents, recent_contents):
+        record_content_dependencies(request, contents)
 
     context = {
         'home_main_content': home_main_content,
         'home_featured_contents': home_featured_contents,
         'recent_contents': recent_contents,
-        'structured_data': structured_data,
+        'structured_data': WEBSITE_STRUCTURED_DATA,
     }
     return render(request, 'horizon/home.html', context)
 
 
+@conditional_page(_get_detail_validators)
+@page_cache
+@query_budget(3)
 def content_detail(request, type, slug):
-    # Get the type object
-    content_type = get_object_or_404(Type, name=type)
-    content = get_object_or_404(Content, type=content_type, slug=slug)
+    # Get the content with its type and author. `body` is only needed to build `html_body`.
+    content = get_object_or_404(
+        Content.objects.select_related('type', 'author').defer('body'),
+        type_id__in=get_taxonomy().get_ids(TYPE, [type]),  # An unknown type is a 404 without a query
+        slug=slug
+    )
 
-    # Fetch related posts in the same category (excluding the current post)
-    related_content = Content.objects.filter(
-        categories__in=content.categories.all(),  # Match any of the same categories
+    # Fetch the precomputed related posts (see horizon.utils.related_content)
+    related_posts = _get_cards().filter(
+        content__related_to__content=content,
         publish=True
-    ).exclude(slug=slug)  # Exclude current post
-    related_posts = related_content.order_by('-published_at')[:6]  # Get latest 6 related posts
+    ).order_by('-content__related_to__score')
 
-    structured_data = _generate_structured_data(content)  # Pass `content`, so it generates NewsArticle/Review JSON-LD
+    record_page_dependencies(request, f"related:{content.pk}")
+    record_content_dependencies(request, [content, *related_posts])
 
     context = {
         'content': content,
         'author': content.author,
         'related_posts': related_posts,
-        'structured_data': structured_data,
+        'structured_data': content.structured_data,  # Built on save, see horizon.utils.structured_data
     }
 
     return render(request, 'horizon/detail.html', context)
 
 
+@conditional_page(_get_listing_validators)
+@page_cache
+@query_budget(4)
 def news_type_page(request):
     top_news_articles = _getContentByType("news", "Top News", 3)
-    news_articles = _getContentByType("news", "", 100)
+    news_articles = _get_cards().filter(type_id__in=get_taxonomy().get_ids(TYPE, ["news"]), publish=True)
 
-    # Paginate news articles (5 per page)
-    paginator = Paginator(news_articles, 4)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Paginate news articles (4 per page), see horizon.utils.pagination
+    page_obj = CursorPaginator(news_articles, 4).get_page(request.GET.get("after"))
+
+    record_page_dependencies(request, "type:news", "tag:Top News")
+    record_content_dependencies(request, [*top_news_articles, *page_obj])
 
     context = {
         'top_news_articles': top_news_articles, # Show top 3 as featured news
@@ -140,57 +188,50 @@ def news_type_page(request):
     return render(request, 'horizon/news.html', context)
 
 
+@page_cache
+@query_budget(4)
 def products_category_page(request):
-    products_category = Category.objects.filter(name="products").first()
-    hardware_category = Category.objects.filter(name="hardware").first()
-    devices_category = Category.objects.filter(name="devices").first()
-    wearables_category = Category.objects.filter(name="wearables").first()
-    assistants_category = Category.objects.filter(name="assistants").first()
-
-    category_main_tag = Tag.objects.filter(name="Category Main").first()
-    category_featured_tag = Tag.objects.filter(name="Category Featured").first()
-
-    featured_contents = _get_filtered_content(
-        include_categories=[products_category],
-        include_tags=[category_main_tag],
-        limit=3
-    )
-
-    hardware_content = _get_filtered_content(
-        include_categories=[products_category, hardware_category],
-        include_tags=[category_featured_tag],
-        filter_categories=[hardware_category],
-        limit=3
-    )
-
-    devices_content = _get_filtered_content(
-        include_categories=[products_category, devices_category],
-        include_tags=[category_featured_tag],
-        filter_categories=[devices_category],
-        limit=3
-    )
-
-    wearables_content = _get_filtered_content(
-        include_categories=[products_category, wearables_category],
-        include_tags=[category_featured_tag],
-        filter_categories=[wearables_category],
-        limit=3
-    )
-
-    assistants_content = _get_filtered_content(
-        include_categories=[products_category, assistants_category],
-        include_tags=[category_featured_tag],
-        filter_categories=[assistants_category],
-        limit=3
+    products_category = "products"
+    hardware_category = "hardware"
+    devices_category = "devices"
+    wearables_category = "wearables"
+    assistants_category = "assistants"
+
+    category_main_tag = "Category Main"
+    category_featured_tag = "Category Featured"
+
+    # The five sections are composed together, see horizon.utils.sections
+    sections = compose_sections(_get_cards(), {
+        'featured': Section(include_categories=[products_category], include_tags=[category_main_tag], limit=3),
+        **{
+            category: Section(
+                include_categories=[products_category, category],
+                filter_categories=[category],
+                include_tags=[category_featured_tag],
+                limit=3,
+            )
+            for category in (hardware_category, devices_category, wearables_category, assistants_category)
+        },
+    })
+    featured_contents = sections['featured']
+    hardware_content = sections[hardware_category]
+    devices_content = sections[devices_category]
+    wearables_content = sections[wearables_category]
+    assistants_content = sections[assistants_category]
+
+    latest_contents = _get_filtered_content(include_categories=[products_category])
+
+    # Paginate latest contents (2 per page), see horizon.utils.pagination
+    latest_contents_page = CursorPaginator(latest_contents, 2).get_page(request.GET.get("after"))
+
+    record_page_dependencies(
+        request,
+        *(f"category:{name}" for name in (products_category, hardware_category, devices_category, wearables_category, assistants_category)),
+        f"tag:{category_main_tag}",
+        f"tag:{category_featured_tag}",
     )
-
-
-    latest_contents = _get_filtered_content(include_categories=[products_category], limit=100)
-    
-    # Paginate news articles (5 per page)
-    latest_contents_paginator = Paginator(latest_contents, 2)
-    page_number = request.GET.get("page")
-    latest_contents_page = latest_contents_paginator.get_page(page_number)
+    for contents in (featured_contents, hardware_content, devices_content, wearables_content, assistants_content, latest_contents_page):
+        record_content_dependencies(request, contents)
 
     context = {
         'featured_contents': featured_contents, # Show top 3 as featured
@@ -206,117 +247,67 @@ def products_category_page(request):
     return render(request, 'horizon/products.html', context)
 
 
-def _generate_structured_data(content=None):
+@query_budget(2)
+def search(request):
     """
-    Dynamically generates JSON-LD structured data for both the homepage and content pages.
-    
-    - If `content` is None → Generates structured data for homepage.
-    - If `content` exists → Generates structured data for NewsArticle or ReviewNewsArticle.
+    Full-text search over published contents (see horizon.utils.search).
+    Pages are linked with a cursor, `?q=<query>&after=<cursor>`, instead of page numbers.
     """
-    if content is None:
-        # Generate structured data for the homepage
-        structured_data = {
-            "@context": "https://schema.org",
-            "@type": "WebSite",
-            "name": "The Game Horizon",
-            "url": "https://thegamehorizon.com",
-            "description": "Your ultimate source for gaming news, reviews, guides, and more.",
-            "publisher": {
-                "@type": "Organization",
-                "name": "The Game Horizon",
-                "url": "https://thegamehorizon.com",
-                "logo": {
-                    "@type": "ImageObject",
-                    "url": "https://thegamehorizon.com/static/publisher_256x256.png",
-                    "width": 256,
-                    "height": 256
-                }
-            }
-        }
-
-        # "potentialAction": {
-        #     "@type": "SearchAction",
-        #     "target": "https://thegamehorizon.com/?s={search_term_string}",
-        #     "query-input": "required name=search_term_string"
-        # }
-    
+    query = request.GET.get("q", "").strip()
+    results, next_cursor = search_contents(query, parse_cursor(request.GET.get("after")))
+
+    contents = _get_cards().in_bulk([pk for pk, _ in results])
+    context = {
+        'query': query,
+        'results': [(contents[pk], snippet) for pk, snippet in results if pk in contents],
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'horizon/search.html', context)
+
+
+@query_budget(1)
+def resized_image(request, width, height, name):
+    """
+    Serves a resized version of an uploaded image, rendering it on the first request
+    (see horizon.utils.image_resize). Cache hits don't query the database.
+    """
+    if not is_resize_allowed(width, height, name, request.GET.get("s")):
+        return HttpResponseForbidden()
+
+    path = get_resized_image(name, width, height)
+    if path is None:
+        raise Http404
+
+    # The cache is keyed by size and name, and uploads never change in place
+    if settings.IMAGE_RESIZE_ACCEL_REDIRECT:
+        # nginx serves the file from an internal location aliased to IMAGE_RESIZE_CACHE_DIR
+        response = HttpResponse(content_type=mimetypes.guess_type(path)[0])
+        response["X-Accel-Redirect"] = settings.IMAGE_RESIZE_ACCEL_REDIRECT + os.path.relpath(path, settings.IMAGE_RESIZE_CACHE_DIR)
     else:
-        # Determine the content type: NewsArticle, ReviewNewsArticle, or General Article
-        content_type = content.type.name.lower()
-
-        # HORIZON content types
-        # news
-        # review
-        # articles
-        # comparison
-        # deal
-        # picks
-        # story
-
-        structured_data_type = "Article"
-        if content_type == "news":
-            structured_data_type = "NewsArticle"
-        elif content_type == "review":
-            structured_data_type = "Article"
-
-            # structured_data_type = "ReviewNewsArticle" 
-            # this need itemReviewed block with item name, brand etc. 
-            # Otherwise we get Top critical issues* Missing field "itemReviewed" in google search console
-        elif content_type == "articles":
-            structured_data_type = "Article"
-        elif content_type == "comparison":
-            structured_data_type = "Article"
-        elif content_type == "deal":
-            structured_data_type = "Article"
-        elif content_type == "picks":
-            structured_data_type = "Article"
-        else:
-            structured_data_type = "Article"
-        
-        structured_data = {
-            "@context": "https://schema.org",
-            "@type": structured_data_type,
-            "headline": escape(content.title),
-            "description": escape(content.meta_description),
-            "mainEntityOfPage": {
-                "@type": "WebPage",
-                "@id": f"https://thegamehorizon.com/{content.get_url_path()}"
-            },
-            "author": {
-                "@type": "Person",
-                "name": f"{content.author.first_name} {content.author.last_name}"
-            },
-            "publisher": {
-                "@type": "Organization",
-                "name": "The Game Horizon",
-                "logo": {
-                    "@type": "ImageObject",
-                    "url": "https://thegamehorizon.com/static/publisher_256x256.png",
-                    "width": 256,
-                    "height": 256
-                }
-            },
-            "datePublished": localtime(content.published_at).isoformat(),
-            "dateModified": localtime(content.updated_at).isoformat(),
-            "image": content.image_featured if content.image_featured else ""
-        }
-
-        # If the content is a review, add review schema
-        # if content_type == "review":
-        #     structured_data["review"] = {
-        #         "@type": "Review",
-        #         "reviewBody": escape(content.description),
-        #         "author": {
-        #             "@type": "Person",
-        #             "name": f"{content.author.first_name} {content.author.last_name}"
-        #         },
-        #         "datePublished": localtime(content.published_at).isoformat(),
-        #         "reviewRating": {
-        #             "@type": "Rating",
-        #             "ratingValue": str(content.rating if hasattr(content, "rating") else "4"),
-        #             "bestRating": "5",
-        #             "worstRating": "1"
-        #         }
-        #     }
-
-    return json.dumps(structured_data, indent=2)
+        response = FileResponse(open(path, "rb"))
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@query_budget(1)
+def sitemap_index(request):
+    return HttpResponse(sitemaps.get_sitemap_index(), content_type="application/xml")
+
+
+@query_budget(2)
+def sitemap_shard(request, shard):
+    """
+    Serves a shard from its cache file, or streams it while writing the cache file
+    (see horizon.utils.sitemaps).
+    """
+    path = sitemaps.get_shard_cache_path(shard)
+    if path is None:
+        raise Http404
+    if os.path.exists(path):
+        return FileResponse(open(path, "rb"), content_type="application/xml")
+    return StreamingHttpResponse(sitemaps.iter_and_cache(sitemaps.iter_shard(shard), path), content_type="application/xml")
+
+
+@query_budget(1)
+def news_sitemap(request):
+    return StreamingHttpResponse(sitemaps.iter_news_sitemap(), content_type="application/xml")
@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'horizon.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'horizon_core.urls'
@@ -125,3 +126,44 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Prefix of the absolute image URLs filled in from uploaded images
+SITE_URL = 'http://localhost:8000'
+
+# Full-page cache for the horizon views (see horizon/utils/page_cache.py). Its dependency versions are in
+# CACHES['default'], which must then be shared by every process: the system checks refuse LocMemCache
+PAGE_CACHE_ENABLED = False
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Run UploadedImage derivative jobs inside save() instead of the process_image_jobs worker
+IMAGE_DERIVATIVES_INLINE = False
+
+# On-demand resized images (see horizon/utils/image_resize.py)
+IMAGE_RESIZE_WIDTHS = [160, 320, 480, 640, 960, 1280, 1600]
+IMAGE_RESIZE_CACHE_DIR = BASE_DIR / 'media_cache'
+IMAGE_RESIZE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+IMAGE_RESIZE_ACCEL_REDIRECT = None  # Served by Django
+
+# Cached sitemap shards (see horizon/utils/sitemaps.py)
+SITEMAP_CACHE_DIR = BASE_DIR / 'sitemap_cache'
+
+# Version of the process-local taxonomy registry, shared by the workers (see horizon/utils/taxonomy.py)
+TAXONOMY_VERSION_FILE = BASE_DIR / 'taxonomy_cache' / 'version'
+
+# Version of the listings behind their ETag and Last-Modified, shared by the workers (see horizon/utils/conditional.py)
+LISTINGS_VERSION_FILE = BASE_DIR / 'listings_cache' / 'version'
+
+# Rendered article cards (see horizon/utils/fragment_cache.py), in their own cache so they don't evict the pages
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'horizon-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+FRAGMENT_CACHE_ENABLED = False
+FRAGMENT_CACHE_ALIAS = 'fragments'
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24 * 7